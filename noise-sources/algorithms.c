@@ -1,11 +1,12 @@
 #include "lib.h"
 #include <stdbool.h>
 #include <limits.h>
+#include <string.h>
 
 // https://www.tutorialspoint.com/data_structures_algorithms/dsa_travelling_salesman_approximation_algorithm.htm
-int find_min_key(int key[], bool mstSet[]) {
-	int min = INT_MAX, min_index;
-	for (int v = 0; v < gv_len; v++) {
+int find_min_key(int key[], bool mstSet[], int vertices) {
+	int min = INT_MAX, min_index = 0;
+	for (int v = 0; v < vertices; v++) {
 		if (mstSet[v] == false && key[v] < min) {
 			min = key[v];
 			min_index = v;
@@ -14,90 +15,85 @@ int find_min_key(int key[], bool mstSet[]) {
 	return min_index;
 }
 
-void prim_MST(int graph[gv_len][gv_len], int parent[]) {
-	int key[gv_len];
-	bool mstSet[gv_len];
-	for (int i = 0; i < gv_len; i++) {
+void prim_MST(const int *graph, int vertices, int parent[]) {
+	int key[vertices];
+	bool mstSet[vertices];
+	for (int i = 0; i < vertices; i++) {
 		key[i] = INT_MAX;
 		mstSet[i] = false;
 	}
 	key[0] = 0;
 	parent[0] = -1;
-	for (int count = 0; count < gv_len - 1; count++) {
-		int u = find_min_key(key, mstSet);
+	for (int count = 0; count < vertices - 1; count++) {
+		int u = find_min_key(key, mstSet, vertices);
 		mstSet[u] = true;
-		for (int v = 0; v < gv_len; v++) {
-			if (graph[u][v] && mstSet[v] == false && graph[u][v] < key[v]) {
+		for (int v = 0; v < vertices; v++) {
+			int weight = graph[u * vertices + v];
+			if (weight && mstSet[v] == false && weight < key[v]) {
 				parent[v] = u;
-				key[v] = graph[u][v];
+				key[v] = weight;
 			}
 		}
 	}
 }
 
-void tsp_approximation(int graph[gv_len][gv_len], uint64_t *cost) {
-	int parent[gv_len];
-	int root = 0;
-	prim_MST(graph, parent);
+void tsp_approximation(const int *graph, int vertices, uint64_t *cost) {
+	int parent[vertices];
+	prim_MST(graph, vertices, parent);
 
 	int curr_cost = 0;
-	for (int i = 1; i < gv_len; i++) {
-		curr_cost += graph[parent[i]][i];
+	for (int i = 1; i < vertices; i++) {
+		curr_cost += graph[parent[i] * vertices + i];
 	}
 
 	*cost = curr_cost;
 }
 
 // https://www.thecrazyprogrammer.com/2017/05/travelling-salesman-problem.html
-int tsp_dp(int mark, int position) {
-	int n = 4;
-	int distan[20][20] = {
-		{0, 22, 26, 30},
-		{30, 0, 45, 35},
-		{25, 45, 0, 60},
-		{30, 35, 40, 0}};
-	int dp[32][8];
-
-	for (int i = 0; i < (1 << n); i++) {
-		for (int j = 0; j < n; j++) {
-			dp[i][j] = -1;
-		}
-	}
-
-	int completed_visit = (1 << n) - 1;
+// Held-Karp, table holds 2^cities rows of cities entries, -1 when unknown
+int tsp_dp(const int *graph, int cities, int *table, int mark, int position) {
+	int completed_visit = (1 << cities) - 1;
 	if (mark == completed_visit) {
-		return distan[position][0];
+		return graph[position * cities];
 	}
-	if (dp[mark][position] != -1) {
-		return dp[mark][position];
+	int *entry = &table[mark * cities + position];
+	if (*entry != -1) {
+		return *entry;
 	}
-	int answer = 9999;
-	for (int city = 0; city < n; city++) {
+	int answer = INT_MAX;
+	for (int city = 0; city < cities; city++) {
 		if ((mark & (1 << city)) == 0) {
-			int newAnswer = distan[position][city] + tsp_dp(mark | (1 << city), city);
+			int newAnswer = graph[position * cities + city]
+				+ tsp_dp(graph, cities, table, mark | (1 << city), city);
 			answer = (answer < newAnswer) ? answer : newAnswer;
 		}
 	}
-	return dp[mark][position] = answer;
+	return *entry = answer;
+}
+
+// Every call starts from an empty table, so every sample does the full work
+int tsp_dp_solve(const int *graph, int cities, int *table) {
+	memset(table, -1, ((size_t) 1 << cities) * cities * sizeof(int));
+	return tsp_dp(graph, cities, table, 1, 0);
 }
 
 // https://www.geeksforgeeks.org/graph-coloring-applications/
-bool is_safe(int v, bool graph[gv_len][gv_len], int color[], int c) {
-	for (int i = 0; i < gv_len; i++)
-		if (graph[v][i] && c == color[i])
+bool is_safe(int v, const bool *graph, int vertices, int color[], int c) {
+	for (int i = 0; i < vertices; i++)
+		if (graph[v * vertices + i] && c == color[i])
 			return false;
 	return true;
 }
 
-bool graph_coloring_util(bool graph[gv_len][gv_len], int m, int color[], int v) {
-	if (v == gv_len)
+bool graph_coloring_util(const bool *graph, int vertices, int m, int color[], int v) {
+	if (v == vertices)
 		return true;
 
 	for (int c = 1; c <= m; c++) {
-		if (is_safe(v, graph, color, c)) {
+		if (is_safe(v, graph, vertices, color, c)) {
 			color[v] = c;
 
-			if (graph_coloring_util(graph, m, color, v + 1)
+			if (graph_coloring_util(graph, vertices, m, color, v + 1)
 				== true)
 				return true;
 
@@ -107,12 +103,12 @@ bool graph_coloring_util(bool graph[gv_len][gv_len], int m, int color[], int v)
 	return false;
 }
 
-int graph_coloring(bool graph[gv_len][gv_len], int m) {
-	int color[gv_len];
-	for (int i = 0; i < gv_len; i++)
+int graph_coloring(const bool *graph, int vertices, int m) {
+	int color[vertices];
+	for (int i = 0; i < vertices; i++)
 		color[i] = 0;
 
-	if (graph_coloring_util(graph, m, color, 0) == false) {
+	if (graph_coloring_util(graph, vertices, m, color, 0) == false) {
 		return -1;
 	}
 
@@ -0,0 +1,177 @@
+#include "lib.h"
+#include <stdint.h>
+#include <string.h>
+
+#ifdef __linux__
+#include <linux/perf_event.h>
+#include <sys/ioctl.h>
+#include <sys/syscall.h>
+#include <unistd.h>
+
+struct counter_event {
+	uint32_t type;
+	uint64_t config;
+};
+
+#define HW_CACHE_MISS(cache) \
+	((cache) \
+	| (PERF_COUNT_HW_CACHE_OP_READ << 8) \
+	| (PERF_COUNT_HW_CACHE_RESULT_MISS << 16))
+
+// Same order as the COUNTER_* columns in lib.h
+static const struct counter_event counter_events[COUNTER_MAX] = {
+	{PERF_TYPE_HW_CACHE, HW_CACHE_MISS(PERF_COUNT_HW_CACHE_L1D)},
+	{PERF_TYPE_HW_CACHE, HW_CACHE_MISS(PERF_COUNT_HW_CACHE_L1I)},
+	{PERF_TYPE_HW_CACHE, HW_CACHE_MISS(PERF_COUNT_HW_CACHE_LL)},
+	{PERF_TYPE_HARDWARE, PERF_COUNT_HW_BRANCH_MISSES},
+	{PERF_TYPE_SOFTWARE, PERF_COUNT_SW_CONTEXT_SWITCHES},
+	{PERF_TYPE_SOFTWARE, PERF_COUNT_SW_PAGE_FAULTS},
+	{PERF_TYPE_SOFTWARE, PERF_COUNT_SW_CPU_MIGRATIONS},
+};
+
+static int open_event(const struct counter_event *event, int group_fd) {
+	struct perf_event_attr attr;
+	memset(&attr, 0, sizeof(attr));
+	attr.size = sizeof(attr);
+	attr.type = event->type;
+	attr.config = event->config;
+	attr.read_format = PERF_FORMAT_GROUP;
+	// Members follow the leader, which starts disabled
+	attr.disabled = group_fd == -1;
+	// Count this thread in user space, like an unprivileged perf stat
+	attr.exclude_kernel = event->type != PERF_TYPE_SOFTWARE;
+	attr.exclude_hv = 1;
+
+	return (int) syscall(__NR_perf_event_open, &attr, 0, -1, group_fd, 0);
+}
+
+int counters_open(struct counter_group *group) {
+	memset(group, 0, sizeof(*group));
+	group->leader = -1;
+	for (int i = 0; i < COUNTER_MAX; i++) {
+		group->fds[i] = -1;
+	}
+
+	// Events the PMU or perf_event_paranoid refuses are left out. When
+	// every hardware event is refused, only software events remain
+	for (int i = 0; i < COUNTER_MAX; i++) {
+		int fd = open_event(&counter_events[i], group->leader);
+		if (fd < 0) {
+			continue;
+		}
+		if (group->leader == -1) {
+			group->leader = fd;
+		}
+		group->fds[i] = fd;
+		group->columns[group->opened++] = i;
+		group->available |= 1u << i;
+	}
+
+	if (group->leader == -1) {
+		return -1;
+	}
+	group->software = (group->available & COUNTER_HARDWARE_MASK) == 0;
+
+	ioctl(group->leader, PERF_EVENT_IOC_RESET, PERF_IOC_FLAG_GROUP);
+	ioctl(group->leader, PERF_EVENT_IOC_ENABLE, PERF_IOC_FLAG_GROUP);
+	return group->opened;
+}
+
+void counters_close(struct counter_group *group) {
+	for (int i = 0; i < COUNTER_MAX; i++) {
+		if (group->fds[i] >= 0) {
+			close(group->fds[i]);
+			group->fds[i] = -1;
+		}
+	}
+	group->leader = -1;
+	group->opened = 0;
+	group->available = 0;
+}
+
+// One read of the whole group, laid out as {nr, values[nr]}
+static void counters_read(struct counter_group *group, uint64_t *values) {
+	uint64_t buffer[COUNTER_MAX + 1];
+	if (group->leader < 0
+		|| read(group->leader, buffer, sizeof(buffer)) < (ssize_t) sizeof(uint64_t)) {
+		memset(values, 0, COUNTER_MAX * sizeof(uint64_t));
+		return;
+	}
+	for (int i = 0; i < group->opened; i++) {
+		values[group->columns[i]] = buffer[i + 1];
+	}
+}
+
+#else
+int counters_open(struct counter_group *group) {
+	memset(group, 0, sizeof(*group));
+	group->leader = -1;
+	return -1;
+}
+
+void counters_close(struct counter_group *group) {
+	group->opened = 0;
+	group->available = 0;
+}
+
+static void counters_read(struct counter_group *group, uint64_t *values) {
+	memset(values, 0, COUNTER_MAX * sizeof(uint64_t));
+}
+#endif
+
+int get_ticks_diff_counted_bulk(
+	void (*delay_op)(uint64_t *),
+	int timer,
+	struct counter_group *group,
+	struct eviction_state *eviction,
+	uint64_t *diffs,
+	uint64_t *counts,
+	uint64_t count,
+	uint64_t every
+) {
+	uint64_t before[COUNTER_MAX] = {0};
+	uint64_t after[COUNTER_MAX] = {0};
+
+	if (every == 0) {
+		every = count;
+	}
+
+	for (uint64_t start = 0; start < count; start += every) {
+		uint64_t end = start + every < count ? start + every : count;
+
+		uint64_t *row = counts + (start / every) * COUNTER_MAX;
+		if (eviction == NULL || eviction->mode == EVICTION_NONE) {
+			// Counters are read outside the timed window
+			counters_read(group, before);
+			if (get_ticks_diff_timed_bulk(delay_op, timer, diffs + start, end - start) < 0) {
+				return -1;
+			}
+			counters_read(group, after);
+
+			for (int c = 0; c < COUNTER_MAX; c++) {
+				row[c] = after[c] - before[c];
+			}
+			continue;
+		}
+
+		// One window per sample, so the misses of the eviction itself are
+		// not counted
+		memset(row, 0, COUNTER_MAX * sizeof(uint64_t));
+		for (uint64_t i = start; i < end; i++) {
+			evict(eviction);
+			counters_read(group, before);
+			if (get_ticks_diff_timed_bulk(delay_op, timer, diffs + i, 1) < 0) {
+				return -1;
+			}
+			counters_read(group, after);
+			if (eviction->mode == EVICTION_PRIME_PROBE) {
+				eviction_probe(eviction);
+			}
+
+			for (int c = 0; c < COUNTER_MAX; c++) {
+				row[c] += after[c] - before[c];
+			}
+		}
+	}
+	return 0;
+}
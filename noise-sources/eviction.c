@@ -0,0 +1,226 @@
+#ifdef __linux__
+#define _GNU_SOURCE
+#endif
+#include "lib.h"
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+// Symbol sizes and the cache geometry come from glibc, other platforms
+// use the defaults in lib.h
+#if defined(__linux__) && defined(__GLIBC__)
+#define EVICTION_GLIBC
+#include <dlfcn.h>
+#include <link.h>
+#include <unistd.h>
+#endif
+
+// Size of the code of delay_op from the dynamic symbol table, so clflush
+// and priming cover every line of it instead of the first
+static uint64_t function_size(void (*delay_op)(uint64_t *)) {
+#ifdef EVICTION_GLIBC
+	Dl_info info;
+	const ElfW(Sym) *symbol = NULL;
+	if (dladdr1((void *) delay_op, &info, (void **) &symbol, RTLD_DL_SYMENT)
+		&& symbol != NULL && symbol->st_size > 0) {
+		return symbol->st_size;
+	}
+#else
+	(void) delay_op;
+#endif
+	return EVICTION_DEFAULT_FUNCTION_SIZE;
+}
+
+// Buffer the walks of every operation share, allocated on first use
+static uint8_t *walk_buffer = NULL;
+static uint64_t walk_stride = 0;
+static uint64_t walk_ways = 0;
+
+#ifndef _WIN32
+// Way size and associativity of the last level cache, lines a way size
+// apart share a set
+static void llc_geometry(uint64_t *stride, uint64_t *ways) {
+	long size = 0;
+	long assoc = 0;
+#ifdef EVICTION_GLIBC
+	size = sysconf(_SC_LEVEL3_CACHE_SIZE);
+	assoc = sysconf(_SC_LEVEL3_CACHE_ASSOC);
+	if (size <= 0 || assoc <= 0) {
+		size = sysconf(_SC_LEVEL2_CACHE_SIZE);
+		assoc = sysconf(_SC_LEVEL2_CACHE_ASSOC);
+	}
+#endif
+	if (size <= 0 || assoc <= 0) {
+		*stride = EVICTION_LLC_STRIDE;
+		*ways = EVICTION_LLC_WAYS;
+		return;
+	}
+	*stride = (uint64_t) size / (uint64_t) assoc;
+	*ways = (uint64_t) assoc;
+}
+
+static int walk_buffer_init(void) {
+	if (walk_buffer != NULL) {
+		return 0;
+	}
+	uint64_t stride, ways;
+	llc_geometry(&stride, &ways);
+	// A multiple of the L2 stride too, so the walk evicts from L2 as well
+	stride = (stride + EVICTION_SET_STRIDE - 1) / EVICTION_SET_STRIDE * EVICTION_SET_STRIDE;
+	// Sets come from virtual addresses, while slices hash and sets index
+	// physical ones, so only some walked lines share the operation's sets.
+	// Twice the ways makes up for part of that
+	ways *= 2;
+	// Only the lines walked are ever touched, the rest stays unbacked
+	walk_buffer = aligned_alloc(EVICTION_SET_STRIDE, stride * ways);
+	if (walk_buffer == NULL) {
+		return -2;
+	}
+	walk_stride = stride;
+	walk_ways = ways;
+	return 0;
+}
+#endif
+
+void eviction_cleanup(void) {
+	free(walk_buffer);
+	walk_buffer = NULL;
+}
+
+// Offset of the buffer line in the first way that shares a set with
+// function + offset
+static inline uint64_t set_offset(struct eviction_state *state, uint64_t offset) {
+	uint64_t function = ((uintptr_t) state->function + offset) % state->stride;
+	uint64_t buffer = (uintptr_t) state->buffer % state->stride;
+	return (function + state->stride - buffer) % state->stride;
+}
+
+// Reads ways lines of every set the function maps to
+static inline uint64_t prime_sets(struct eviction_state *state) {
+	uint64_t sum = 0;
+	for (uint64_t offset = 0; offset < state->function_size; offset += CACHE_LINE) {
+		uint64_t set = set_offset(state, offset);
+		for (uint64_t way = 0; way < state->ways; way++) {
+			sum += *(volatile uint8_t *) &state->buffer[way * state->stride + set];
+		}
+	}
+	return sum;
+}
+
+int eviction_init(
+	struct eviction_state *state,
+	int mode,
+	void (*delay_op)(uint64_t *),
+	uint64_t ways
+) {
+	memset(state, 0, sizeof(*state));
+	state->mode = mode;
+	// Start of the cache line the function begins in
+	uintptr_t start = (uintptr_t) delay_op & ~(uintptr_t) (CACHE_LINE - 1);
+	state->function = (uint8_t *) start;
+	state->function_size = (uintptr_t) delay_op - start + function_size(delay_op);
+
+	switch (mode) {
+	case EVICTION_NONE:
+	case EVICTION_CLFLUSH:
+		return 0;
+#ifdef _WIN32
+	// No aligned_alloc, so no buffer aligned to the set stride
+	case EVICTION_BUFFER:
+	case EVICTION_PRIME_PROBE:
+		(void) ways;
+		return -3;
+#else
+	case EVICTION_BUFFER:
+		if (walk_buffer_init() != 0) {
+			return -2;
+		}
+		state->buffer = walk_buffer;
+		state->stride = walk_stride;
+		state->ways = ways && ways <= walk_ways ? ways : walk_ways;
+		state->buffer_size = walk_stride * walk_ways;
+		// Backed by pages before the first walk, not during it, and not
+		// all by the shared zero page
+		for (uint64_t offset = 0; offset < state->function_size; offset += CACHE_LINE) {
+			uint64_t set = set_offset(state, offset);
+			for (uint64_t way = 0; way < state->ways; way++) {
+				state->buffer[way * state->stride + set] = 1;
+			}
+		}
+		return 0;
+	case EVICTION_PRIME_PROBE:
+		state->stride = EVICTION_SET_STRIDE;
+		state->ways = ways ? ways : EVICTION_WAYS;
+		state->buffer_size = state->ways * EVICTION_SET_STRIDE;
+		// Aligned to the set stride, so buffer offsets map to the same sets
+		// as function offsets
+		state->buffer = aligned_alloc(EVICTION_SET_STRIDE, state->buffer_size);
+		if (state->buffer == NULL) {
+			return -2;
+		}
+		memset(state->buffer, 1, state->buffer_size);
+		return 0;
+#endif
+	default:
+		return -1;
+	}
+}
+
+void eviction_free(struct eviction_state *state) {
+	// The walk buffer is shared, and freed with the library
+	if (state->mode != EVICTION_BUFFER) {
+		free(state->buffer);
+	}
+	state->buffer = NULL;
+}
+
+void evict(struct eviction_state *state) {
+	uint64_t sum = 0;
+
+	switch (state->mode) {
+	case EVICTION_CLFLUSH:
+		for (uint64_t offset = 0; offset < state->function_size; offset += CACHE_LINE) {
+			flush_cache(state->function + offset);
+		}
+		__asm__ volatile ("mfence" ::: "memory");
+		break;
+	case EVICTION_BUFFER:
+	case EVICTION_PRIME_PROBE:
+		sum = prime_sets(state);
+		break;
+	}
+	state->sink += sum;
+}
+
+// Time to reload the primed lines after a sample. Lines the operation
+// evicted from its sets come back from further out and take longer
+void eviction_probe(struct eviction_state *state) {
+	uint64_t ts0 = get_ticks();
+	state->sink += prime_sets(state);
+	uint64_t ts1 = get_ticks();
+	state->probe_ticks += ts1 - ts0;
+	state->probes++;
+}
+
+int get_ticks_diff_evicted_bulk(
+	void (*delay_op)(uint64_t *),
+	int timer,
+	struct eviction_state *state,
+	uint64_t *diffs,
+	uint64_t count
+) {
+	if (state == NULL || state->mode == EVICTION_NONE) {
+		return get_ticks_diff_timed_bulk(delay_op, timer, diffs, count);
+	}
+
+	// Eviction runs between samples, outside the timed window
+	for (uint64_t i = 0; i < count; i++) {
+		evict(state);
+		if (get_ticks_diff_timed_bulk(delay_op, timer, diffs + i, 1) < 0) {
+			return -1;
+		}
+		if (state->mode == EVICTION_PRIME_PROBE) {
+			eviction_probe(state);
+		}
+	}
+	return 0;
+}
@@ -6,6 +6,7 @@
 #define NS_PER_SEC 1000000000
 #ifdef _WIN32
 #include <windows.h>
+#include <intrin.h>
 struct timespec {
 	uint64_t tv_sec;
 	uint64_t tv_nsec;
@@ -27,10 +28,139 @@ void cleanup_jitter_entropy() __attribute__((destructor));
 // other NP-hard approx?
 
 // timer.c
+// Timer backends of get_ticks_diff_timed_bulk
+#define TIMER_RDTSC 0
+#define TIMER_RDTSC_LFENCE 1
+#define TIMER_RDTSC_MFENCE 2
+#define TIMER_RDTSCP 3
+#define TIMER_MONOTONIC_RAW 4
 uint64_t get_time(struct timespec *ts);
 uint64_t get_ticks();
 uint64_t get_time_diff(void (*delay_op)(uint64_t *));
 uint64_t get_ticks_diff(void (*delay_op)(uint64_t *));
+void get_ticks_diff_bulk(
+	void (*delay_op)(uint64_t *),
+	uint64_t *diffs,
+	uint64_t count
+);
+int get_ticks_diff_timed_bulk(
+	void (*delay_op)(uint64_t *),
+	int timer,
+	uint64_t *diffs,
+	uint64_t count
+);
+
+// SP 800-90B continuous health tests of get_ticks_diff_health_bulk. The
+// return value holds a bit per test that failed during the call
+#define HEALTH_RCT_FAILURE 1
+#define HEALTH_APT_FAILURE 2
+struct health_state {
+	uint64_t rct_cutoff;
+	uint64_t apt_cutoff;
+	uint64_t apt_window;
+	uint64_t rct_value;
+	uint64_t rct_count;
+	uint64_t apt_value;
+	uint64_t apt_count;
+	uint64_t apt_seen;
+	uint64_t samples;
+	uint64_t rct_failures;
+	uint64_t apt_failures;
+	uint64_t last_failure;
+};
+void health_init(
+	struct health_state *state,
+	uint64_t rct_cutoff,
+	uint64_t apt_cutoff,
+	uint64_t apt_window
+);
+int get_ticks_diff_health_bulk(
+	void (*delay_op)(uint64_t *),
+	int timer,
+	struct health_state *state,
+	uint64_t *diffs,
+	uint64_t count
+);
+
+// eviction.c
+// Cache state every sample of get_ticks_diff_evicted_bulk starts from
+#define EVICTION_NONE 0
+#define EVICTION_CLFLUSH 1
+#define EVICTION_BUFFER 2
+#define EVICTION_PRIME_PROBE 3
+#define CACHE_LINE 64
+// Addresses this far apart share a set in L1 and L2, and lines of each
+// set primed
+#define EVICTION_SET_STRIDE 65536
+#define EVICTION_WAYS 16
+// Last level cache way size and associativity when sysconf has neither,
+// or the platform has no sysconf for them
+#define EVICTION_LLC_STRIDE (2 << 20)
+#define EVICTION_LLC_WAYS 16
+// Code flushed or primed when the symbol has no size, or there is no
+// dladdr1 to look it up
+#define EVICTION_DEFAULT_FUNCTION_SIZE 4096
+struct eviction_state {
+	int mode;
+	uint8_t *function;
+	uint64_t function_size;
+	uint8_t *buffer;
+	uint64_t buffer_size;
+	uint64_t stride;
+	uint64_t ways;
+	uint64_t probe_ticks;
+	uint64_t probes;
+	uint64_t sink;
+};
+int eviction_init(
+	struct eviction_state *state,
+	int mode,
+	void (*delay_op)(uint64_t *),
+	uint64_t ways
+);
+void eviction_free(struct eviction_state *state);
+void eviction_cleanup(void) __attribute__((destructor));
+void evict(struct eviction_state *state);
+void eviction_probe(struct eviction_state *state);
+int get_ticks_diff_evicted_bulk(
+	void (*delay_op)(uint64_t *),
+	int timer,
+	struct eviction_state *state,
+	uint64_t *diffs,
+	uint64_t count
+);
+
+// counters.c
+// Counter columns, in the order counts rows are laid out
+#define COUNTER_L1D_MISSES 0
+#define COUNTER_L1I_MISSES 1
+#define COUNTER_LLC_MISSES 2
+#define COUNTER_BRANCH_MISSES 3
+#define COUNTER_CONTEXT_SWITCHES 4
+#define COUNTER_PAGE_FAULTS 5
+#define COUNTER_CPU_MIGRATIONS 6
+#define COUNTER_MAX 7
+#define COUNTER_HARDWARE_MASK 0xF
+struct counter_group {
+	int leader;
+	int opened;
+	int software;
+	uint32_t available;
+	int fds[COUNTER_MAX];
+	int columns[COUNTER_MAX];
+};
+int counters_open(struct counter_group *group);
+void counters_close(struct counter_group *group);
+int get_ticks_diff_counted_bulk(
+	void (*delay_op)(uint64_t *),
+	int timer,
+	struct counter_group *group,
+	struct eviction_state *eviction,
+	uint64_t *diffs,
+	uint64_t *counts,
+	uint64_t count,
+	uint64_t every
+);
 
 // operations.c
 void flush_cache(void *addr);
@@ -44,21 +174,54 @@ void tsp_op(uint64_t *data);
 void graph_color_op(uint64_t *data);
 void long_loop_op(uint64_t *data);
 void rdtsc_op(uint64_t *data);
+void empty_op(uint64_t *data);
+
+// workloads.c
+// Size-parametric operations, their size is set by workload_configure
+#define WORKLOAD_TSP 0
+#define WORKLOAD_TSP_DP 1
+#define WORKLOAD_GRAPH_COLOR 2
+#define WORKLOAD_LONG_LOOP 3
+#define WORKLOAD_MAX 4
+// Default sizes, the original hard-coded graphs and loop
+#define gv_len 6
+#define TSP_DP_DEFAULT_CITIES 4
+#define LONG_LOOP_DEFAULT_ITERATIONS 100000
+// Largest inputs. The TSP DP table holds 2^n * n entries
+#define GRAPH_MAX_VERTICES 4096
+#define TSP_DP_MAX_CITIES 16
+// Edges per vertex of generated coloring graphs
+#define GRAPH_COLOR_EDGES 2
+#define WORKLOAD_SEED 0x6A09E667F3BCC908ULL
+struct workload_input {
+	int workload;
+	uint64_t size;
+	int *weights;
+	bool *edges;
+	int *table;
+	struct workload_input *next;
+};
+// Input every operation currently runs on
+extern struct workload_input *workload_inputs[WORKLOAD_MAX];
+int workload_configure(int workload, uint64_t size);
+uint64_t workload_size(int workload);
+void workload_cleanup(void) __attribute__((destructor));
 
 // algorithms.c
+// Graphs are row-major vertices x vertices matrices
 
 /* TSP greedy */
-#define gv_len 6
-int find_min_key(int key[], bool mstSet[]);
-void prim_MST(int graph[gv_len][gv_len], int parent[]);
-void tsp_approximation(int graph[gv_len][gv_len], uint64_t *cost);
+int find_min_key(int key[], bool mstSet[], int vertices);
+void prim_MST(const int *graph, int vertices, int parent[]);
+void tsp_approximation(const int *graph, int vertices, uint64_t *cost);
 
 /* TSP DP */
-int tsp_dp(int mark, int position);
+int tsp_dp(const int *graph, int cities, int *table, int mark, int position);
+int tsp_dp_solve(const int *graph, int cities, int *table);
 
 /* Graph Coloring */
-bool is_safe(int v, bool graph[gv_len][gv_len], int color[], int c);
-bool graph_coloring_util(bool graph[gv_len][gv_len], int m, int color[], int v);
-int graph_coloring(bool graph[gv_len][gv_len], int m);
+bool is_safe(int v, const bool *graph, int vertices, int color[], int c);
+bool graph_coloring_util(const bool *graph, int vertices, int m, int color[], int v);
+int graph_coloring(const bool *graph, int vertices, int m);
 
 #endif  // JITTER2INFINITY_LIB_H
@@ -54,19 +54,12 @@ void print_op(uint64_t *data) {
 }
 
 void tsp_op(uint64_t *data) {
-	// Example graph represented as an adjacency matrix
-	int graph[gv_len][gv_len] = {
-		{0, 3, 1, 6, 0, 0},
-		{3, 0, 5, 0, 3, 0},
-		{1, 5, 0, 5, 6, 4},
-		{6, 0, 5, 0, 0, 2},
-		{0, 3, 6, 0, 0, 6},
-		{0, 0, 4, 2, 6, 0}
-	};
-	tsp_approximation(graph, data);
+	struct workload_input *input = workload_inputs[WORKLOAD_TSP];
+	tsp_approximation(input->weights, (int) input->size, data);
 }
 void tsp_dp_op(uint64_t *data) {
-	*data = tsp_dp(1, 0);
+	struct workload_input *input = workload_inputs[WORKLOAD_TSP_DP];
+	*data = tsp_dp_solve(input->weights, (int) input->size, input->table);
 }
 void interrupt_op(uint64_t *data) {
     __asm__ (
@@ -84,29 +77,22 @@ void get_pid_op(uint64_t *data) {
     );
 }
 void graph_color_op(uint64_t *data) {
-	/* Create following graph and test
-       whether it is 3 colorable
+	/* Test whether the current graph is 3 colorable. The default one:
       (3)---(2)
        |   / |
        |  /  |
        | /   |
       (0)---(1)
     */
-	bool graph[gv_len][gv_len] = {
-		{ 0, 1, 1, 1, 0, 1 },
-		{ 1, 0, 1, 0, 0, 0 },
-		{ 1, 1, 0, 1, 1, 0 },
-		{ 1, 0, 1, 0, 0, 0 },
-		{ 0, 0, 0, 1, 0, 1 },
-		{ 0, 1, 1, 0, 1, 0 },
-	};
+	struct workload_input *input = workload_inputs[WORKLOAD_GRAPH_COLOR];
 	int m = 3; // Number of colors
 
-	*data = graph_coloring(graph, m);
+	*data = graph_coloring(input->edges, (int) input->size, m);
 }
 void long_loop_op(uint64_t *data) {
+	uint64_t iterations = workload_inputs[WORKLOAD_LONG_LOOP]->size;
 	int x = 0;
-	for (int i = 0; i < 100000; i++) {
+	for (uint64_t i = 0; i < iterations; i++) {
 		x += 1;
 	}
 	*data = x;
@@ -115,3 +101,6 @@ void rdtsc_op(uint64_t *data) {
 	uint32_t low, high;
 	asm volatile("rdtsc" : "=a"(low), "=d"(high));
 }
+// Does nothing, measures the fixed cost of a timer and the call
+void empty_op(uint64_t *data) {
+}
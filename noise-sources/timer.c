@@ -1,5 +1,6 @@
 #include "lib.h"
 #include <stdint.h>
+#include <string.h>
 
 #ifdef _WIN32
 uint64_t get_time(struct timespec *ts) {
@@ -19,6 +20,28 @@ uint64_t get_ticks() {
 	return (uint64_t) __rdtsc();
 }
 
+static inline uint64_t get_ticks_lfence() {
+	_mm_lfence();
+	uint64_t ticks = __rdtsc();
+	_mm_lfence();
+	return ticks;
+}
+
+static inline uint64_t get_ticks_mfence() {
+	_mm_mfence();
+	_mm_lfence();
+	uint64_t ticks = __rdtsc();
+	_mm_lfence();
+	return ticks;
+}
+
+static inline uint64_t get_ticks_rdtscp() {
+	unsigned int aux;
+	uint64_t ticks = __rdtscp(&aux);
+	_mm_lfence();
+	return ticks;
+}
+
 #elif defined(__linux__)
 uint64_t get_time(struct timespec *ts) {
 	clock_gettime(CLOCK_MONOTONIC_RAW, ts);
@@ -30,8 +53,56 @@ uint64_t get_ticks() {
 	asm volatile("rdtsc" : "=a"(low), "=d"(high));
 	return ((uint64_t) high << 32) | low;
 }
+
+// lfence keeps earlier instructions from finishing after the read and
+// later ones from starting before it
+static inline uint64_t get_ticks_lfence() {
+	uint32_t low, high;
+	asm volatile(
+		"lfence\n\t"
+		"rdtsc\n\t"
+		"lfence"
+		: "=a"(low), "=d"(high)
+		:
+		: "memory"
+	);
+	return ((uint64_t) high << 32) | low;
+}
+
+// mfence also drains pending stores before the read
+static inline uint64_t get_ticks_mfence() {
+	uint32_t low, high;
+	asm volatile(
+		"mfence\n\t"
+		"lfence\n\t"
+		"rdtsc\n\t"
+		"lfence"
+		: "=a"(low), "=d"(high)
+		:
+		: "memory"
+	);
+	return ((uint64_t) high << 32) | low;
+}
+
+// rdtscp waits for earlier instructions, lfence holds back later ones
+static inline uint64_t get_ticks_rdtscp() {
+	uint32_t low, high, aux;
+	asm volatile(
+		"rdtscp\n\t"
+		"lfence"
+		: "=a"(low), "=d"(high), "=c"(aux)
+		:
+		: "memory"
+	);
+	return ((uint64_t) high << 32) | low;
+}
 #endif
 
+static inline uint64_t get_ticks_monotonic_raw() {
+	struct timespec ts;
+	return get_time(&ts);
+}
+
 uint64_t get_time_diff(void (*delay_op)(uint64_t *)) {
 	uint64_t data = 0x123;
 	struct timespec ts;
@@ -80,3 +151,130 @@ uint64_t get_ticks_diff(void (*delay_op)(uint64_t *)) {
 
 	return ts1 - ts0;
 }
+
+// One loop per timer, so the timer choice is not re-made around every
+// sample inside the timed window
+#define TIMED_BULK_LOOP(read_ticks) \
+	for (uint64_t i = 0; i < count; i++) { \
+		data = 0x123; \
+		uint64_t ts0 = read_ticks(); \
+		delay_op(&data); \
+		uint64_t ts1 = read_ticks(); \
+		diffs[i] = ts1 - ts0; \
+	}
+
+void get_ticks_diff_bulk(
+	void (*delay_op)(uint64_t *),
+	uint64_t *diffs,
+	uint64_t count
+) {
+	uint64_t data;
+
+	TIMED_BULK_LOOP(get_ticks)
+}
+
+int get_ticks_diff_timed_bulk(
+	void (*delay_op)(uint64_t *),
+	int timer,
+	uint64_t *diffs,
+	uint64_t count
+) {
+	uint64_t data;
+
+	switch (timer) {
+	case TIMER_RDTSC:
+		TIMED_BULK_LOOP(get_ticks)
+		break;
+	case TIMER_RDTSC_LFENCE:
+		TIMED_BULK_LOOP(get_ticks_lfence)
+		break;
+	case TIMER_RDTSC_MFENCE:
+		TIMED_BULK_LOOP(get_ticks_mfence)
+		break;
+	case TIMER_RDTSCP:
+		TIMED_BULK_LOOP(get_ticks_rdtscp)
+		break;
+	case TIMER_MONOTONIC_RAW:
+		TIMED_BULK_LOOP(get_ticks_monotonic_raw)
+		break;
+	default:
+		return -1;
+	}
+	return 0;
+}
+
+// Samples timed before each health pass, so the pass reads them from L1
+#define HEALTH_BLOCK 1024
+
+void health_init(
+	struct health_state *state,
+	uint64_t rct_cutoff,
+	uint64_t apt_cutoff,
+	uint64_t apt_window
+) {
+	memset(state, 0, sizeof(*state));
+	state->rct_cutoff = rct_cutoff;
+	state->apt_cutoff = apt_cutoff;
+	state->apt_window = apt_window;
+}
+
+// A run or window is counted as one failure, however long it goes on
+static int health_update(
+	struct health_state *state,
+	const uint64_t *diffs,
+	uint64_t count
+) {
+	int failed = 0;
+
+	for (uint64_t i = 0; i < count; i++) {
+		uint64_t sample = diffs[i];
+
+		if (sample == state->rct_value && state->rct_count) {
+			if (++state->rct_count == state->rct_cutoff) {
+				state->rct_failures++;
+				state->last_failure = state->samples + i;
+				failed |= HEALTH_RCT_FAILURE;
+			}
+		} else {
+			state->rct_value = sample;
+			state->rct_count = 1;
+		}
+
+		if (state->apt_seen == 0) {
+			state->apt_value = sample;
+			state->apt_count = 0;
+		}
+		state->apt_count += sample == state->apt_value;
+		if (++state->apt_seen == state->apt_window) {
+			if (state->apt_count >= state->apt_cutoff) {
+				state->apt_failures++;
+				state->last_failure = state->samples + i;
+				failed |= HEALTH_APT_FAILURE;
+			}
+			state->apt_seen = 0;
+		}
+	}
+
+	state->samples += count;
+	return failed;
+}
+
+int get_ticks_diff_health_bulk(
+	void (*delay_op)(uint64_t *),
+	int timer,
+	struct health_state *state,
+	uint64_t *diffs,
+	uint64_t count
+) {
+	int failed = 0;
+
+	for (uint64_t start = 0; start < count; start += HEALTH_BLOCK) {
+		uint64_t block = count - start < HEALTH_BLOCK ? count - start : HEALTH_BLOCK;
+
+		if (get_ticks_diff_timed_bulk(delay_op, timer, diffs + start, block) < 0) {
+			return -1;
+		}
+		failed |= health_update(state, diffs + start, block);
+	}
+	return failed;
+}
@@ -0,0 +1,193 @@
+#include "lib.h"
+#include <stdbool.h>
+#include <stdint.h>
+#include <stdlib.h>
+
+// Inputs of the default sizes, the graphs the operations always used
+static int default_tsp_graph[gv_len * gv_len] = {
+	0, 3, 1, 6, 0, 0,
+	3, 0, 5, 0, 3, 0,
+	1, 5, 0, 5, 6, 4,
+	6, 0, 5, 0, 0, 2,
+	0, 3, 6, 0, 0, 6,
+	0, 0, 4, 2, 6, 0
+};
+static int default_tsp_dp_graph[TSP_DP_DEFAULT_CITIES * TSP_DP_DEFAULT_CITIES] = {
+	0, 22, 26, 30,
+	30, 0, 45, 35,
+	25, 45, 0, 60,
+	30, 35, 40, 0
+};
+static bool default_color_graph[gv_len * gv_len] = {
+	0, 1, 1, 1, 0, 1,
+	1, 0, 1, 0, 0, 0,
+	1, 1, 0, 1, 1, 0,
+	1, 0, 1, 0, 0, 0,
+	0, 0, 0, 1, 0, 1,
+	0, 1, 1, 0, 1, 0
+};
+static int default_tsp_dp_table[(1 << TSP_DP_DEFAULT_CITIES) * TSP_DP_DEFAULT_CITIES];
+
+static struct workload_input default_inputs[WORKLOAD_MAX] = {
+	{WORKLOAD_TSP, gv_len, default_tsp_graph, NULL, NULL, NULL},
+	{
+		WORKLOAD_TSP_DP,
+		TSP_DP_DEFAULT_CITIES,
+		default_tsp_dp_graph,
+		NULL,
+		default_tsp_dp_table,
+		NULL
+	},
+	{WORKLOAD_GRAPH_COLOR, gv_len, NULL, default_color_graph, NULL, NULL},
+	{WORKLOAD_LONG_LOOP, LONG_LOOP_DEFAULT_ITERATIONS, NULL, NULL, NULL, NULL},
+};
+
+// Inputs of the sizes configured so far, generated once each
+static struct workload_input *generated = NULL;
+
+struct workload_input *workload_inputs[WORKLOAD_MAX] = {
+	&default_inputs[WORKLOAD_TSP],
+	&default_inputs[WORKLOAD_TSP_DP],
+	&default_inputs[WORKLOAD_GRAPH_COLOR],
+	&default_inputs[WORKLOAD_LONG_LOOP],
+};
+
+// xorshift64, seeded by the size so every size always gets the same graph
+static uint64_t next_random(uint64_t *state) {
+	*state ^= *state << 13;
+	*state ^= *state >> 7;
+	*state ^= *state << 17;
+	return *state;
+}
+
+// Complete graph with symmetric weights of 1 to 100
+static int *generate_weights(uint64_t vertices, uint64_t *state) {
+	int *weights = calloc(vertices * vertices, sizeof(int));
+	if (weights == NULL) {
+		return NULL;
+	}
+	for (uint64_t u = 0; u < vertices; u++) {
+		for (uint64_t v = u + 1; v < vertices; v++) {
+			int weight = (int) (next_random(state) % 100) + 1;
+			weights[u * vertices + v] = weight;
+			weights[v * vertices + u] = weight;
+		}
+	}
+	return weights;
+}
+
+// Sparse graph with a hidden 3-coloring, every vertex joined to up to
+// GRAPH_COLOR_EDGES earlier vertices of another color, so a coloring
+// with 3 colors exists at every size
+static bool *generate_edges(uint64_t vertices, uint64_t *state) {
+	bool *edges = calloc(vertices * vertices, sizeof(bool));
+	if (edges == NULL) {
+		return NULL;
+	}
+	for (uint64_t v = 1; v < vertices; v++) {
+		for (int edge = 0; edge < GRAPH_COLOR_EDGES; edge++) {
+			uint64_t u = next_random(state) % v;
+			if (u % 3 != v % 3) {
+				edges[u * vertices + v] = true;
+				edges[v * vertices + u] = true;
+			}
+		}
+	}
+	return edges;
+}
+
+static struct workload_input *generate_input(int workload, uint64_t size) {
+	struct workload_input *input = calloc(1, sizeof(struct workload_input));
+	if (input == NULL) {
+		return NULL;
+	}
+	input->workload = workload;
+	input->size = size;
+
+	uint64_t state = WORKLOAD_SEED ^ (size * 0x9E3779B97F4A7C15ULL);
+	bool failed = false;
+	switch (workload) {
+	case WORKLOAD_TSP:
+		input->weights = generate_weights(size, &state);
+		failed = input->weights == NULL;
+		break;
+	case WORKLOAD_TSP_DP:
+		input->weights = generate_weights(size, &state);
+		input->table = malloc(((uint64_t) 1 << size) * size * sizeof(int));
+		failed = input->weights == NULL || input->table == NULL;
+		break;
+	case WORKLOAD_GRAPH_COLOR:
+		input->edges = generate_edges(size, &state);
+		failed = input->edges == NULL;
+		break;
+	}
+
+	if (failed) {
+		free(input->weights);
+		free(input->table);
+		free(input);
+		return NULL;
+	}
+	return input;
+}
+
+int workload_configure(int workload, uint64_t size) {
+	switch (workload) {
+	case WORKLOAD_TSP:
+	case WORKLOAD_GRAPH_COLOR:
+		if (size < 1 || size > GRAPH_MAX_VERTICES) {
+			return -1;
+		}
+		break;
+	case WORKLOAD_TSP_DP:
+		if (size < 2 || size > TSP_DP_MAX_CITIES) {
+			return -1;
+		}
+		break;
+	case WORKLOAD_LONG_LOOP:
+		break;
+	default:
+		return -1;
+	}
+
+	struct workload_input *input = &default_inputs[workload];
+	if (size != input->size) {
+		for (input = generated; input != NULL; input = input->next) {
+			if (input->workload == workload && input->size == size) {
+				break;
+			}
+		}
+	}
+	if (input == NULL) {
+		input = generate_input(workload, size);
+		if (input == NULL) {
+			return -2;
+		}
+		input->next = generated;
+		generated = input;
+	}
+
+	workload_inputs[workload] = input;
+	return 0;
+}
+
+uint64_t workload_size(int workload) {
+	if (workload < 0 || workload >= WORKLOAD_MAX) {
+		return 0;
+	}
+	return workload_inputs[workload]->size;
+}
+
+void workload_cleanup(void) {
+	for (int workload = 0; workload < WORKLOAD_MAX; workload++) {
+		workload_inputs[workload] = &default_inputs[workload];
+	}
+	while (generated != NULL) {
+		struct workload_input *next = generated->next;
+		free(generated->weights);
+		free(generated->edges);
+		free(generated->table);
+		free(generated);
+		generated = next;
+	}
+}
@@ -1,15 +1,50 @@
+import functools
+import hashlib
 import os
 import subprocess
 import sys
 from concurrent.futures import ThreadPoolExecutor
 test_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test')
 sys.path.append(test_dir)
-from jitter import main
+from variants import load_variants
 
 
-def compile(cmd: str):
+def compile(cmd: str, output: str, build_hash: str):
     print('Running:', ' '.join(cmd))
-    subprocess.run(cmd)
+    if subprocess.run(cmd).returncode == 0:
+        with open(output + '.hash', 'w') as file:
+            file.write(build_hash)
+
+
+@functools.cache
+def compiler_version(compiler: tuple):
+    try:
+        return subprocess.run(
+            list(compiler) + ['--version'],
+            capture_output=True,
+            text=True
+        ).stdout
+    except OSError:
+        return ''
+
+
+def get_build_hash(compiler: list, cmd: list, inputs: list):
+    '''Hash of the compiler version, compile command and every input.'''
+    digest = hashlib.sha256()
+    digest.update(compiler_version(tuple(compiler)).encode())
+    digest.update('\0'.join(cmd).encode())
+    for name in inputs:
+        with open(name, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def is_stale(output: str, build_hash: str):
+    try:
+        with open(output + '.hash') as file:
+            return file.read() != build_hash or not os.path.isfile(output)
+    except OSError:
+        return True
 
 
 def build():
@@ -26,6 +61,10 @@ def build():
         '-fno-strict-aliasing',
         '-fno-inline',
     ]
+    # dladdr1 for eviction.c, the Windows build has no libdl
+    linux_flags = [
+        '-ldl',
+    ]
     trace_flags = [
         '-DTRACEPOINTS',
         # '-I/usr/src/linux-headers-*/include',
@@ -56,11 +95,16 @@ def build():
         '-fstack-protector-strong',
     ]
 
-    optimization_levels = ['-O0', '-O1', '-O2', '-O3', '-Ofast', '-Og', '-Os']
     source_files = [
         'noise-sources/timer.c',
+        'noise-sources/counters.c',
         'noise-sources/operations.c',
-        'noise-sources/algorithms.c'
+        'noise-sources/algorithms.c',
+        'noise-sources/workloads.c',
+        'noise-sources/eviction.c'
+    ]
+    header_files = [
+        'noise-sources/lib.h',
     ]
 
     try:
@@ -68,30 +112,37 @@ def build():
     except OSError as e:
         print('Mkdir: ', e)
 
+    prefix = ['wsl', '--'] if os.name == 'nt' else []
+
     with ThreadPoolExecutor() as executor:
         futures = []
-        for opt in optimization_levels:
-            lib_name_opt = lib_name + opt
-            gcc_cmd = [gcc] + flags + [
-                opt,
-                '-o',
-                os.path.join(build_dir, lib_name_opt + so)
-            ] + source_files
-
-            if os.name == 'nt':
-                gcc_cmd = ['wsl', '--'] + gcc_cmd
+        for variant in load_variants():
+            lib_name_opt = lib_name + variant.level
+            targets = [
+                (gcc, lib_name_opt + so, linux_flags),
+                # (mingw, lib_name_opt + dll, []),
+            ]
 
-            mingw_cmd = [mingw] + flags + [
-                opt,
-                '-o',
-                os.path.join(build_dir, lib_name_opt + dll)
-            ] + source_files
+            for compiler, target, target_flags in targets:
+                output = os.path.join(build_dir, target)
+                cmd = prefix + [compiler] + flags + target_flags + list(variant.flags) + [
+                    '-o',
+                    output
+                ] + source_files
 
-            if os.name == 'nt':
-                mingw_cmd = ['wsl', '--'] + mingw_cmd
+                # Only rebuild libraries whose inputs changed
+                build_hash = get_build_hash(
+                    prefix + [compiler],
+                    cmd,
+                    source_files + header_files
+                )
+                if not is_stale(output, build_hash):
+                    print('Up to date:', output)
+                    continue
 
-            futures.append(executor.submit(compile, gcc_cmd))
-            # futures.append(executor.submit(compile, mingw_cmd))
+                futures.append(
+                    executor.submit(compile, cmd, output, build_hash)
+                )
 
         for future in futures:
             future.result()
@@ -100,4 +151,28 @@ def build():
 if __name__ == '__main__':
     build()
     print("Starting...")
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        # Headless, never imports tkinter or matplotlib
+        from batch import main
+        main(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'iid':
+        from iid import main
+        main(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'extract':
+        from extractor import main
+        main(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'daemon':
+        from daemon import main
+        main(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        from bench import main
+        main(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'spectral':
+        from spectral import main
+        main(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'sweep':
+        from sweep import main
+        main(sys.argv[2:])
+    else:
+        from jitter import main
+        main()
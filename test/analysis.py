@@ -1,26 +1,305 @@
 import numpy as np
-import scipy.stats as stats
 from enum import Enum, EnumMeta, unique
 
+from estimators import Estimators
 
-class Analysis:
-    def remove_outliers_iqr(data):
-        data = np.array(data)
-        Q1 = np.percentile(data, 25)
-        Q3 = np.percentile(data, 75)
 
-        IQR = Q3 - Q1
+class JitterHistogram:
+    '''
+    Counts of every distinct jitter value, built up chunk by chunk.
+
+    Values are kept sorted, so updates and merges cost O(distinct values)
+    plus the np.unique of the incoming chunk. Histograms built from
+    separate shards or processes can be merged into one.
+    '''
+    def __init__(self, data=None):
+        self.values = None
+        self.counts = np.empty(0, dtype=np.int64)
+        self.total = 0
+
+        if data is not None:
+            self.update(data)
+
+    def update(self, data):
+        values, counts = np.unique(np.asarray(data), return_counts=True)
+        return self.add_counts(values, counts)
+
+    def merge(self, other):
+        if other.values is None:
+            return self
+        return self.add_counts(other.values, other.counts)
+
+    def add_counts(self, values, counts):
+        '''Add counts of values, which may repeat, e.g. over batch rows.'''
+        values = np.asarray(values)
+        counts = np.asarray(counts, dtype=np.int64)
+        if np.any(values[1:] <= values[:-1]):
+            values, inverse = np.unique(values, return_inverse=True)
+            summed = np.zeros(len(values), dtype=np.int64)
+            np.add.at(summed, inverse, counts)
+            counts = summed
+
+        if self.values is None:
+            self.values = values
+            self.counts = counts.copy()
+        else:
+            # Both sides are sorted and unique: add the counts of values
+            # already present, insert the others where they belong
+            index = np.searchsorted(self.values, values)
+            present = index < len(self.values)
+            present[present] = self.values[index[present]] == values[present]
+            new = values[~present]
+            self.counts[index[present]] += counts[present]
+            if len(new):
+                self.values = np.insert(self.values, index[~present], new)
+                self.counts = np.insert(self.counts, index[~present], counts[~present])
+
+        self.total = int(self.counts.sum())
+        return self
+
+    @property
+    def distinct(self):
+        return len(self.counts)
+
+    @property
+    def probabilities(self):
+        return self.counts / self.total
+
+
+class QuantileSketch:
+    '''
+    Mergeable quantile sketch of uint64 samples in constant memory.
+
+    A log-linear histogram, as in HDR histograms and DDSketch: values
+    below 2^SIGNIFICANT_BITS get a bucket each and are exact, larger ones
+    share buckets 2^-(SIGNIFICANT_BITS - 1) of their value wide, so any
+    quantile is off by at most 1/2^SIGNIFICANT_BITS of its value, tails
+    included. Updates are one bincount per chunk, merges add counts.
+    '''
+    SIGNIFICANT_BITS = 10
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self, data=None):
+        m = QuantileSketch.SIGNIFICANT_BITS
+        self.counts = np.zeros((1 << m) + (64 - m) * (1 << (m - 1)), dtype=np.int64)
+        self.total = 0
+        self.minimum = None
+        self.maximum = None
+
+        if data is not None:
+            self.update(data)
+
+    def buckets(values: np.ndarray):
+        m = QuantileSketch.SIGNIFICANT_BITS
+        values = np.asarray(values, dtype=np.uint64)
+        index = values.astype(np.int64)
+
+        large = values >= np.uint64(1 << m)
+        if np.any(large):
+            big = values[large]
+            # frexp rounds values above 2^53 up to the next power of two
+            _, exponent = np.frexp(big.astype(np.float64))
+            bit_length = exponent.astype(np.int64)
+            bit_length -= (big >> (bit_length - 1).astype(np.uint64)) == 0
+            shift = bit_length - m
+            top = (big >> shift.astype(np.uint64)).astype(np.int64)
+            index[large] = (1 << m) + (shift - 1) * (1 << (m - 1)) + top - (1 << (m - 1))
+        return index
+
+    def bucket_values(index: np.ndarray):
+        '''Midpoint of every bucket, exact below 2^SIGNIFICANT_BITS.'''
+        m = QuantileSketch.SIGNIFICANT_BITS
+        index = np.asarray(index, dtype=np.int64)
+        values = index.astype(np.float64)
+
+        large = index >= (1 << m)
+        offset = index[large] - (1 << m)
+        shift = offset // (1 << (m - 1)) + 1
+        top = offset % (1 << (m - 1)) + (1 << (m - 1))
+        values[large] = np.ldexp(top + 0.5, shift)
+        return values
 
-        lower_bound = Q1 - 1.5 * IQR
-        upper_bound = Q3 + 1.5 * IQR
+    def update(self, data):
+        data = np.asarray(data)
+        for start in range(0, len(data), QuantileSketch.CHUNK_SIZE):
+            chunk = data[start:start + QuantileSketch.CHUNK_SIZE]
+            self.counts += np.bincount(
+                QuantileSketch.buckets(chunk),
+                minlength=len(self.counts)
+            )
+            self.total += len(chunk)
+            self.extend(int(chunk.min()), int(chunk.max()))
+        return self
 
-        mask = (data >= lower_bound) & (data <= upper_bound)
-        return data[mask]
+    def extend(self, low: int, high: int):
+        self.minimum = low if self.minimum is None else min(self.minimum, low)
+        self.maximum = high if self.maximum is None else max(self.maximum, high)
+
+    def merge(self, other):
+        if other.total == 0:
+            return self
+        self.counts += other.counts
+        self.total += other.total
+        self.extend(other.minimum, other.maximum)
+        return self
+
+    def quantile(self, q):
+        '''Approximate quantiles, q a float or array in [0, 1].'''
+        if self.total == 0:
+            return np.full(np.shape(q), np.nan)
+
+        # Same ranks as np.percentile with its default linear method,
+        # rounded to the nearest sample
+        ranks = np.rint(np.asarray(q, dtype=np.float64) * (self.total - 1))
+        index = np.searchsorted(np.cumsum(self.counts), ranks, side='right')
+        values = QuantileSketch.bucket_values(index)
+        return np.clip(values, self.minimum, self.maximum)
+
+    def iqr_bounds(self, factor=1.5):
+        q1, q3 = self.quantile([0.25, 0.75])
+        iqr = q3 - q1
+        return q1 - factor * iqr, q3 + factor * iqr
+
+    def tails(self):
+        '''Median and upper percentiles, the usual latency summary.'''
+        p50, p99, p999 = self.quantile([0.5, 0.99, 0.999])
+        return {'p50': float(p50), 'p99': float(p99), 'p99.9': float(p999)}
+
+
+class OutlierFilter:
+    '''
+    Streaming IQR outlier removal, one pass over chunks of any stream.
+
+    Each chunk is added to the sketch first, then filtered with the
+    bounds of everything seen so far, so early chunks are judged on less
+    data but no sample is held back or read twice.
+    '''
+    def __init__(self, factor=1.5):
+        self.factor = factor
+        self.sketch = QuantileSketch()
+
+    def filter(self, chunk: np.ndarray):
+        self.sketch.update(chunk)
+        lower, upper = self.sketch.iqr_bounds(self.factor)
+        return chunk[(chunk >= lower) & (chunk <= upper)]
+
+
+class JitterHistogramBatch:
+    '''
+    Histograms for every row of a levels x samples matrix, built in one sort.
+
+    Rows may also be a ragged list of sample arrays, e.g. after outlier
+    removal. Distinct values of all rows are stored back to back as runs,
+    with rows[i] naming the row each run belongs to.
+    '''
+    def __init__(self, samples):
+        if isinstance(samples, np.ndarray) and samples.ndim == 2:
+            n_rows, row_length = samples.shape
+            sorted_values = np.sort(samples, axis=1).ravel()
+            sorted_rows = np.repeat(np.arange(n_rows), row_length)
+            self.totals = np.full(n_rows, row_length, dtype=np.int64)
+        else:
+            samples = [np.asarray(row) for row in samples]
+            n_rows = len(samples)
+            self.totals = np.array(
+                [len(row) for row in samples],
+                dtype=np.int64
+            )
+            values = np.concatenate(samples)
+            row_ids = np.repeat(np.arange(n_rows), self.totals)
+            order = np.lexsort((values, row_ids))
+            sorted_values = values[order]
+            sorted_rows = row_ids[order]
+
+        if np.any(self.totals == 0):
+            raise ValueError('Every row needs at least one sample.')
+
+        starts = np.flatnonzero(np.concatenate((
+            [True],
+            (sorted_values[1:] != sorted_values[:-1])
+            | (sorted_rows[1:] != sorted_rows[:-1])
+        )))
+
+        self.n_rows = n_rows
+        self.values = sorted_values[starts]
+        self.counts = np.diff(np.append(starts, len(sorted_values)))
+        self.rows = sorted_rows[starts]
+        self.distinct = np.bincount(self.rows, minlength=n_rows)
+        self.row_ends = np.cumsum(self.distinct)
+        self.row_starts = self.row_ends - self.distinct
+
+    def from_histograms(histograms):
+        '''Batch of already built JitterHistograms, without the sort.'''
+        batch = JitterHistogramBatch.__new__(JitterHistogramBatch)
+        batch.n_rows = len(histograms)
+        batch.totals = np.array(
+            [histogram.total for histogram in histograms],
+            dtype=np.int64
+        )
+        if np.any(batch.totals == 0):
+            raise ValueError('Every row needs at least one sample.')
+
+        batch.values = np.concatenate([h.values for h in histograms])
+        batch.counts = np.concatenate([h.counts for h in histograms])
+        batch.distinct = np.array(
+            [histogram.distinct for histogram in histograms],
+            dtype=np.int64
+        )
+        batch.rows = np.repeat(np.arange(batch.n_rows), batch.distinct)
+        batch.row_ends = np.cumsum(batch.distinct)
+        batch.row_starts = batch.row_ends - batch.distinct
+        return batch
+
+    @property
+    def probabilities(self):
+        return self.counts / self.totals[self.rows]
+
+    def max_counts(self):
+        return np.maximum.reduceat(self.counts, self.row_starts)
+
+    def row(self, index: int):
+        start, end = self.row_starts[index], self.row_ends[index]
+        return JitterHistogram().add_counts(
+            self.values[start:end],
+            self.counts[start:end]
+        )
+
+
+class Analysis:
+    def histogram(data):
+        '''Return data as a JitterHistogram, building one if needed.'''
+        if isinstance(data, JitterHistogram):
+            return data
+        return JitterHistogram(data)
+
+    def remove_outliers_iqr(data):
+        '''
+        Samples within 1.5 IQR of the quartiles. Quartiles come from a
+        QuantileSketch, so memory-mapped runs are read in chunks and only
+        the kept samples are copied.
+        '''
+        sketch = QuantileSketch(data)
+        lower_bound, upper_bound = sketch.iqr_bounds()
+
+        kept = []
+        for start in range(0, len(data), QuantileSketch.CHUNK_SIZE):
+            chunk = np.asarray(data[start:start + QuantileSketch.CHUNK_SIZE])
+            kept.append(chunk[(chunk >= lower_bound) & (chunk <= upper_bound)])
+        if not kept:
+            return np.asarray(data)[:0]
+        return np.concatenate(kept)
 
     def calculate_chi_square(data):
+        histogram = Analysis.histogram(data)
+
         # Bin the jitter values into frequency counts
-        num_bins = len(set(data)) # Unique jitter values determine bins
-        observed_freq, bin_edges = np.histogram(data, bins=num_bins)
+        num_bins = histogram.distinct # Unique jitter values determine bins
+        observed_freq, bin_edges = np.histogram(
+            histogram.values,
+            bins=num_bins,
+            weights=histogram.counts
+        )
+        observed_freq = observed_freq.astype(np.int64)
 
         # Expected frequencies assuming uniform distribution
         expected_freq = np.full_like(observed_freq, np.mean(observed_freq))
@@ -33,6 +312,9 @@ class Analysis:
         print(f'Expected Frequencies: {expected_freq}')
         print(f'\nChi-Square Statistic: {chi2_stat:.4f}')
 
+        # Deferred, scipy.stats is slow to import and only needed here
+        import scipy.stats as stats
+
         alpha = 0.05 # 5% significance level
         critical_value = stats.chi2.ppf(1.0 - alpha, num_bins - 1)
 
@@ -45,8 +327,7 @@ class Analysis:
 
     def calculate_shannon_entropy(data):
         '''Calculate Shannon entropy of a dataset.'''
-        values, counts = np.unique(data, return_counts=True)
-        probabilities = counts / counts.sum()
+        probabilities = Analysis.histogram(data).probabilities
 
         entropy = -np.sum(probabilities * np.log2(probabilities))
         print("Shannon entropy: ", entropy)
@@ -54,8 +335,7 @@ class Analysis:
         return entropy
 
     def calculate_min_entropy(data):
-        values, counts = np.unique(data, return_counts=True)
-        probabilities = counts / counts.sum()
+        probabilities = Analysis.histogram(data).probabilities
 
         min_entropy = -np.log2(np.max(probabilities))
         print("Min entropy: ", min_entropy)
@@ -64,16 +344,17 @@ class Analysis:
 
     def calculate_max_entropy(data):
         # Maybe log2(n^l), n = size, l = bits in each point
+        if isinstance(data, JitterHistogram):
+            return np.log2(data.total)
         return np.log2(len(data))
 
     def calculate_most_common_value(data):
-        values, counts = np.unique(data, return_counts=True)
-        probabilities = counts / counts.sum()
-        most_common_prob = np.max(probabilities)
+        histogram = Analysis.histogram(data)
+        most_common_prob = np.max(histogram.probabilities)
 
         upper_bound = most_common_prob + 2.576 * np.sqrt(
             (most_common_prob * (1 - most_common_prob))
-            / (len(data) - 1)
+            / (histogram.total - 1)
         )
 
         most_common_value = min(1, upper_bound)
@@ -81,6 +362,107 @@ class Analysis:
 
         return min_entropy_estimate
 
+    # Batch variants of the metrics above, one value per histogram row
+
+    def batch_chi_square(batch: JitterHistogramBatch):
+        # Same equal-width binning as np.histogram with one bin per
+        # distinct value, evaluated for all rows at once
+        num_bins = batch.distinct
+        first = batch.values[batch.row_starts].astype(np.float64)
+        last = batch.values[batch.row_ends - 1].astype(np.float64)
+        width = np.where(last > first, last - first, 1.0)
+
+        run_bins = num_bins[batch.rows]
+        run_first = first[batch.rows]
+        run_width = width[batch.rows]
+        values = batch.values.astype(np.float64)
+        bins = ((values - run_first) / run_width * run_bins).astype(np.int64)
+        bins = np.clip(bins, 0, run_bins - 1)
+
+        # Correct for rounding on the bin edges like np.histogram does
+        step = run_width / run_bins
+        bins -= (values < bins * step + run_first) & (bins > 0)
+        bins += (
+            (values >= (bins + 1) * step + run_first)
+            & (bins < run_bins - 1)
+        )
+
+        # chi2 = sum((o - e)^2 / e) = sum(o^2) / e - 2 * total + k * e,
+        # with e truncated to an integer like the full_like above
+        bin_offsets = np.cumsum(num_bins) - num_bins
+        observed = np.bincount(
+            bin_offsets[batch.rows] + bins,
+            weights=batch.counts,
+            minlength=num_bins.sum()
+        )
+        sum_squares = np.bincount(
+            np.repeat(np.arange(batch.n_rows), num_bins),
+            weights=observed ** 2,
+            minlength=batch.n_rows
+        )
+
+        expected = batch.totals // num_bins
+        return (
+            sum_squares / expected
+            - 2 * batch.totals
+            + num_bins * expected
+        )
+
+    def batch_shannon_entropy(batch: JitterHistogramBatch):
+        probabilities = batch.probabilities
+        return -np.bincount(
+            batch.rows,
+            weights=probabilities * np.log2(probabilities),
+            minlength=batch.n_rows
+        )
+
+    def batch_min_entropy(batch: JitterHistogramBatch):
+        return -np.log2(batch.max_counts() / batch.totals)
+
+    def batch_max_entropy(batch: JitterHistogramBatch):
+        return np.log2(batch.totals)
+
+    def batch_most_common_value(batch: JitterHistogramBatch):
+        most_common_prob = batch.max_counts() / batch.totals
+
+        upper_bound = most_common_prob + 2.576 * np.sqrt(
+            (most_common_prob * (1 - most_common_prob))
+            / (batch.totals - 1)
+        )
+
+        return -np.log2(np.minimum(1, upper_bound))
+
+    def evaluate(samples, metrics=None, labels=None):
+        '''
+        Compute metrics for every row of samples in one vectorized pass.
+
+        samples is a 2-D levels x samples array or a ragged list of sample
+        arrays. Returns a structured array with a 'label' and 'samples'
+        field per row, plus one float field per metric, named after the
+        MetricType member.
+        '''
+        if metrics is None:
+            metrics = list(MetricType)
+        if labels is None:
+            labels = [str(i) for i in range(len(samples))]
+
+        batch = JitterHistogramBatch(samples)
+
+        table = np.zeros(batch.n_rows, dtype=[
+            ('label', f'U{max(len(label) for label in labels)}'),
+            ('samples', np.int64),
+        ] + [(metric.name, np.float64) for metric in metrics])
+        table['label'] = labels
+        table['samples'] = batch.totals
+
+        for metric in metrics:
+            if metric.batch_func is not None:
+                table[metric.name] = metric.batch_func(batch)
+            else:
+                table[metric.name] = [metric.func(row) for row in samples]
+
+        return table
+
 
 class MetricTypeMeta(EnumMeta):
     def __getitem__(self, metric_name: str):
@@ -94,25 +476,42 @@ class MetricTypeMeta(EnumMeta):
 class MetricType(Enum, metaclass=MetricTypeMeta):
     Min_Entropy = (
         'Min Entropy',
-        Analysis.calculate_min_entropy
+        Analysis.calculate_min_entropy,
+        Analysis.batch_min_entropy
     )
     MostCommonValue = (
         'Most Common Value',
-        Analysis.calculate_most_common_value
+        Analysis.calculate_most_common_value,
+        Analysis.batch_most_common_value
     )
     Shannon_Entropy = (
         'Shannon Entropy',
-        Analysis.calculate_shannon_entropy
+        Analysis.calculate_shannon_entropy,
+        Analysis.batch_shannon_entropy
     )
     Chi_Square = (
         'Chi Square',
-        Analysis.calculate_chi_square
+        Analysis.calculate_chi_square,
+        Analysis.batch_chi_square
     )
     MaxEntropy = (
         'Max Entropy',
-        Analysis.calculate_max_entropy
+        Analysis.calculate_max_entropy,
+        Analysis.batch_max_entropy
     )
 
-    def __init__(self, metric_name: str, func):
+    # SP 800-90B non-IID estimators, see estimators.py
+    Collision = ('Collision Estimate', Estimators.calculate_collision)
+    Markov = ('Markov Estimate', Estimators.calculate_markov)
+    Compression = ('Compression Estimate', Estimators.calculate_compression)
+    T_Tuple = ('t-Tuple Estimate', Estimators.calculate_t_tuple)
+    LRS = ('LRS Estimate', Estimators.calculate_lrs)
+    MultiMCW = ('MultiMCW Prediction', Estimators.calculate_multi_mcw)
+    Lag = ('Lag Prediction', Estimators.calculate_lag)
+    MultiMMC = ('MultiMMC Prediction', Estimators.calculate_multi_mmc)
+    LZ78Y = ('LZ78Y Prediction', Estimators.calculate_lz78y)
+
+    def __init__(self, metric_name: str, func, batch_func=None):
         self.metric_name = metric_name
         self.func = func
+        self.batch_func = batch_func
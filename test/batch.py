@@ -0,0 +1,281 @@
+import argparse
+import itertools
+import json
+import os
+import time
+import numpy as np
+
+from analysis import Analysis, MetricType, QuantileSketch
+from collector import Collector, available_cpus
+from counters import counter_summary
+from operation import EvictionMode, OptimizationLevel, OperationType, TimerBackend
+from scheduler import TARGET_WIDTH, TIME_BUDGET, AdaptiveScheduler
+from store import ResultStore
+
+
+def parse_members(enum, names):
+    if names == ['all']:
+        return list(enum)
+    # Member names, the metaclass __getitem__ looks up display names
+    return [enum.__members__[name] for name in names]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='run.py batch',
+        description='Run a measurement matrix without the GUI.'
+    )
+    parser.add_argument(
+        '--operations',
+        nargs='+',
+        default=['all'],
+        help='OperationType members, e.g. CUBED_OP TSP_OP (default: all)'
+    )
+    parser.add_argument(
+        '--levels',
+        nargs='+',
+        default=['all'],
+        help='OptimizationLevel members, e.g. O0 O2 (default: all)'
+    )
+    parser.add_argument(
+        '--iterations',
+        nargs='+',
+        type=int,
+        default=[100000],
+        help='Sample counts to run for every cell'
+    )
+    parser.add_argument(
+        '--eviction',
+        nargs='+',
+        default=['NONE'],
+        choices=list(EvictionMode.__members__),
+        help='Cache state every sample starts from, one cell per mode '
+        '(default: NONE, warm)'
+    )
+    parser.add_argument(
+        '--metrics',
+        nargs='+',
+        default=['all'],
+        help='MetricType members, e.g. Min_Entropy (default: all)'
+    )
+    parser.add_argument(
+        '--timer',
+        default='RDTSC',
+        choices=list(TimerBackend.__members__),
+        help='Timer backend (default: RDTSC)'
+    )
+    parser.add_argument(
+        '--subtract-overhead',
+        action='store_true',
+        help='Subtract the calibrated timer overhead from every sample'
+    )
+    parser.add_argument(
+        '--counters',
+        action='store_true',
+        help='Record perf_event_open counter deltas of every sample'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='Maximum number of measurement processes'
+    )
+    parser.add_argument(
+        '--adaptive',
+        action='store_true',
+        help='Sample every cell until its metric intervals converge, '
+        'in place of --iterations'
+    )
+    parser.add_argument(
+        '--target-width',
+        type=float,
+        default=TARGET_WIDTH,
+        help='Adaptive: 95%% interval width every metric has to reach'
+    )
+    parser.add_argument(
+        '--time-budget',
+        type=float,
+        default=TIME_BUDGET,
+        help='Adaptive: seconds the whole matrix may take'
+    )
+    parser.add_argument(
+        '--output',
+        default=f'results-{time.strftime("%Y%m%d-%H%M%S")}',
+        help='Directory results are written to'
+    )
+    return parser.parse_args(argv)
+
+
+def save_cell(
+    store: ResultStore,
+    task,
+    samples: np.ndarray,
+    metrics: list,
+    counts: np.ndarray = None,
+    timer=TimerBackend.RDTSC,
+    subtract_overhead=False,
+    overhead=None,
+    intervals=None,
+    status=None
+):
+    operation, level, iterations, eviction = task
+    name = f'{operation.name}-{level.name}-{iterations}'
+    if eviction is not EvictionMode.NONE:
+        name += f'-{eviction.name.lower()}'
+
+    store.save(
+        name,
+        samples,
+        operation,
+        level,
+        iterations=iterations,
+        eviction=eviction.name,
+        timer=timer.name,
+        unit=timer.unit,
+        overhead_subtracted=subtract_overhead
+    )
+
+    row = Analysis.evaluate([samples], metrics, [level.name])[0]
+    record = {
+        'name': name,
+        'operation': operation.name,
+        'level': level.name,
+        'iterations': iterations,
+        'eviction': eviction.name,
+        'timer': timer.name,
+        'overhead': overhead._asdict() if overhead else None,
+        'overhead_subtracted': subtract_overhead,
+        'metrics': {metric.name: float(row[metric.name]) for metric in metrics},
+        'quantiles': QuantileSketch(samples).tails(),
+    }
+    # Adaptive runs, see scheduler.py
+    if intervals is not None:
+        record['intervals'] = {
+            name: interval._asdict() for name, interval in intervals.items()
+        }
+        record['status'] = status
+
+    # Counter columns sit in their own store, next to the samples
+    if counts is not None:
+        counter_store = ResultStore(os.path.join(store.directory, 'counters'))
+        for counter in counts.dtype.names:
+            counter_store.save(
+                f'{name}.{counter}',
+                counts[counter],
+                operation,
+                level,
+                iterations=iterations,
+                eviction=eviction.name,
+                counter=counter
+            )
+        record['counters'] = counter_summary(counts, len(samples))
+    with open(os.path.join(store.directory, 'metrics.jsonl'), 'a') as file:
+        file.write(json.dumps(record) + '\n')
+
+    return record
+
+
+def run_adaptive(args, store, collector, operations, levels, metrics, timer, evictions):
+    '''Sample every cell until its intervals converge, then save it.'''
+    scheduler = AdaptiveScheduler(
+        collector,
+        metrics,
+        args.target_width,
+        args.time_budget,
+        timer=timer,
+        subtract_overhead=args.subtract_overhead
+    )
+    cells = scheduler.cells(operations, levels, evictions)
+
+    def on_round(cells):
+        running = [cell for cell in cells if cell.status == 'running']
+        widest = max(
+            (max(cell.widths().values()) for cell in running),
+            default=0.0
+        )
+        print(
+            f'{len(cells) - len(running)}/{len(cells)} cells done,',
+            f'{sum(cell.samples for cell in cells)} samples,',
+            f'widest interval {widest:.4g}'
+        )
+
+    scheduler.run(cells, on_round)
+    for cell in cells:
+        samples, counts, intervals = cell.result()
+        record = save_cell(
+            store,
+            (cell.operation, cell.level, cell.samples, cell.eviction),
+            samples,
+            metrics,
+            counts,
+            timer,
+            args.subtract_overhead,
+            collector.overheads.get((cell.level.name, timer)),
+            intervals,
+            cell.status
+        )
+        print(f'{record["name"]} ({cell.status})', {
+            name: f'{record["metrics"][name]:.4g}, batches '
+            f'{interval.estimate:.4g} ± {(interval.high - interval.low) / 2:.2g}'
+            for name, interval in intervals.items()
+        })
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    operations = parse_members(OperationType, args.operations)
+    levels = parse_members(OptimizationLevel, args.levels)
+    metrics = parse_members(MetricType, args.metrics)
+    timer = TimerBackend.__members__[args.timer]
+    evictions = parse_members(EvictionMode, args.eviction)
+
+    cpus = available_cpus()
+    if len(cpus) > 1:
+        cpus = cpus[1:]
+    if args.workers is not None:
+        cpus = cpus[:max(1, args.workers)]
+
+    tasks = list(itertools.product(
+        operations,
+        levels,
+        args.iterations,
+        evictions
+    ))
+
+    store = ResultStore(args.output)
+    collector = Collector(cpus, counters=args.counters)
+    if args.adaptive:
+        print(
+            f'Running {len(operations) * len(levels) * len(evictions)} cells',
+            f'for up to {args.time_budget:g} s on CPUs {cpus} into {args.output}'
+        )
+        try:
+            run_adaptive(args, store, collector, operations, levels, metrics, timer, evictions)
+        finally:
+            collector.shutdown()
+        return
+
+    print(f'Running {len(tasks)} cells on CPUs {cpus} into {args.output}')
+    try:
+        for done, (task, samples, counts) in enumerate(
+            collector.as_completed(tasks, timer, args.subtract_overhead),
+            start=1
+        ):
+            record = save_cell(
+                store,
+                task,
+                samples,
+                metrics,
+                counts,
+                timer,
+                args.subtract_overhead,
+                collector.overheads.get((task[1].name, timer))
+            )
+            print(f'[{done}/{len(tasks)}] {record["name"]}', record['metrics'])
+    finally:
+        collector.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+
+from analysis import MetricType
+from batch import parse_members
+from ffi import FFIRegistry
+from operation import OptimizationLevel, OperationType, TimerBackend
+
+SIZES = (10000, 1000000, 10000000)
+SAMPLING_ITERATIONS = 1000000
+# Python-side calls timed for the cffi overhead, one sample each
+CALL_ITERATIONS = 100000
+REPEATS = 3
+# A result more than this fraction worse than its baseline is a regression
+THRESHOLD = 0.10
+
+
+def git_commit():
+    '''Commit of the working tree, with '-dirty' if tracked files changed.'''
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout.strip()
+        status = subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'],
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('-dirty' if status.strip() else '')
+
+
+def best_of(func, repeats=REPEATS):
+    '''Best and median wall-clock seconds of repeated calls.'''
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times), float(np.median(times))
+
+
+def result(value, unit, higher_is_better=False, median=None):
+    entry = {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+    if median is not None:
+        entry['median'] = median
+    return entry
+
+
+def sampling_benchmarks(registry, operations, levels, iterations, repeats):
+    '''Samples per second of the bulk loop, one entry per cell.'''
+    results = {}
+    for operation in operations:
+        for level in levels:
+            ffi = registry[level.name]
+            time_diffs = np.empty(iterations, dtype=np.uint64)
+            best, median = best_of(
+                lambda: operation.sample(ffi, time_diffs),
+                repeats
+            )
+            results[f'sampling/{operation.name}/{level.name}'] = result(
+                iterations / best,
+                'samples/s',
+                True,
+                iterations / median
+            )
+    return results
+
+
+def call_overhead_benchmarks(registry, operations, levels, iterations, repeats):
+    '''
+    Per-sample time of one cffi call per sample against one bulk call,
+    whose loop runs in C. The difference is what crossing cffi costs.
+    '''
+    results = {}
+    for operation in operations:
+        for level in levels:
+            ffi = registry[level.name]
+            ffi_func = getattr(ffi.lib, operation.operation_cdef)
+            bulk = ffi.lib.get_ticks_diff_timed_bulk
+            timer = TimerBackend.RDTSC.timer_id
+            time_diffs = np.empty(iterations, dtype=np.uint64)
+            buffer = ffi.ffi.from_buffer('uint64_t[]', time_diffs)
+
+            def per_call():
+                for _ in range(iterations):
+                    bulk(ffi_func, timer, buffer, 1)
+
+            call, _ = best_of(per_call, repeats)
+            in_c, _ = best_of(lambda: bulk(ffi_func, timer, buffer, iterations), repeats)
+
+            key = f'{operation.name}/{level.name}'
+            results[f'cffi_call/{key}'] = result(call / iterations * 1e9, 'ns')
+            results[f'in_c/{key}'] = result(in_c / iterations * 1e9, 'ns')
+            results[f'cffi_overhead/{key}'] = result(
+                (call - in_c) / iterations * 1e9,
+                'ns'
+            )
+    return results
+
+
+def metric_benchmarks(samples, metrics, sizes, repeats):
+    results = {}
+    for size in sizes:
+        data = samples[:size]
+        for metric in metrics:
+            # The scalar metrics print their value
+            with contextlib.redirect_stdout(io.StringIO()):
+                best, median = best_of(lambda: metric.func(data), repeats)
+            results[f'metric/{metric.name}/{size}'] = result(best, 's', median=median)
+    return results
+
+
+def graph_benchmarks(samples, graphs, sizes, repeats):
+    '''Wall-clock of a renderer plus one Agg draw of its figure.'''
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    def render(graph, indices, values):
+        fig = Figure(figsize=(8, 4))
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        graph.func(ax, indices, values, 'bench', 'tab:blue')
+        fig.canvas.draw()
+
+    results = {}
+    for size in sizes:
+        values = samples[:size]
+        indices = np.arange(len(values))
+        for graph in graphs:
+            best, median = best_of(
+                lambda: render(graph, indices, values),
+                repeats
+            )
+            results[f'graph/{graph.name}/{size}'] = result(best, 's', median=median)
+    return results
+
+
+def compare(baseline: dict, current: dict, threshold=THRESHOLD):
+    '''
+    Relative change of every result both runs have, positive when worse.
+
+    Returns (key, baseline value, current value, change, regressed) rows.
+    '''
+    rows = []
+    for key, old in sorted(baseline['results'].items()):
+        new = current['results'].get(key)
+        if new is None or not old['value']:
+            continue
+        change = (new['value'] - old['value']) / abs(old['value'])
+        if old['higher_is_better']:
+            change = -change
+        rows.append((key, old['value'], new['value'], change, change > threshold))
+    return rows
+
+
+def print_comparison(rows, baseline, current):
+    print(f'baseline {baseline["host"]} {baseline["commit"]}')
+    print(f'current  {current["host"]} {current["commit"]}')
+    for key, old, new, change, regressed in rows:
+        flag = 'REGRESSION' if regressed else ''
+        print(f'{key:<48} {old:>14.6g} {new:>14.6g} {change:>+8.1%} {flag}')
+
+
+def load(path: str):
+    with open(path) as file:
+        return json.load(file)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='run.py bench',
+        description='Benchmark sampling, metrics and renderers.'
+    )
+    parser.add_argument('--operations', nargs='+', default=['all'])
+    parser.add_argument('--levels', nargs='+', default=['all'])
+    parser.add_argument('--metrics', nargs='+', default=['all'])
+    parser.add_argument('--graphs', nargs='+', default=['all'])
+    parser.add_argument('--sizes', nargs='+', type=int, default=list(SIZES))
+    parser.add_argument('--iterations', type=int, default=SAMPLING_ITERATIONS)
+    parser.add_argument('--repeats', type=int, default=REPEATS)
+    parser.add_argument(
+        '--skip',
+        nargs='+',
+        default=[],
+        choices=['sampling', 'cffi', 'metrics', 'graphs']
+    )
+    parser.add_argument(
+        '--output',
+        default='benchmarks',
+        help='Results go to <output>/<host>/<commit>.json'
+    )
+    parser.add_argument(
+        '--compare',
+        nargs='+',
+        metavar='FILE',
+        help='BASELINE [CURRENT]: flag regressions of CURRENT, or of this run'
+    )
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.compare and len(args.compare) == 2:
+        baseline, current = load(args.compare[0]), load(args.compare[1])
+    else:
+        operations = parse_members(OperationType, args.operations)
+        levels = parse_members(OptimizationLevel, args.levels)
+        registry = FFIRegistry(OptimizationLevel)
+
+        results = {}
+        if 'sampling' not in args.skip:
+            results.update(sampling_benchmarks(
+                registry, operations, levels, args.iterations, args.repeats
+            ))
+        if 'cffi' not in args.skip:
+            results.update(call_overhead_benchmarks(
+                registry,
+                operations,
+                levels,
+                min(args.iterations, CALL_ITERATIONS),
+                args.repeats
+            ))
+        if {'metrics', 'graphs'} - set(args.skip):
+            samples = operations[0].run(registry[levels[0].name], max(args.sizes))
+        if 'metrics' not in args.skip:
+            results.update(metric_benchmarks(
+                samples,
+                parse_members(MetricType, args.metrics),
+                args.sizes,
+                args.repeats
+            ))
+        if 'graphs' not in args.skip:
+            # Only imported here, gui.py pulls in tkinter
+            from gui import GraphType
+
+            results.update(graph_benchmarks(
+                samples,
+                parse_members(GraphType, args.graphs),
+                args.sizes,
+                args.repeats
+            ))
+
+        current = {
+            'host': platform.node(),
+            'commit': git_commit(),
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'results': results,
+        }
+        directory = os.path.join(args.output, current['host'])
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{current["commit"]}.json')
+        with open(path, 'w') as file:
+            json.dump(current, file, indent=2)
+        print(f'Wrote {len(results)} results to {path}')
+
+        if not args.compare:
+            return
+        baseline = load(args.compare[0])
+
+    rows = compare(baseline, current, args.threshold)
+    print_comparison(rows, baseline, current)
+    if any(row[-1] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
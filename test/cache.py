@@ -0,0 +1,251 @@
+import contextlib
+import hashlib
+import os
+import threading
+from collections import OrderedDict, namedtuple
+import numpy as np
+
+from ffi import get_lib
+from operation import OptimizationLevel, OperationType
+from store import ResultStore
+
+# Memory the cached samples and counts may take before the least
+# recently used entries are dropped
+MEMORY_BUDGET = 1 << 30
+# Size of the on-disk tier, evicted by last use the same way
+DISK_BUDGET = 8 << 30
+# Default disk tier of the GUI, removed with the libraries by clean.sh
+DISK_DIRECTORY = 'noise-sources/build/cache'
+
+CacheKey = namedtuple(
+    'CacheKey',
+    [
+        'operation',
+        'level',
+        'build_hash',
+        'iterations',
+        'eviction',
+        'timer',
+        'subtract_overhead',
+    ]
+)
+
+
+def build_hash(level):
+    '''Hash run.py recorded for the library of a level, see is_stale.'''
+    lib_path = get_lib(level.lib_name)
+    try:
+        with open(lib_path + '.hash') as file:
+            return file.read().strip()
+    except OSError:
+        # Built by hand, fall back to the library file itself
+        status = os.stat(lib_path)
+        return f'{status.st_size}-{status.st_mtime_ns}'
+
+
+def cache_key(operation, level, iterations, eviction, timer, subtract_overhead):
+    return CacheKey(
+        operation.name,
+        level.name,
+        build_hash(level),
+        iterations,
+        eviction.name,
+        timer.name,
+        bool(subtract_overhead)
+    )
+
+
+def entry_size(samples, counts):
+    return samples.nbytes + (counts.nbytes if counts is not None else 0)
+
+
+class MeasurementCache:
+    '''
+    Samples and counter tables of past runs, by the parameters that
+    produced them.
+
+    The memory tier is an LRU bounded by memory_budget bytes. With a
+    directory, entries are also written there as result columns and
+    reopened memory-mapped after they left memory, or in a later session.
+    The disk tier's index of entry sizes is built from the directory once
+    and kept up to date as entries are written, used and dropped.
+    Keys hold the build hash of the library, so rebuilding a level with
+    other flags or sources never returns its old samples. Cached arrays
+    are read-only, since every graph of the same run shares them.
+    '''
+    def __init__(
+        self,
+        memory_budget=MEMORY_BUDGET,
+        directory=None,
+        disk_budget=DISK_BUDGET
+    ):
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.store = ResultStore(directory) if directory else None
+        self.counter_store = (
+            ResultStore(os.path.join(directory, 'counters'))
+            if directory else None
+        )
+        # (size, paths) of every entry on disk, least recently used first
+        self.disk_entries = OrderedDict()
+        self.disk_size = 0
+        if self.store is not None:
+            self.index_disk()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def index_disk(self):
+        columns = {}
+        for column in self.counter_store.names():
+            name = column.split('.', 1)[0]
+            columns.setdefault(name, []).append(self.counter_store.path(column))
+
+        entries = []
+        for name in self.store.names():
+            paths = [self.store.path(name)] + columns.get(name, [])
+            size = sum(os.path.getsize(path) for path in paths)
+            entries.append((os.path.getmtime(paths[0]), name, size, paths))
+
+        for _, name, size, paths in sorted(entries):
+            self.disk_entries[name] = (size, paths)
+            self.disk_size += size
+
+    def name(self, key: CacheKey):
+        return hashlib.sha256(repr(tuple(key)).encode()).hexdigest()[:32]
+
+    def get(self, key: CacheKey, counters=False):
+        '''
+        (samples, counts) of key, or None when it has to be collected.
+        With counters, runs stored without counts, e.g. live runs, miss.
+        '''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if counters and entry[1] is None:
+                    self.misses += 1
+                    return None
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        entry = self.load(key)
+        with self.lock:
+            if entry is None or (counters and entry[1] is None):
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self.remember(key, entry)
+        return entry
+
+    def put(self, key: CacheKey, samples: np.ndarray, counts=None):
+        samples.flags.writeable = False
+        if counts is not None:
+            counts.flags.writeable = False
+
+        with self.lock:
+            self.remember(key, (samples, counts))
+        if self.store is not None:
+            self.save(key, samples, counts)
+
+    def remember(self, key, entry):
+        size = entry_size(*entry)
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= entry_size(*old)
+        if size > self.memory_budget:
+            return
+
+        self.entries[key] = entry
+        self.size += size
+        while self.size > self.memory_budget:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= entry_size(*evicted)
+
+    def save(self, key, samples, counts):
+        name = self.name(key)
+        operation = OperationType.__members__[key.operation]
+        level = OptimizationLevel.__members__[key.level]
+        names = list(counts.dtype.names) if counts is not None else None
+        if counts is not None:
+            for counter in names:
+                self.counter_store.save(
+                    f'{name}.{counter}',
+                    counts[counter],
+                    operation,
+                    level
+                )
+        # Samples last, a column only counts as cached once it is closed
+        self.store.save(
+            name,
+            samples,
+            operation,
+            level,
+            key=key._asdict(),
+            counters=names
+        )
+
+        paths = [self.store.path(name)] + [
+            self.counter_store.path(f'{name}.{counter}')
+            for counter in names or []
+        ]
+        size = sum(os.path.getsize(path) for path in paths)
+        with self.lock:
+            old = self.disk_entries.pop(name, None)
+            if old is not None:
+                self.disk_size -= old[0]
+                # Counter columns of an older run the new one has no counts for
+                for path in set(old[1]) - set(paths):
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(path)
+            self.disk_entries[name] = (size, paths)
+            self.disk_size += size
+            self.trim_disk()
+
+    def load(self, key):
+        if self.store is None:
+            return None
+
+        name = self.name(key)
+        try:
+            metadata = self.store.metadata(name)
+        except OSError:
+            return None
+        if metadata.get('key') != key._asdict() or metadata.get('finished') is None:
+            return None
+
+        samples, _ = self.store.load(name)
+        counts = None
+        if metadata.get('counters') is not None:
+            columns = [
+                self.counter_store.load(f'{name}.{counter}')[0]
+                for counter in metadata['counters']
+            ]
+            counts = np.empty(
+                len(samples),
+                dtype=[(counter, np.uint64) for counter in metadata['counters']]
+            )
+            for counter, column in zip(metadata['counters'], columns):
+                counts[counter] = column
+            counts.flags.writeable = False
+
+        # Last use, for trim_disk and the index of a later session
+        os.utime(self.store.path(name))
+        with self.lock:
+            if name in self.disk_entries:
+                self.disk_entries.move_to_end(name)
+        return samples, counts
+
+    def trim_disk(self):
+        '''Drop the least recently used entries beyond disk_budget, under the lock.'''
+        while self.disk_size > self.disk_budget and self.disk_entries:
+            _, (size, paths) = self.disk_entries.popitem(last=False)
+            for path in paths:
+                # Another session may have dropped it already
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+            self.disk_size -= size
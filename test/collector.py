@@ -0,0 +1,257 @@
+import os
+import multiprocessing
+from concurrent import futures
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+from counters import COUNTERS, CounterGroup, counts_table
+from ffi import FFIRegistry
+from operation import EvictionMode, OptimizationLevel, OperationType, TimerBackend
+
+
+def available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def pin_to_cpu(cpu):
+    if cpu is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, {cpu})
+
+
+# Per worker process state, only the libraries this worker actually
+# measures get opened
+worker_ffi = FFIRegistry(OptimizationLevel)
+worker_counters = {}
+
+
+def init_worker(cpu_queue):
+    pin_to_cpu(cpu_queue.get())
+
+
+def collect_worker(
+    operation: OperationType,
+    level: OptimizationLevel,
+    iterations: int,
+    eviction: EvictionMode,
+    shm_name: str,
+    counters=False,
+    timer=TimerBackend.RDTSC,
+    subtract_overhead=False
+):
+    '''Returns the available counters and the timer calibration.'''
+    # Spawned workers share the parent's resource tracker, which unlinks
+    # the segment if the parent dies
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        ffi = worker_ffi[level.name]
+        # Calibrated on the worker's own CPU, before sampling
+        calibration = timer.calibrate(ffi)
+
+        time_diffs = np.ndarray(iterations, dtype=np.uint64, buffer=shm.buf)
+        if not counters:
+            operation.sample(ffi, time_diffs, eviction, timer, subtract_overhead)
+            del time_diffs
+            return None, calibration
+
+        # Counter deltas of every sample follow the samples
+        counts = np.ndarray(
+            (iterations, len(COUNTERS)),
+            dtype=np.uint64,
+            buffer=shm.buf,
+            offset=time_diffs.nbytes
+        )
+        if level.name not in worker_counters:
+            worker_counters[level.name] = CounterGroup(ffi)
+        group = worker_counters[level.name]
+        # Nothing to read when perf_event_open refused every counter, the
+        # plain path leaves out the reads and counts get no columns
+        if not group.available:
+            operation.sample(ffi, time_diffs, eviction, timer, subtract_overhead)
+            del time_diffs, counts
+            return group.available, calibration
+        group.sample(
+            operation,
+            time_diffs,
+            counts,
+            eviction=eviction,
+            timer=timer,
+            subtract_overhead=subtract_overhead
+        )
+        del time_diffs, counts
+        return group.available, calibration
+    finally:
+        shm.close()
+
+
+class Collector:
+    '''
+    Measures (operation, level) pairs in a pool of worker processes.
+
+    Each worker is pinned to its own CPU and writes samples straight into
+    a shared memory segment owned by this process. By default the first
+    available CPU is left to the calling process (GUI).
+
+    With counters, every sample also gets the deltas of the worker's
+    perf_event_open counters, see counters.py.
+    '''
+    def __init__(self, cpus=None, counters=False):
+        if cpus is None:
+            cpus = available_cpus()
+            if len(cpus) > 1:
+                cpus = cpus[1:]
+
+        self.cpus = list(cpus)
+        self.counters = counters
+        # Timer calibration of every (level name, TimerBackend) measured
+        self.overheads = {}
+        self.executor = None
+
+    def start(self):
+        if self.executor is None:
+            context = multiprocessing.get_context('spawn')
+            cpu_queue = context.Queue()
+            for cpu in self.cpus:
+                cpu_queue.put(cpu)
+
+            self.executor = ProcessPoolExecutor(
+                max_workers=len(self.cpus),
+                mp_context=context,
+                initializer=init_worker,
+                initargs=(cpu_queue,)
+            )
+
+        return self.executor
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def as_completed(
+        self,
+        tasks,
+        timer=TimerBackend.RDTSC,
+        subtract_overhead=False,
+        counters=None
+    ):
+        '''
+        Run (operation, level, iterations, eviction) tasks in parallel.
+
+        Yields (task, samples, counts) as each task finishes, so callers
+        can process or store results while the remaining tasks still run.
+        counts is a structured array with one field per available
+        counter, or None without counters. counters overrides the
+        collector's setting for these tasks. At most one task per worker
+        holds a shared memory segment at a time.
+        '''
+        executor = self.start()
+        if counters is None:
+            counters = self.counters
+        columns = 1 + len(COUNTERS) if counters else 1
+        pending = iter(tasks)
+
+        def submit():
+            task = next(pending, None)
+            if task is None:
+                return False
+            operation, level, iterations, eviction = task
+            shm = shared_memory.SharedMemory(
+                create=True,
+                size=max(1, iterations * columns * np.dtype(np.uint64).itemsize)
+            )
+            try:
+                future = executor.submit(
+                    collect_worker,
+                    operation,
+                    level,
+                    iterations,
+                    eviction,
+                    shm.name,
+                    counters,
+                    timer,
+                    subtract_overhead
+                )
+            except BaseException:
+                shm.close()
+                shm.unlink()
+                raise
+            segments[future] = (task, shm)
+            return True
+
+        # One task in flight per worker, so shared memory holds at most
+        # that many cells at once however long the task list is
+        segments = {}
+        try:
+            while len(segments) < len(self.cpus) and submit():
+                pass
+
+            while segments:
+                done, _ = futures.wait(segments, return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    task, shm = segments.pop(future)
+                    try:
+                        available, calibration = future.result()
+                        self.overheads[task[1].name, timer] = calibration
+                        iterations = task[2]
+                        samples = np.ndarray(
+                            iterations,
+                            dtype=np.uint64,
+                            buffer=shm.buf
+                        ).copy()
+
+                        counts = None
+                        if available is not None:
+                            matrix = np.ndarray(
+                                (iterations, len(COUNTERS)),
+                                dtype=np.uint64,
+                                buffer=shm.buf,
+                                offset=samples.nbytes
+                            )
+                            counts = counts_table(matrix, available)
+                            del matrix
+                    finally:
+                        shm.close()
+                        shm.unlink()
+
+                    submit()
+                    yield task, samples, counts
+        finally:
+            for task, shm in segments.values():
+                shm.close()
+                shm.unlink()
+
+    def collect(
+        self,
+        tasks,
+        iterations: int,
+        eviction=EvictionMode.NONE,
+        timer=TimerBackend.RDTSC,
+        subtract_overhead=False,
+        counters=None
+    ):
+        '''
+        Run every (operation, level) task in parallel.
+
+        Returns one uint64 array of samples per task, in task order, and
+        the matching counts (None without counters).
+        '''
+        tasks = [
+            (operation, level, iterations, eviction)
+            for operation, level in tasks
+        ]
+        results = {
+            task: (samples, counts)
+            for task, samples, counts in self.as_completed(
+                tasks,
+                timer,
+                subtract_overhead,
+                counters
+            )
+        }
+        return (
+            [results[task][0] for task in tasks],
+            [results[task][1] for task in tasks]
+        )
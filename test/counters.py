@@ -0,0 +1,115 @@
+import numpy as np
+
+from ffi import FFI
+from operation import EvictionMode, TimerBackend
+
+# Counter columns, in the order of the COUNTER_* constants in lib.h
+COUNTERS = (
+    'l1d_misses',
+    'l1i_misses',
+    'llc_misses',
+    'branch_misses',
+    'context_switches',
+    'page_faults',
+    'cpu_migrations',
+)
+HARDWARE_COUNTERS = COUNTERS[:4]
+
+
+def counts_dtype(names):
+    return np.dtype([(name, np.uint64) for name in names])
+
+
+def counts_table(counts: np.ndarray, names):
+    '''The named columns of a counts matrix as a structured array.'''
+    table = np.empty(len(counts), dtype=counts_dtype(names))
+    for name in names:
+        table[name] = counts[:, COUNTERS.index(name)]
+    return table
+
+
+class CounterGroup:
+    '''
+    perf_event_open counters of the calling thread, read in one syscall.
+
+    Counters the PMU or perf_event_paranoid refuses are left out, so on
+    VMs and locked down hosts only the software events (context switches,
+    page faults, migrations) remain. Off Linux nothing is available and
+    sampling still works, with empty counts.
+    '''
+    def __init__(self, ffi: FFI):
+        self.ffi = ffi
+        self.group = ffi.ffi.new('struct counter_group *')
+        ffi.lib.counters_open(self.group)
+
+    @property
+    def available(self):
+        return [
+            name for i, name in enumerate(COUNTERS)
+            if self.group.available & (1 << i)
+        ]
+
+    @property
+    def software(self):
+        return not set(self.available) & set(HARDWARE_COUNTERS)
+
+    def close(self):
+        self.ffi.lib.counters_close(self.group)
+
+    def sample(
+        self,
+        operation,
+        time_diffs: np.ndarray,
+        counts: np.ndarray = None,
+        every=1,
+        eviction=EvictionMode.NONE,
+        timer=TimerBackend.RDTSC,
+        subtract_overhead=False
+    ):
+        '''
+        Fill time_diffs like OperationType.sample, and counts with the
+        counter deltas of every run of `every` samples.
+
+        counts is a (ceil(len / every) x len(COUNTERS)) uint64 matrix,
+        allocated when not given. Columns of unavailable counters are 0.
+        With an eviction mode, counters are read around every sample, so
+        they leave out the eviction.
+        '''
+        rows = -(-len(time_diffs) // every)
+        if counts is None:
+            counts = np.zeros((rows, len(COUNTERS)), dtype=np.uint64)
+
+        if self.ffi.lib.get_ticks_diff_counted_bulk(
+            getattr(self.ffi.lib, operation.operation_cdef),
+            timer.timer_id,
+            self.group,
+            eviction.state(self.ffi, operation),
+            self.ffi.ffi.from_buffer('uint64_t[]', time_diffs),
+            self.ffi.ffi.from_buffer('uint64_t[]', counts),
+            len(time_diffs),
+            every
+        ) < 0:
+            raise ValueError(f'Unknown timer: {timer}')
+
+        if subtract_overhead:
+            timer.subtract_overhead(self.ffi, time_diffs)
+
+        return time_diffs, counts
+
+    def table(self, counts: np.ndarray):
+        return counts_table(counts, self.available)
+
+
+def counter_summary(table: np.ndarray, samples=None):
+    '''
+    Mean of every counter column per sample. Rows of every > 1 cover
+    several samples each, so pass the number of samples the table covers,
+    which is its length by default.
+    '''
+    if table is None or len(table) == 0:
+        return {}
+    samples = samples or len(table)
+    return {
+        name: float(table[name].sum(dtype=np.float64)) / samples
+        for name in table.dtype.names
+    }
@@ -0,0 +1,370 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import socket
+import threading
+import time
+from collections import deque
+import numpy as np
+
+from extractor import Conditioner, Extractor
+from health import HealthMonitor, claimed_min_entropy, health_cutoffs
+
+DEFAULT_SOCKET = '/tmp/jitter2infinity.sock'
+# The collector refills once the pool drops below the low watermark and
+# stops at the high one
+LOW_WATERMARK = 1 << 16
+HIGH_WATERMARK = 1 << 20
+CHUNK_SIZE = 1 << 16
+# Largest GET a client may send, larger reads are split by the client
+MAX_REQUEST = 1 << 20
+# Chunks the claimed min-entropy is estimated over, unless given
+STARTUP_CHUNKS = 4
+# Chunks in a row that fail a health test before the pool stops serving
+MAX_CONSECUTIVE_FAILURES = 3
+# Refills kept for the latency statistics
+LATENCY_HISTORY = 1024
+
+
+class EntropyPool:
+    '''
+    Byte pool between the collector thread and the asyncio clients.
+
+    The collector appends under a lock and wakes waiting clients through
+    the event loop. Clients take what is there and only wait when the pool
+    is empty, so a request costs a buffer copy while the pool is filled.
+    '''
+    def __init__(self, loop, low=LOW_WATERMARK, high=HIGH_WATERMARK):
+        self.loop = loop
+        self.low = low
+        self.high = high
+        self.buffer = bytearray()
+        self.lock = threading.Lock()
+        self.refill = threading.Event()
+        self.filled = asyncio.Event()
+        self.error = None
+
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.refill.set()
+
+    @property
+    def level(self):
+        return len(self.buffer)
+
+    def put(self, data: bytes):
+        with self.lock:
+            self.buffer += data
+            self.bytes_in += len(data)
+        self.loop.call_soon_threadsafe(self.filled.set)
+
+    def fail(self, error: str):
+        self.error = error
+        self.loop.call_soon_threadsafe(self.filled.set)
+
+    def take(self, size: int):
+        with self.lock:
+            data = bytes(self.buffer[:size])
+            del self.buffer[:size]
+            self.bytes_out += len(data)
+            if len(self.buffer) < self.low:
+                self.refill.set()
+        return data
+
+    async def read(self, size: int):
+        parts = []
+        while size > 0:
+            if self.error is not None:
+                raise RuntimeError(self.error)
+            data = self.take(size)
+            parts.append(data)
+            size -= len(data)
+            if size > 0:
+                # Set from the loop, so a put before this clear still wakes
+                self.filled.clear()
+                self.refill.set()
+                await self.filled.wait()
+        return b''.join(parts)
+
+
+class PoolCollector(threading.Thread):
+    '''
+    Samples one operation and level into an EntropyPool.
+
+    Every chunk is health tested while it is sampled, in C, and only
+    reaches the extractor if it passed.
+    A chunk that fails is dropped, and MAX_CONSECUTIVE_FAILURES of them
+    in a row stop the pool, as a persistent failure of the noise source.
+    '''
+    def __init__(
+        self,
+        pool: EntropyPool,
+        operation,
+        ffi,
+        extractor: Extractor,
+        min_entropy=None,
+        chunk_size=CHUNK_SIZE
+    ):
+        super().__init__(daemon=True)
+        self.pool = pool
+        self.operation = operation
+        self.ffi = ffi
+        self.extractor = extractor
+        self.min_entropy = min_entropy
+        self.chunk_size = chunk_size
+        self.stopped = threading.Event()
+
+        self.samples = 0
+        self.dropped_chunks = 0
+        self.refills = 0
+        self.refill_latencies = deque(maxlen=LATENCY_HISTORY)
+        self.health = None
+
+    def run(self):
+        chunk = np.empty(self.chunk_size, dtype=np.uint64)
+
+        # The first chunks set the claim unless given. The next is the
+        # start-up test, and must pass like every later chunk
+        if self.min_entropy is None:
+            self.min_entropy = claimed_min_entropy(
+                self.operation.stream(
+                    self.ffi,
+                    self.chunk_size,
+                    STARTUP_CHUNKS * self.chunk_size
+                )
+            )
+        # No estimate could be made, e.g. chunks too short for every
+        # estimator, and health cutoffs need a positive claim
+        if not math.isfinite(self.min_entropy) or self.min_entropy <= 0:
+            self.pool.fail(f'no usable min-entropy claim: {self.min_entropy}')
+            return
+        # Output is conditioned at the entropy the health tests assume
+        self.extractor.sample_entropy = self.min_entropy
+        self.health = HealthMonitor(self.ffi, health_cutoffs(self.min_entropy))
+        _, failed = self.health.sample(self.operation, chunk)
+        self.samples += len(chunk)
+        if failed:
+            self.pool.fail('start-up health test failure')
+            return
+        self.pool.put(self.extractor.process(chunk))
+
+        failures = 0
+        while not self.stopped.is_set():
+            if not self.pool.refill.wait(0.1):
+                continue
+
+            # Latency until the pool is back above the low watermark, the
+            # part of a refill clients may be waiting on
+            start = time.perf_counter()
+            recovered = False
+            while self.pool.level < self.pool.high and not self.stopped.is_set():
+                if not recovered and self.pool.level >= self.pool.low:
+                    recovered = True
+                    self.refills += 1
+                    self.refill_latencies.append(time.perf_counter() - start)
+                _, failed = self.health.sample(self.operation, chunk)
+                self.samples += len(chunk)
+                if failed:
+                    self.dropped_chunks += 1
+                    failures += 1
+                    if failures >= MAX_CONSECUTIVE_FAILURES:
+                        self.pool.fail('health test failure')
+                        return
+                    continue
+                failures = 0
+                self.pool.put(self.extractor.process(chunk))
+
+            self.pool.refill.clear()
+
+    def stop(self):
+        self.stopped.set()
+
+
+class EntropyDaemon:
+    '''
+    Serves pool bytes over a Unix domain socket, one line per request:
+
+        GET <n>    answered by 'OK <n>' and n bytes, or 'ERR <reason>'
+        STATS      answered by one line of JSON
+    '''
+    def __init__(self, path: str, pool: EntropyPool, collector: PoolCollector):
+        self.path = path
+        self.pool = pool
+        self.collector = collector
+        self.started = time.monotonic()
+        self.clients = 0
+        self.requests = 0
+
+    async def handle(self, reader, writer):
+        self.clients += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write(await self.respond(line.decode().split()))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.clients -= 1
+            writer.close()
+
+    async def respond(self, words):
+        self.requests += 1
+        if words == ['STATS']:
+            return json.dumps(self.stats()).encode() + b'\n'
+        if len(words) != 2 or words[0] != 'GET' or not words[1].isdigit():
+            return b'ERR bad request\n'
+
+        size = int(words[1])
+        if size > MAX_REQUEST:
+            return f'ERR at most {MAX_REQUEST} bytes per request\n'.encode()
+        try:
+            data = await self.pool.read(size)
+        except RuntimeError as error:
+            return f'ERR {error}\n'.encode()
+        return f'OK {len(data)}\n'.encode() + data
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        latencies = np.array(self.collector.refill_latencies)
+        health = self.collector.health
+        return {
+            'uptime': elapsed,
+            'clients': self.clients,
+            'requests': self.requests,
+            'pool_level': self.pool.level,
+            'low_watermark': self.pool.low,
+            'high_watermark': self.pool.high,
+            'bytes_in': self.pool.bytes_in,
+            'bytes_out': self.pool.bytes_out,
+            'collected_bytes_per_second': self.pool.bytes_in / elapsed,
+            'served_bytes_per_second': self.pool.bytes_out / elapsed,
+            'samples': self.collector.samples,
+            'refills': self.collector.refills,
+            'refill_latency': {
+                'mean': float(latencies.mean()) if len(latencies) else None,
+                'p50': float(np.median(latencies)) if len(latencies) else None,
+                'max': float(latencies.max()) if len(latencies) else None,
+            },
+            'min_entropy': self.collector.min_entropy,
+            'entropy_per_bit': self.collector.extractor.entropy_per_bit,
+            'health': {
+                'cutoffs': health.cutoffs._asdict() if health else None,
+                'failures': health.failures if health else None,
+                'dropped_chunks': self.collector.dropped_chunks,
+                'error': self.pool.error,
+            },
+        }
+
+    async def serve(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        server = await asyncio.start_unix_server(self.handle, path=self.path)
+        async with server:
+            await server.serve_forever()
+
+
+def request(path: str, line: str):
+    '''Send one request line, returning the reply header and its socket.'''
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(path)
+    client.sendall(line.encode() + b'\n')
+    stream = client.makefile('rb')
+    return stream.readline().decode().rstrip('\n'), stream, client
+
+
+def read_bytes(path: str, size: int):
+    '''Read size bytes from a running daemon.'''
+    parts = []
+    while size > 0:
+        header, stream, client = request(path, f'GET {min(size, MAX_REQUEST)}')
+        with client, stream:
+            if not header.startswith('OK '):
+                raise RuntimeError(header)
+            parts.append(stream.read(int(header[3:])))
+        size -= len(parts[-1])
+    return b''.join(parts)
+
+
+def read_stats(path: str):
+    header, stream, client = request(path, 'STATS')
+    with client, stream:
+        return json.loads(header)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='run.py daemon',
+        description='Serve conditioned jitter bytes over a Unix socket.'
+    )
+    parser.add_argument('--socket', default=DEFAULT_SOCKET)
+    parser.add_argument('--operation', default='CUBED_OP')
+    parser.add_argument('--level', default='O2')
+    parser.add_argument('--low', type=int, default=LOW_WATERMARK)
+    parser.add_argument('--high', type=int, default=HIGH_WATERMARK)
+    parser.add_argument(
+        '--conditioner',
+        default='SHA3_256',
+        choices=list(Conditioner.__members__)
+    )
+    parser.add_argument(
+        '--min-entropy',
+        type=float,
+        default=None,
+        help='Claimed min-entropy per sample (default: start-up estimate)'
+    )
+    parser.add_argument(
+        '--get',
+        type=int,
+        help='Client: print this many bytes of a running daemon as hex'
+    )
+    parser.add_argument(
+        '--stats',
+        action='store_true',
+        help='Client: print the statistics of a running daemon'
+    )
+    args = parser.parse_args(argv)
+
+    if args.get is not None:
+        print(read_bytes(args.socket, args.get).hex())
+        return
+    if args.stats:
+        print(json.dumps(read_stats(args.socket), indent=2))
+        return
+
+    from ffi import FFIRegistry
+    from operation import OptimizationLevel, OperationType
+
+    registry = FFIRegistry(OptimizationLevel)
+    ffi = registry[OptimizationLevel.__members__[args.level].name]
+
+    async def serve():
+        pool = EntropyPool(asyncio.get_running_loop(), args.low, args.high)
+        collector = PoolCollector(
+            pool,
+            OperationType.__members__[args.operation],
+            ffi,
+            Extractor(conditioner=Conditioner.__members__[args.conditioner]),
+            args.min_entropy
+        )
+        collector.start()
+        print(f'Serving on {args.socket}')
+        try:
+            await EntropyDaemon(args.socket, pool, collector).serve()
+        finally:
+            collector.stop()
+            if os.path.exists(args.socket):
+                os.unlink(args.socket)
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
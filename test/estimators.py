@@ -0,0 +1,599 @@
+import hashlib
+import math
+import numpy as np
+
+# Upper bound multiplier of the 99% confidence intervals in SP 800-90B
+Z_99 = 2.576
+
+
+def upper_bound(p: float, n: int):
+    return min(1.0, p + Z_99 * math.sqrt(p * (1 - p) / (n - 1)))
+
+
+def bisect(func, target: float, low: float, high: float, iterations=60):
+    '''Solve func(p) = target for a func decreasing on [low, high].'''
+    for _ in range(iterations):
+        middle = (low + high) / 2
+        if func(middle) > target:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+
+def longest_run(flags: np.ndarray):
+    '''Length of the longest run of True in a boolean array.'''
+    if not flags.any():
+        return 0
+    edges = np.diff(np.concatenate(([0], flags.astype(np.int8), [0])))
+    return int(np.max(np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)))
+
+
+def context_codes(symbols: np.ndarray, orders: int):
+    '''
+    Dense codes for the contexts preceding every position.
+
+    codes[d - 1][x] identifies symbols[x - d:x] for x >= d, and is -1 for
+    positions without d preceding symbols. Codes are ranks, so they stay
+    below len(symbols) for every order.
+    '''
+    n = len(symbols)
+    symbols = symbols.astype(np.int64)
+    k = int(symbols.max()) + 1 if n else 1
+
+    codes = []
+    previous = None
+    for d in range(1, orders + 1):
+        code = np.full(n, -1, dtype=np.int64)
+        if d < n:
+            if previous is None:
+                code[d:] = symbols[:-d]
+            else:
+                _, code[d:] = np.unique(
+                    previous[d:] * k + symbols[:-d],
+                    return_inverse=True
+                )
+        codes.append(code)
+        previous = code
+    return codes
+
+
+def context_leaders(contexts, nexts, events, k: int):
+    '''
+    Most frequent symbol seen after each position's context so far.
+
+    For every position x, looks at the earlier positions with the same
+    context whose events flag is set, and returns the count and symbol of
+    the most frequent next symbol among them (ties go to the largest
+    symbol). Count is 0 when the context has no earlier events. Runs in
+    O(n log n) with two sorts instead of a dictionary walk.
+    '''
+    n = len(contexts)
+
+    # Occurrence number of every (context, next) event, in time order
+    count_after = np.zeros(n, dtype=np.int64)
+    event_positions = np.flatnonzero(events)
+    pairs = contexts[event_positions] * k + nexts[event_positions]
+    order = np.argsort(pairs, kind='stable')
+    sorted_pairs = pairs[order]
+    starts = np.flatnonzero(np.concatenate((
+        [True],
+        sorted_pairs[1:] != sorted_pairs[:-1]
+    )))
+    group_start = np.repeat(starts, np.diff(np.append(starts, len(order))))
+    count_after[event_positions[order]] = np.arange(len(order)) - group_start + 1
+
+    # (count, symbol) packed so that a running max picks the leader
+    keys = np.where(events, count_after * k + nexts, -1)
+
+    # Stable, so positions stay in time order within every context
+    order = np.argsort(contexts, kind='stable')
+    sorted_contexts = contexts[order]
+    new_group = np.concatenate((
+        [True],
+        sorted_contexts[1:] != sorted_contexts[:-1]
+    ))
+    group = np.cumsum(new_group) - 1
+    offset = group * ((n + 1) * k + 1)
+    running = np.maximum.accumulate(keys[order] + offset)
+
+    # Exclusive running max, leaders only see strictly earlier events
+    leaders = np.full(n, -1, dtype=np.int64)
+    previous = np.concatenate(([-1], running[:-1])) - offset
+    previous[new_group] = -1
+    leaders[order] = np.maximum(previous, -1)
+
+    counts = np.where(leaders >= 0, leaders // k, 0)
+    symbols = np.where(leaders >= 0, leaders % k, -1)
+    return counts, symbols
+
+
+def scoreboard(correct: np.ndarray, chunk_size=1 << 16):
+    '''
+    Predictions of the SP 800-90B ensemble predictors.
+
+    correct is a (subpredictors x predictions) boolean matrix. The first
+    subpredictor starts as the winner. After every prediction each correct
+    subpredictor scores a point, in index order, and takes over when its
+    score reaches the winner's. So the winner only changes to the last
+    correct subpredictor that reached the top score, and keeps it until
+    another one does. Returns whether the winner was correct at every step.
+    '''
+    n_predictors, n = correct.shape
+    scores = np.zeros(n_predictors, dtype=np.int64)
+    winner = 0
+    result = np.empty(n, dtype=bool)
+
+    for start in range(0, n, chunk_size):
+        chunk = correct[:, start:start + chunk_size]
+        after = np.cumsum(chunk, axis=1, dtype=np.int64) + scores[:, None]
+
+        # Last correct subpredictor at the top score after each step
+        leading = chunk & (after == after.max(axis=0))
+        takes_over = leading.any(axis=0)
+        last = n_predictors - 1 - np.argmax(leading[::-1], axis=0)
+
+        # Winner after each step, carried forward where nobody took over
+        steps = np.arange(chunk.shape[1])
+        changed = np.maximum.accumulate(np.where(takes_over, steps, -1))
+        after_step = np.where(changed >= 0, last[np.maximum(changed, 0)], winner)
+        winners = np.concatenate(([winner], after_step[:-1]))
+
+        result[start:start + chunk.shape[1]] = chunk[winners, steps]
+        scores = after[:, -1]
+        winner = int(after_step[-1])
+
+    return result
+
+
+class Estimators:
+    '''
+    SP 800-90B section 6.3 non-IID min-entropy estimators.
+
+    Jitter deltas are reduced the way a wider noise source is fed to the
+    reference tool: the literal estimators see the low 8 bits of every
+    sample as symbols, and the binary estimators (Collision, Markov,
+    Compression) see the least significant bit of every sample. Literal
+    estimates are in bits per symbol, binary ones in bits per bit.
+    '''
+    SYMBOL_BITS = 8
+    TUPLE_CUTOFF = 35
+
+    def samples(data):
+        if np.ndim(data) != 1:
+            raise TypeError('SP 800-90B estimators need the sample sequence.')
+        return np.asarray(data)
+
+    def symbols(data):
+        '''Low SYMBOL_BITS bits of every sample, as dense symbols 0..k-1.'''
+        data = Estimators.samples(data).astype(np.uint64)
+        mask = np.uint64((1 << Estimators.SYMBOL_BITS) - 1)
+        values, symbols = np.unique(data & mask, return_inverse=True)
+        return symbols.astype(np.int64), len(values)
+
+    def bits(data):
+        return (Estimators.samples(data).astype(np.uint64) & 1).astype(np.int64)
+
+    def prediction_entropy(correct: np.ndarray, k: int):
+        '''Min-entropy from a predictor's correct/incorrect history.'''
+        n = len(correct)
+        if n < 2:
+            return np.nan
+
+        hits = int(np.count_nonzero(correct))
+        p_global = hits / n
+        if hits == 0:
+            p_global_upper = 1 - 0.01 ** (1 / n)
+        else:
+            p_global_upper = upper_bound(p_global, n)
+
+        r = longest_run(correct) + 1
+
+        def no_run_probability(p):
+            q = 1 - p
+            try:
+                x = 1.0
+                for _ in range(10):
+                    x = 1 + q * p ** r * x ** (r + 1)
+                return (1 - p * x) / ((r + 1 - r * x) * q) / x ** (n + 1)
+            except (OverflowError, ZeroDivisionError):
+                return 0.0
+
+        p_local = bisect(no_run_probability, 0.99, 0.0, 1 - 1e-12)
+
+        return -math.log2(max(p_global_upper, p_local, 1 / k))
+
+    # Binary estimators
+
+    def calculate_collision(data):
+        bits = Estimators.bits(data)
+        n = len(bits)
+
+        # A binary collision always ends after 2 or 3 samples
+        steps = np.where(bits[:-1] == bits[1:], 2, 3).tolist()
+        times = []
+        i = 0
+        while i < n - 1:
+            step = steps[i]
+            if step == 3 and i >= n - 2:
+                break
+            times.append(step)
+            i += step
+
+        v = len(times)
+        if v < 2:
+            return np.nan
+
+        times = np.array(times, dtype=np.float64)
+        mean = times.mean()
+        sigma = times.std(ddof=1)
+        mean_lower = mean - Z_99 * sigma / math.sqrt(v)
+
+        def expected_time(p):
+            q = 1 - p
+            f = q + 2 * q ** 2 + 2 * q ** 3
+            return (
+                p / q ** 2 * (1 + (1 / p - 1 / q) / 2) * f
+                - p / q * (1 / p - 1 / q) / 2
+            )
+
+        if mean_lower >= expected_time(0.5):
+            p = 0.5
+        else:
+            p = bisect(expected_time, mean_lower, 0.5, 1 - 1e-9)
+
+        return -math.log2(p)
+
+    def calculate_markov(data):
+        bits = Estimators.bits(data)
+        n = len(bits)
+        if n < 2:
+            return np.nan
+
+        p1 = bits.mean()
+        p0 = 1 - p1
+        transitions = np.bincount(bits[:-1] * 2 + bits[1:], minlength=4)
+        from_zero = transitions[0] + transitions[1]
+        from_one = transitions[2] + transitions[3]
+        p00 = transitions[0] / from_zero if from_zero else 0.0
+        p01 = transitions[1] / from_zero if from_zero else 0.0
+        p10 = transitions[2] / from_one if from_one else 0.0
+        p11 = transitions[3] / from_one if from_one else 0.0
+
+        # Most likely 128-bit sequence, in the log domain
+        with np.errstate(divide='ignore'):
+            log = np.log2([p0, p1, p00, p01, p10, p11])
+        l0, l1, l00, l01, l10, l11 = log
+        log_max = max(
+            l0 + 127 * l00,
+            l0 + 64 * l01 + 63 * l10,
+            l0 + l01 + 126 * l11,
+            l1 + l10 + 126 * l00,
+            l1 + 64 * l10 + 63 * l01,
+            l1 + 127 * l11,
+        )
+
+        return min(-log_max / 128, 1.0)
+
+    def calculate_compression(data):
+        b = 6
+        d = 1000
+        bits = Estimators.bits(data)
+        blocks = len(bits) // b
+        v = blocks - d
+        if v < 2:
+            return np.nan
+
+        weights = 1 << np.arange(b - 1, -1, -1)
+        words = bits[:blocks * b].reshape(blocks, b) @ weights
+
+        # Distance back to the previous occurrence of every word, or the
+        # 1-based position when there is none
+        positions = np.arange(1, blocks + 1)
+        order = np.argsort(words, kind='stable')
+        previous = np.zeros(blocks, dtype=np.int64)
+        same = words[order[1:]] == words[order[:-1]]
+        previous[order[1:][same]] = positions[order[:-1][same]]
+        distances = (positions - previous)[d:]
+
+        log_distances = np.log2(distances)
+        mean = log_distances.mean()
+        sigma = 0.5907 * math.sqrt(max(
+            np.sum(log_distances ** 2) / (v - 1) - mean ** 2,
+            0.0
+        ))
+        mean_lower = mean - Z_99 * sigma / math.sqrt(v)
+
+        u = np.arange(1, blocks + 1, dtype=np.float64)
+        log_u = np.log2(u)
+        inner = log_u[:-1] * (blocks - np.maximum(u[:-1], d))
+        last = log_u[d:]
+
+        def g(z):
+            if z <= 0:
+                return 0.0
+            powers = np.exp((u - 1) * np.log1p(-z))
+            return (
+                z * z * np.dot(inner, powers[:-1])
+                + z * np.dot(last, powers[d:])
+            ) / v
+
+        def expected_value(p):
+            q = (1 - p) / (2 ** b - 1)
+            return g(p) + (2 ** b - 1) * g(q)
+
+        p_min = 2.0 ** -b
+        if mean_lower >= expected_value(p_min):
+            p = p_min
+        else:
+            p = bisect(expected_value, mean_lower, p_min, 1 - 1e-12)
+
+        return min(-math.log2(p) / b, 1.0)
+
+    # Tuple estimators
+
+    tuple_cache = {}
+
+    def tuple_statistics(symbols: np.ndarray):
+        '''
+        Q[i], the count of the most common i-tuple, and P[i], the number
+        of pairs of equal i-tuples, for every length up to the longest
+        repeated substring. Uses a suffix array built by prefix doubling
+        and its LCP array, then one stack pass over the LCP array.
+        '''
+        key = hashlib.sha1(symbols.tobytes()).digest()
+        if key in Estimators.tuple_cache:
+            return Estimators.tuple_cache[key]
+
+        n = len(symbols)
+        rank = symbols.astype(np.int64)
+        ranks = [rank.astype(np.int32)]
+        suffixes = np.argsort(rank, kind='stable')
+        length = 1
+        while n and rank.max() < n - 1:
+            second = np.full(n, -1, dtype=np.int64)
+            second[:n - length] = rank[length:]
+            suffixes = np.lexsort((second, rank))
+            changed = (
+                (rank[suffixes][1:] != rank[suffixes][:-1])
+                | (second[suffixes][1:] != second[suffixes][:-1])
+            )
+            rank = np.empty(n, dtype=np.int64)
+            rank[suffixes] = np.concatenate(([0], np.cumsum(changed)))
+            ranks.append(rank.astype(np.int32))
+            length *= 2
+
+        # LCP of neighbouring suffixes by binary lifting over the ranks
+        a, b = suffixes[:-1], suffixes[1:]
+        lcp = np.zeros(n - 1, dtype=np.int64)
+        for level in range(len(ranks) - 1, -1, -1):
+            step = 1 << level
+            pa, pb = a + lcp, b + lcp
+            valid = (pa + step <= n) & (pb + step <= n)
+            pa, pb = np.minimum(pa, n - 1), np.minimum(pb, n - 1)
+            lcp += step * (valid & (ranks[level][pa] == ranks[level][pb]))
+
+        # For every LCP entry h: the previous entry <= h and the next
+        # entry < h bound the suffixes sharing a prefix of length h
+        heights = lcp.tolist()
+        left = [0] * len(heights)
+        right = [len(heights)] * len(heights)
+        stack = []
+        for i, h in enumerate(heights):
+            while stack and heights[stack[-1]] > h:
+                right[stack.pop()] = i
+            left[i] = stack[-1] if stack else -1
+            stack.append(i)
+
+        left = np.array(left, dtype=np.int64)
+        right = np.array(right, dtype=np.int64)
+        indices = np.arange(len(heights))
+        max_lcp = int(lcp.max()) if len(lcp) else 0
+
+        group_sizes = np.zeros(max_lcp + 2, dtype=np.int64)
+        np.maximum.at(group_sizes, lcp, right - left)
+        most_common = np.maximum.accumulate(group_sizes[::-1])[::-1]
+        most_common = np.maximum(most_common, 1)
+
+        pair_counts = np.zeros(max_lcp + 2, dtype=np.float64)
+        np.add.at(pair_counts, lcp, (indices - left) * (right - indices))
+        pairs = np.cumsum(pair_counts[::-1])[::-1]
+
+        Estimators.tuple_cache.clear()
+        Estimators.tuple_cache[key] = (most_common, pairs, max_lcp)
+        return most_common, pairs, max_lcp
+
+    def calculate_t_tuple(data):
+        symbols, k = Estimators.symbols(data)
+        n = len(symbols)
+        most_common, pairs, max_lcp = Estimators.tuple_statistics(symbols)
+
+        lengths = np.flatnonzero(most_common >= Estimators.TUPLE_CUTOFF)
+        lengths = lengths[lengths >= 1]
+        if len(lengths) == 0:
+            return np.nan
+
+        i = np.arange(1, lengths.max() + 1)
+        p = most_common[i] / (n - i + 1)
+        p_max = np.max(p ** (1 / i))
+
+        return -math.log2(upper_bound(p_max, n))
+
+    def calculate_lrs(data):
+        symbols, k = Estimators.symbols(data)
+        n = len(symbols)
+        most_common, pairs, max_lcp = Estimators.tuple_statistics(symbols)
+
+        # u: shortest length whose most common tuple is rarer than the
+        # cutoff, v: length of the longest repeated substring
+        below = np.flatnonzero(most_common[1:] < Estimators.TUPLE_CUTOFF)
+        u = int(below[0]) + 1 if len(below) else max_lcp + 1
+        v = max_lcp
+        if u > v:
+            return np.nan
+
+        w = np.arange(u, v + 1)
+        tuples = n - w + 1
+        p = pairs[w] / (tuples * (tuples - 1) / 2)
+        p_max = np.max(p ** (1 / w))
+
+        return -math.log2(upper_bound(p_max, n))
+
+    # Prediction estimators
+
+    def calculate_multi_mcw(data):
+        windows = (63, 255, 1023, 4095)
+        symbols, k = Estimators.symbols(data)
+        n = len(symbols)
+        first = windows[0]
+        if n <= first + 1:
+            return np.nan
+
+        values = symbols.tolist()
+        correct = np.zeros((len(windows), n - first), dtype=bool)
+
+        for j, w in enumerate(windows):
+            if n <= w:
+                continue
+
+            # counts, last occurrence and per-count buckets give the most
+            # common value of the window, ties to the most recent, in O(1)
+            counts = [0] * k
+            last = [-1] * k
+            buckets = [set() for _ in range(w + 2)]
+            buckets[0].update(range(k))
+            for i in range(w):
+                x = values[i]
+                buckets[counts[x]].discard(x)
+                counts[x] += 1
+                buckets[counts[x]].add(x)
+                last[x] = i
+            top = max(counts)
+            best = max(buckets[top], key=last.__getitem__)
+
+            hits = []
+            for i in range(w, n):
+                x = values[i]
+                hits.append(best == x)
+
+                y = values[i - w]
+                buckets[counts[y]].discard(y)
+                counts[y] -= 1
+                buckets[counts[y]].add(y)
+                buckets[counts[x]].discard(x)
+                counts[x] += 1
+                buckets[counts[x]].add(x)
+                last[x] = i
+
+                if counts[x] >= top:
+                    top = counts[x]
+                    best = x
+                elif y == best:
+                    if not buckets[top]:
+                        top -= 1
+                    best = max(buckets[top], key=last.__getitem__)
+
+            correct[j, w - first:] = hits
+
+        return Estimators.prediction_entropy(scoreboard(correct), k)
+
+    def calculate_lag(data):
+        lags = 128
+        symbols, k = Estimators.symbols(data)
+        n = len(symbols)
+        if n < 3:
+            return np.nan
+
+        # Subpredictor d guesses the symbol d samples back
+        correct = np.zeros((lags, n - 1), dtype=bool)
+        for d in range(1, min(lags, n - 1) + 1):
+            correct[d - 1, d - 1:] = symbols[d:] == symbols[:-d]
+
+        return Estimators.prediction_entropy(scoreboard(correct), k)
+
+    def calculate_multi_mmc(data):
+        orders = 16
+        max_entries = 100000
+        symbols, k = Estimators.symbols(data)
+        n = len(symbols)
+        if n < 3:
+            return np.nan
+
+        correct = np.zeros((orders, n - 2), dtype=bool)
+        for d, contexts in enumerate(context_codes(symbols, orders), start=1):
+            events = contexts >= 0
+            if not events.any():
+                continue
+
+            # Only the first max_entries distinct transitions get an entry
+            valid = np.flatnonzero(events)
+            _, first_seen, inverse = np.unique(
+                contexts[valid] * k + symbols[valid],
+                return_index=True,
+                return_inverse=True
+            )
+            admitted = np.zeros(len(first_seen), dtype=bool)
+            admitted[np.argsort(first_seen)[:max_entries]] = True
+            events[valid] = admitted[inverse]
+
+            counts, guesses = context_leaders(contexts, symbols, events, k)
+            correct[d - 1] = (counts[2:] > 0) & (guesses[2:] == symbols[2:])
+
+        return Estimators.prediction_entropy(scoreboard(correct), k)
+
+    def calculate_lz78y(data):
+        depth = 16
+        max_dictionary = 65536
+        symbols, k = Estimators.symbols(data)
+        n = len(symbols)
+        if n < depth + 2:
+            return np.nan
+
+        codes = context_codes(symbols, depth)
+
+        # Contexts enter the dictionary in order of first use: by time,
+        # then longest first, until it is full
+        events = np.zeros(n, dtype=bool)
+        events[depth:n - 1] = True
+        firsts = []
+        for j, contexts in enumerate(codes, start=1):
+            _, first_seen = np.unique(
+                contexts[depth:n - 1],
+                return_index=True
+            )
+            firsts.append(np.column_stack((
+                first_seen,
+                np.full(len(first_seen), -j)
+            )))
+        firsts = np.concatenate(firsts)
+        admitted_order = np.lexsort((firsts[:, 1], firsts[:, 0]))
+        admitted = firsts[admitted_order[:max_dictionary]]
+
+        best_counts = np.zeros(n, dtype=np.int64)
+        best_guesses = np.full(n, -1, dtype=np.int64)
+        for j in range(depth, 0, -1):
+            contexts = codes[j - 1]
+            allowed = np.zeros(n, dtype=bool)
+            first_positions = admitted[admitted[:, 1] == -j, 0] + depth
+            allowed_contexts = np.zeros(n, dtype=bool)
+            allowed_contexts[contexts[first_positions]] = True
+            allowed[depth:] = allowed_contexts[contexts[depth:]]
+
+            counts, guesses = context_leaders(
+                contexts,
+                symbols,
+                events & allowed,
+                k
+            )
+            # Longer contexts win ties, like the strict > of the spec
+            better = counts > best_counts
+            best_counts[better] = counts[better]
+            best_guesses[better] = guesses[better]
+
+        predicted = slice(depth + 1, n)
+        correct = (
+            (best_counts[predicted] > 0)
+            & (best_guesses[predicted] == symbols[predicted])
+        )
+
+        return Estimators.prediction_entropy(correct, k)
@@ -0,0 +1,305 @@
+import argparse
+import hashlib
+import hmac
+import json
+import math
+import time
+from collections import namedtuple
+from enum import Enum, EnumMeta, unique
+import numpy as np
+
+from analysis import Analysis
+from estimators import Estimators
+
+# SP 800-90C: a vetted conditioning function only gives full entropy
+# output when its input carries 64 bits more entropy than it outputs
+CONDITIONING_MARGIN_BITS = 64
+
+ExtractionStats = namedtuple(
+    'ExtractionStats',
+    [
+        'samples',
+        'raw_bits',
+        'debiased_bits',
+        'output_bytes',
+        'entropy_per_bit',
+        'seconds',
+    ]
+)
+
+
+def xor_fold(samples: np.ndarray, bits: int):
+    '''XOR every sample down to its lowest `bits` bits, a power of two.'''
+    if bits < 1 or bits > 64 or bits & (bits - 1):
+        raise ValueError('Fold width must be a power of two up to 64.')
+
+    folded = np.asarray(samples, dtype=np.uint64).copy()
+    width = 64
+    while width > bits:
+        width //= 2
+        folded ^= folded >> np.uint64(width)
+    if bits < 64:
+        folded &= np.uint64((1 << bits) - 1)
+    return folded
+
+
+def to_bits(values: np.ndarray, bits: int):
+    '''Unpack the low `bits` bits of every value, most significant first.'''
+    shifts = np.arange(bits - 1, -1, -1, dtype=np.uint64)
+    return ((values[:, None] >> shifts) & np.uint64(1)).astype(np.uint8).ravel()
+
+
+def von_neumann(bits: np.ndarray):
+    '''01 -> 0, 10 -> 1, 00 and 11 dropped. Returns (output, leftover bit).'''
+    pairs = len(bits) // 2
+    first = bits[0:2 * pairs:2]
+    second = bits[1:2 * pairs:2]
+    return first[first != second], bits[2 * pairs:]
+
+
+class ConditionerMeta(EnumMeta):
+    def __getitem__(self, conditioner_name: str):
+        for member in self:
+            if member.conditioner_name == conditioner_name:
+                return member
+        raise KeyError(f"Conditioner with name '{conditioner_name}' not found.")
+
+
+@unique
+class Conditioner(Enum, metaclass=ConditionerMeta):
+    NONE = ('None', 0)
+    SHA3_256 = ('SHA3-256', 32)
+    SHAKE_256 = ('SHAKE256', 32)
+    HMAC_SHA256 = ('HMAC-SHA256', 32)
+
+    def __init__(self, conditioner_name: str, output_bytes: int):
+        self.conditioner_name = conditioner_name
+        self.output_bytes = output_bytes
+
+    def condition(self, block: bytes, key: bytes):
+        if self is Conditioner.SHA3_256:
+            return hashlib.sha3_256(block).digest()
+        if self is Conditioner.SHAKE_256:
+            return hashlib.shake_256(block).digest(self.output_bytes)
+        if self is Conditioner.HMAC_SHA256:
+            return hmac.new(key, block, 'sha256').digest()
+        return block
+
+    def input_bytes(self, entropy_per_bit: float):
+        '''Input block size carrying output bits + margin of entropy.'''
+        needed = 8 * self.output_bytes + CONDITIONING_MARGIN_BITS
+        return math.ceil(needed / max(entropy_per_bit, 1e-6) / 8)
+
+
+class Extractor:
+    '''
+    Turns raw tick deltas into packed random bytes, chunk by chunk.
+
+    Every sample is XOR-folded to fold_bits bits, the bit stream is
+    optionally Von Neumann debiased, then packed into bytes. A vetted
+    conditioner then hashes blocks sized to carry the output length plus
+    64 bits of entropy, at entropy_per_bit. That is the min of the MCV
+    and Markov estimates of the first chunk's bits when not given. Partial
+    bits, bytes and blocks carry over to the next chunk.
+
+    With sample_entropy, an assessed min-entropy per sample, entropy_per_bit
+    is that entropy spread over the bits left after folding and debiasing,
+    and blocks are only conditioned while the samples so far carry their
+    entropy, so output never exceeds the assessed input less the margin.
+    '''
+    def __init__(
+        self,
+        fold_bits=1,
+        debias=True,
+        conditioner=Conditioner.SHA3_256,
+        entropy_per_bit=None,
+        key=bytes(32),
+        sample_entropy=None
+    ):
+        self.fold_bits = fold_bits
+        self.debias = debias
+        self.conditioner = conditioner
+        self.entropy_per_bit = entropy_per_bit
+        self.key = key
+        self.sample_entropy = sample_entropy
+        # Assessed input entropy not conditioned yet, with sample_entropy
+        self.credit = 0.0
+
+        # The raw bit of an unfinished Von Neumann pair, and output bits
+        # short of a whole byte
+        self.pending_raw = np.empty(0, dtype=np.uint8)
+        self.pending_bits = np.empty(0, dtype=np.uint8)
+        self.pending_bytes = b''
+        self.samples = 0
+        self.raw_bits = 0
+        self.debiased_bits = 0
+        self.output_bytes = 0
+        self.seconds = 0.0
+
+    def estimate_entropy(self, bits: np.ndarray):
+        if len(bits) < 2:
+            return 1.0
+        return float(min(
+            Analysis.calculate_most_common_value(bits),
+            Estimators.calculate_markov(bits),
+            1.0
+        ))
+
+    def process(self, samples: np.ndarray):
+        '''Extract from one chunk of samples, returning the new bytes.'''
+        start = time.process_time()
+
+        bits = to_bits(xor_fold(samples, self.fold_bits), self.fold_bits)
+        self.samples += len(samples)
+        self.raw_bits += len(bits)
+
+        if self.debias:
+            bits, self.pending_raw = von_neumann(
+                np.concatenate((self.pending_raw, bits))
+            )
+            self.debiased_bits += len(bits)
+
+        if self.sample_entropy is not None:
+            # A fold keeps at most fold_bits of a sample's entropy, and
+            # debiasing keeps it in fewer bits
+            entropy = min(self.sample_entropy, self.fold_bits)
+            produced = self.debiased_bits if self.debias else self.raw_bits
+            self.credit += entropy * len(samples)
+            if produced:
+                self.entropy_per_bit = min(entropy * self.samples / produced, 1.0)
+
+        # Whole bytes only, the rest waits for the next chunk
+        bits = np.concatenate((self.pending_bits, bits))
+        whole = len(bits) // 8 * 8
+        self.pending_bits = bits[whole:]
+        packed = np.packbits(bits[:whole]).tobytes()
+
+        if self.entropy_per_bit is None and whole:
+            self.entropy_per_bit = self.estimate_entropy(bits[:whole])
+
+        if self.conditioner is Conditioner.NONE:
+            output = packed
+        else:
+            data = self.pending_bytes + packed
+            block = self.conditioner.input_bytes(self.entropy_per_bit or 1.0)
+            blocks = len(data) // block
+            if self.sample_entropy is not None and blocks:
+                spent = 8 * block * self.entropy_per_bit
+                blocks = min(blocks, int(self.credit // spent))
+                self.credit -= blocks * spent
+            output = b''.join(
+                self.conditioner.condition(
+                    data[i * block:(i + 1) * block],
+                    self.key
+                )
+                for i in range(blocks)
+            )
+            self.pending_bytes = data[blocks * block:]
+
+        self.output_bytes += len(output)
+        self.seconds += time.process_time() - start
+        return output
+
+    @property
+    def stats(self):
+        return ExtractionStats(
+            self.samples,
+            self.raw_bits,
+            self.debiased_bits,
+            self.output_bytes,
+            self.entropy_per_bit,
+            self.seconds
+        )
+
+
+def measure(operation, level, ffi, extractor: Extractor, iterations: int):
+    '''
+    Sample and extract one (operation, level) cell in this process.
+
+    Returns a dict with the sampling rate, the extractor throughput and
+    the conditioned bytes per CPU-second of sampling plus extraction.
+    '''
+    start = time.process_time()
+    samples = operation.run(ffi, iterations)
+    sampled = time.process_time()
+    output = extractor.process(samples)
+    finished = time.process_time()
+
+    cpu_seconds = max(finished - start, 1e-9)
+    return {
+        'operation': operation.name,
+        'level': level.name,
+        'samples': iterations,
+        'output_bytes': len(output),
+        'entropy_per_bit': extractor.entropy_per_bit,
+        'samples_per_second': iterations / max(sampled - start, 1e-9),
+        'extract_mb_per_second': (
+            iterations * 8 / 1e6 / max(finished - sampled, 1e-9)
+        ),
+        'bytes_per_cpu_second': len(output) / cpu_seconds,
+    }
+
+
+def main(argv=None):
+    from batch import parse_members
+    from ffi import FFIRegistry
+    from operation import OptimizationLevel, OperationType
+
+    parser = argparse.ArgumentParser(
+        prog='run.py extract',
+        description='Measure conditioned output per CPU-second of every cell.'
+    )
+    parser.add_argument('--operations', nargs='+', default=['all'])
+    parser.add_argument('--levels', nargs='+', default=['all'])
+    parser.add_argument('--iterations', type=int, default=1000000)
+    parser.add_argument('--fold-bits', type=int, default=1)
+    parser.add_argument(
+        '--no-debias',
+        action='store_true',
+        help='Skip Von Neumann debiasing'
+    )
+    parser.add_argument(
+        '--conditioner',
+        default='SHA3_256',
+        choices=list(Conditioner.__members__)
+    )
+    parser.add_argument(
+        '--entropy-per-bit',
+        type=float,
+        default=None,
+        help='Input entropy claim (default: estimated per cell)'
+    )
+    parser.add_argument('--output', help='JSON file results are written to')
+    args = parser.parse_args(argv)
+
+    registry = FFIRegistry(OptimizationLevel)
+    results = []
+    for operation in parse_members(OperationType, args.operations):
+        for level in parse_members(OptimizationLevel, args.levels):
+            extractor = Extractor(
+                args.fold_bits,
+                not args.no_debias,
+                Conditioner.__members__[args.conditioner],
+                args.entropy_per_bit
+            )
+            result = measure(
+                operation,
+                level,
+                registry[level.name],
+                extractor,
+                args.iterations
+            )
+            results.append(result)
+            print(
+                f'{operation.name:>16} {level.name:>6}',
+                f'{result["bytes_per_cpu_second"]:>12.0f} B/CPU-s',
+                f'{result["entropy_per_bit"] or 0:.3f} bits/bit'
+            )
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,128 @@
+import threading
+from collections.abc import Mapping
 from cffi import FFI as CFFI
 from os import path
 
+CDEF = """
+    uint64_t get_time_diff(void (*delay_op)(uint64_t *));
+    uint64_t get_ticks_diff(void (*delay_op)(uint64_t *));
+    void get_ticks_diff_bulk(
+        void (*delay_op)(uint64_t *),
+        uint64_t *diffs,
+        uint64_t count
+    );
+    int get_ticks_diff_timed_bulk(
+        void (*delay_op)(uint64_t *),
+        int timer,
+        uint64_t *diffs,
+        uint64_t count
+    );
+    #define HEALTH_RCT_FAILURE 1
+    #define HEALTH_APT_FAILURE 2
+    struct health_state {
+        uint64_t rct_cutoff;
+        uint64_t apt_cutoff;
+        uint64_t apt_window;
+        uint64_t rct_value;
+        uint64_t rct_count;
+        uint64_t apt_value;
+        uint64_t apt_count;
+        uint64_t apt_seen;
+        uint64_t samples;
+        uint64_t rct_failures;
+        uint64_t apt_failures;
+        uint64_t last_failure;
+    };
+    void health_init(
+        struct health_state *state,
+        uint64_t rct_cutoff,
+        uint64_t apt_cutoff,
+        uint64_t apt_window
+    );
+    int get_ticks_diff_health_bulk(
+        void (*delay_op)(uint64_t *),
+        int timer,
+        struct health_state *state,
+        uint64_t *diffs,
+        uint64_t count
+    );
+    #define EVICTION_NONE 0
+    #define EVICTION_CLFLUSH 1
+    #define EVICTION_BUFFER 2
+    #define EVICTION_PRIME_PROBE 3
+    struct eviction_state {
+        int mode;
+        uint8_t *function;
+        uint64_t function_size;
+        uint8_t *buffer;
+        uint64_t buffer_size;
+        uint64_t stride;
+        uint64_t ways;
+        uint64_t probe_ticks;
+        uint64_t probes;
+        uint64_t sink;
+    };
+    int eviction_init(
+        struct eviction_state *state,
+        int mode,
+        void (*delay_op)(uint64_t *),
+        uint64_t ways
+    );
+    void eviction_free(struct eviction_state *state);
+    void evict(struct eviction_state *state);
+    void eviction_probe(struct eviction_state *state);
+    int get_ticks_diff_evicted_bulk(
+        void (*delay_op)(uint64_t *),
+        int timer,
+        struct eviction_state *state,
+        uint64_t *diffs,
+        uint64_t count
+    );
+    #define COUNTER_MAX 7
+    struct counter_group {
+        int leader;
+        int opened;
+        int software;
+        uint32_t available;
+        int fds[7];
+        int columns[7];
+    };
+    int counters_open(struct counter_group *group);
+    void counters_close(struct counter_group *group);
+    int get_ticks_diff_counted_bulk(
+        void (*delay_op)(uint64_t *),
+        int timer,
+        struct counter_group *group,
+        struct eviction_state *eviction,
+        uint64_t *diffs,
+        uint64_t *counts,
+        uint64_t count,
+        uint64_t every
+    );
+    #define WORKLOAD_TSP 0
+    #define WORKLOAD_TSP_DP 1
+    #define WORKLOAD_GRAPH_COLOR 2
+    #define WORKLOAD_LONG_LOOP 3
+    #define GRAPH_MAX_VERTICES 4096
+    #define TSP_DP_MAX_CITIES 16
+    int workload_configure(int workload, uint64_t size);
+    uint64_t workload_size(int workload);
+    void flush_cache(void *addr);
+    void cubed_op(uint64_t *data);
+    void timespec_clock_op(uint64_t *data);
+    void clock_print_op(uint64_t *data);
+    void print_op(uint64_t *data);
+    void interrupt_op(uint64_t *data);
+    void get_pid_op(uint64_t *data);
+    void tsp_dp_op(uint64_t *data);
+    void tsp_op(uint64_t *data);
+    void graph_color_op(uint64_t *data);
+    void long_loop_op(uint64_t *data);
+    void rdtsc_op(uint64_t *data);
+    void empty_op(uint64_t *data);
+    uint64_t jitter_entropy_op(uint64_t *data);
+"""
+
 
 def get_lib(lib_name: str):
     import platform
@@ -27,9 +149,53 @@ def get_lib(lib_name: str):
 
 
 class FFI:
-    def __init__(self, cdef: str, lib_name: str):
+    def __init__(self, cdef: str, lib_name: str, ffi: CFFI = None):
         lib_path = get_lib(lib_name=lib_name)
 
-        self.ffi = CFFI()
+        # A parsed cdef can be shared between libraries
+        if ffi is None:
+            ffi = CFFI()
+            ffi.cdef(cdef)
+
+        self.ffi = ffi
         self.lib = self.ffi.dlopen(lib_path)
-        self.ffi.cdef(cdef)
+        # Timer overhead of this library, by TimerBackend
+        self.calibrations = {}
+        # Eviction states of this library, by (EvictionMode, operation)
+        self.evictions = {}
+
+
+class FFIRegistry(Mapping):
+    '''
+    FFI wrappers for every OptimizationLevel, keyed by level name.
+
+    The cdef is parsed once on first use and shared by all libraries, and
+    each library is only opened the first time it is looked up.
+    '''
+    def __init__(self, levels, cdef: str = CDEF):
+        self.lib_names = {level.name: level.lib_name for level in levels}
+        self.cdef = cdef
+        self.ffi = None
+        self.loaded = {}
+        self.lock = threading.Lock()
+
+    def __getitem__(self, level_name: str):
+        with self.lock:
+            if level_name not in self.loaded:
+                if self.ffi is None:
+                    self.ffi = CFFI()
+                    self.ffi.cdef(self.cdef)
+
+                self.loaded[level_name] = FFI(
+                    cdef=self.cdef,
+                    lib_name=self.lib_names[level_name],
+                    ffi=self.ffi
+                )
+
+            return self.loaded[level_name]
+
+    def __iter__(self):
+        return iter(self.lib_names)
+
+    def __len__(self):
+        return len(self.lib_names)
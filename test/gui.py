@@ -1,21 +1,22 @@
 import tkinter as tk
 from tkinter import ttk
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
-from matplotlib.lines import Line2D
 import numpy as np
 from enum import Enum, EnumMeta, unique
 from collections import Counter
-import csv
 import time
 import threading
 import queue
-import subprocess
-import os
-import re
 
-from operation import OptimizationLevel, OperationType
-from analysis import MetricType, Analysis
+from operation import EvictionMode, OptimizationLevel, OperationType, TimerBackend
+from analysis import MetricType, Analysis, OutlierFilter
+from cache import DISK_DIRECTORY, MeasurementCache, cache_key
+from collector import Collector
+from counters import counter_summary
+from store import ResultStore
+from lod import LOD_THRESHOLD, DensityLayer, EnvelopeLayer
+from live import FRAME_INTERVAL_MS, LivePlot
+from scheduler import DEFAULT_METRICS, AdaptiveScheduler
+import spectral
 
 
 class OperationComboBox(ttk.Combobox):
@@ -30,6 +31,16 @@ class GraphTypeComboBox(ttk.Combobox):
         super().__init__(parent, values=graphs, state='readonly', *args, **kwargs)
 
 
+class TimerComboBox(ttk.Combobox):
+    def __init__(self, parent, *args, **kwargs):
+        timers = [timer.timer_name for timer in TimerBackend]
+        super().__init__(parent, values=timers, state='readonly', *args, **kwargs)
+        self.set(TimerBackend.RDTSC.timer_name)
+
+    def get_timer(self):
+        return TimerBackend[self.get()]
+
+
 class MetricTypeListbox(tk.Listbox):
     def __init__(self, parent, *args, **kwargs):
         super().__init__(parent, selectmode=tk.MULTIPLE, exportselection=False, *args, **kwargs)
@@ -72,15 +83,58 @@ class RemoveLegendCheckbox(tk.Checkbutton):
         return self.remove_legend_var.get()
 
 
-class AttackCheckbox(tk.Checkbutton):
+class EvictionComboBox(ttk.Combobox):
+    def __init__(self, parent, *args, **kwargs):
+        modes = [mode.eviction_name for mode in EvictionMode]
+        super().__init__(parent, values=modes, state='readonly', *args, **kwargs)
+        self.set(EvictionMode.NONE.eviction_name)
+
+    def get_eviction(self):
+        return EvictionMode[self.get()]
+
+
+class SubtractOverheadCheckbox(tk.Checkbutton):
+    def __init__(self, parent, *args, **kwargs):
+        self.subtract_overhead_var = tk.BooleanVar()
+        self.subtract_overhead_var.set(False)
+
+        super().__init__(parent, variable=self.subtract_overhead_var, text='Subtract timer overhead', *args, **kwargs)
+
+    def get(self):
+        return self.subtract_overhead_var.get()
+
+
+class CountersCheckbox(tk.Checkbutton):
     def __init__(self, parent, *args, **kwargs):
-        self.attack_var = tk.BooleanVar()
-        self.attack_var.set(False)
+        self.counters_var = tk.BooleanVar()
+        self.counters_var.set(False)
 
-        super().__init__(parent, variable=self.attack_var, text='Cache attack', *args, **kwargs)
+        super().__init__(parent, variable=self.counters_var, text='Read counters', *args, **kwargs)
 
     def get(self):
-        return self.attack_var.get()
+        return self.counters_var.get()
+
+
+class LiveCheckbox(tk.Checkbutton):
+    def __init__(self, parent, *args, **kwargs):
+        self.live_var = tk.BooleanVar()
+        self.live_var.set(False)
+
+        super().__init__(parent, variable=self.live_var, text='Live graph', *args, **kwargs)
+
+    def get(self):
+        return self.live_var.get()
+
+
+class AdaptiveCheckbox(tk.Checkbutton):
+    def __init__(self, parent, *args, **kwargs):
+        self.adaptive_var = tk.BooleanVar()
+        self.adaptive_var.set(False)
+
+        super().__init__(parent, variable=self.adaptive_var, text='Adaptive sampling', *args, **kwargs)
+
+    def get(self):
+        return self.adaptive_var.get()
 
 
 class IterationsEntryBox(tk.Frame):
@@ -99,6 +153,18 @@ class IterationsEntryBox(tk.Frame):
             return 1
 
 
+# Short names of the counters, for the counter label
+COUNTER_LABELS = {
+    'l1d_misses': 'L1D miss',
+    'l1i_misses': 'L1I miss',
+    'llc_misses': 'LLC miss',
+    'branch_misses': 'branch miss',
+    'context_switches': 'ctx switch',
+    'page_faults': 'page fault',
+    'cpu_migrations': 'migration',
+}
+
+
 class GraphCanvas(tk.Canvas):
     def __init__(self, parent, *args, **kwargs):
         super().__init__(parent, *args, **kwargs)
@@ -130,22 +196,36 @@ class GraphCanvas(tk.Canvas):
 
 
 class Graphs:
+    # Above LOD_THRESHOLD points per level, the per-sample graphs draw a
+    # pre-aggregated layer that follows the toolbar zoom, see lod.py
+
     def scatter(ax, indices, values, label, color):
+        if len(values) > LOD_THRESHOLD:
+            return DensityLayer(ax, indices, values, color)
         ax.scatter(indices, values, label=label, color=color, s=5, alpha=1)
 
     def scatter_light(ax, indices, values, label, color):
+        if len(values) > LOD_THRESHOLD:
+            return DensityLayer(ax, indices, values, color)
         ax.scatter(indices, values, label=label, color=color, s=5, alpha=0.3)
 
     def scatter_sized(ax, indices, values, label, color):
+        # The density image already shows how often values repeat
+        if len(values) > LOD_THRESHOLD:
+            return DensityLayer(ax, indices, values, color)
         unique_values, counts = np.unique(values, return_counts=True)
         frequency_array = counts[np.searchsorted(unique_values, values)]
 
         ax.scatter(indices, values, label=label, color=color, s=frequency_array, alpha=1)
 
     def line(ax, indices, values, label, color):
+        if len(values) > LOD_THRESHOLD:
+            return EnvelopeLayer(ax, indices, values, color, label)
         ax.plot(indices, values, label=label, color=color)
 
     def bar(ax, indices, values, label, color):
+        if len(values) > LOD_THRESHOLD:
+            return EnvelopeLayer(ax, indices, values, color, label, baseline=0)
         ax.bar(indices, values, label=label, color=color)
 
     def histogram2D(ax, indices, values, label, color):
@@ -167,7 +247,8 @@ class Graphs:
 
     def rolling_average(ax, indices, values, label, color):
         rolling_avg = np.convolve(values, np.ones(50) / 50, mode='valid')
-        ax.plot(
+        Graphs.line(
+                ax,
                 indices[49:],
                 rolling_avg,
                 label='Rolling Average Execution Time',
@@ -183,6 +264,29 @@ class Graphs:
         ax.set_ylabel('Y')
         ax.set_title('Hexbin Plot')
 
+    def autocorrelation(ax, indices, values, label, color):
+        acf = spectral.autocorrelation(values)
+        ax.plot(np.arange(len(acf)), acf, color=color, label=label)
+        # Lags inside the band are indistinguishable from white noise
+        bound = spectral.Z_95 / np.sqrt(max(len(values), 1))
+        ax.axhspan(-bound, bound, color=color, alpha=0.15)
+        ax.set_xlabel('Lag (samples)')
+        ax.set_ylabel('Autocorrelation')
+
+    def power_spectrum(ax, indices, values, label, color):
+        spectrum = spectral.welch(values)
+        ax.semilogy(spectrum.frequencies[1:], spectrum.power[1:], color=color, label=label)
+        periodicity = spectral.dominant_period(values, spectrum)
+        if periodicity.significant:
+            ax.axvline(periodicity.frequency, color=color, linestyle=':')
+            ax.annotate(
+                f'period {periodicity.period:.1f}',
+                (periodicity.frequency, spectrum.power[1:].max()),
+                color=color
+            )
+        ax.set_xlabel('Frequency (cycles per sample)')
+        ax.set_ylabel('Power')
+
     def violin(ax, indices, values, label, color):
         # Create a violin plot
         ax.violinplot(values, vert=False)
@@ -213,6 +317,8 @@ class GraphType(Enum, metaclass=GraphTypeMeta):
     Boxplot = ('Boxplot', Graphs.boxplot)
     Hexbin = ('Hexbin', Graphs.hexbin)
     Violin = ('Violin', Graphs.violin)
+    Autocorrelation = ('Autocorrelation', Graphs.autocorrelation)
+    Power_Spectrum = ('Power Spectrum', Graphs.power_spectrum)
 
     def __init__(self, graph_name: str, func):
         self.graph_name = graph_name
@@ -236,6 +342,12 @@ class GUI:
         # self.root.tk_setPalette(background='#2e2e2e', foreground='#f0f0f0')
 
         self.ffi_dict = ffi_dict
+        # With counters selected, workers read their own perf_event_open
+        # counters around every sample, in place of a perf stat process
+        self.collector = Collector()
+        # Runs with the same parameters are reused across graphs, so only
+        # changing the graph or metrics does not sample again
+        self.measurements = MeasurementCache(directory=DISK_DIRECTORY)
         self.operation_var = tk.StringVar()
         self.graph_type_var = tk.StringVar()
         self.metric_type_var = tk.StringVar()
@@ -270,12 +382,27 @@ class GUI:
         self.iterations_entry_box = IterationsEntryBox(self.button_frame)
         self.iterations_entry_box.pack(pady=5)
 
+        self.adaptive_checkbox = AdaptiveCheckbox(self.button_frame, height=2)
+        self.adaptive_checkbox.pack(pady=5)
+
+        self.timer_combobox = TimerComboBox(self.button_frame)
+        self.timer_combobox.pack(pady=5)
+
+        self.subtract_overhead_checkbox = SubtractOverheadCheckbox(self.button_frame, height=2)
+        self.subtract_overhead_checkbox.pack(pady=5)
+
+        self.counters_checkbox = CountersCheckbox(self.button_frame, height=2)
+        self.counters_checkbox.pack(pady=5)
+
         self.remove_outliers_checkbox = RemoveOutliersCheckbox(self.button_frame, height=2)
         self.remove_outliers_checkbox.pack(pady=5)
 
         self.remove_legend_checkbox = RemoveLegendCheckbox(self.button_frame, height=2)
         self.remove_legend_checkbox.pack(pady=5)
 
+        self.live_checkbox = LiveCheckbox(self.button_frame, height=2)
+        self.live_checkbox.pack(pady=5)
+
         self.add_graph_button = ttk.Button(
                 self.button_frame,
                 text='Add Graph',
@@ -283,6 +410,13 @@ class GUI:
                 )
         self.add_graph_button.pack(pady=10)
 
+        self.resample_button = ttk.Button(
+                self.button_frame,
+                text='Re-sample',
+                command=lambda: self.on_add_graph(resample=True)
+                )
+        self.resample_button.pack(pady=10)
+
         self.close_button = ttk.Button(
                 self.button_frame,
                 text='Close',
@@ -290,85 +424,125 @@ class GUI:
                 )
         self.close_button.pack(pady=10)
 
-        self.attack_checkbox = AttackCheckbox(self.button_frame, height=2)
-        self.attack_checkbox.pack(pady=5)
+        self.eviction_combobox = EvictionComboBox(self.button_frame)
+        self.eviction_combobox.pack(pady=5)
 
-        self.cache_stats_queue = queue.Queue()
-        self.cache_label = ttk.Label(self.button_frame, text="Cache Stats: N/A")
+        self.cache_label = ttk.Label(self.button_frame, text='Counters: N/A')
         self.cache_label.pack(pady=10)
 
-        self.start_cache_monitor_thread()
-        self.update_cache_label()
-
         self.canvas = GraphCanvas(self.graph_frame)
         self.canvas.bind_all('<MouseWheel>', self.canvas.on_mouse_wheel)
         self.canvas.bind_all('<Button-4>', self.canvas.on_mouse_wheel)
         self.canvas.bind_all('<Button-5>', self.canvas.on_mouse_wheel)
 
-    def save_graph_to_csv(self, data, filename='graph_data.csv'):
-        with open(filename, mode='w', newline='') as file:
-            writer = csv.writer(file)
-
-            header = ['Time Point']
-            for entry in data:
-                optimization_level = entry['optimization_level'].level
-                header.append(optimization_level)
-
-            writer.writerow(header)
-
-            max_time_diff_length = max(
-                    len(entry['time_diff']) for entry in data
-                    )
-
-            for i in range(max_time_diff_length):
-                row = [i]
-                for entry in data:
-                    time_diffs = entry['time_diff']
-                    if i < len(time_diffs):
-                        row.append(time_diffs[i])
-                    else:
-                        row.append('')
-                writer.writerow(row)
+    def save_graph_data(self, data, operation_name: str, directory: str):
+        store = ResultStore(directory)
+        operation = OperationType[operation_name]
 
+        for entry in data:
+            optimization_level = entry['optimization_level']
+            store.save(
+                f'{operation.name}-{optimization_level.name}',
+                entry['time_diff'],
+                operation,
+                optimization_level,
+                remove_outliers=self.remove_outliers_checkbox.get(),
+                eviction=self.eviction_combobox.get_eviction().name
+            )
 
-    def on_add_graph(self):
+    def on_add_graph(self, resample=False):
         selected_operation_name = self.operation_var.get()
         selected_graph_type = self.graph_type_var.get()
         selected_metrics = self.metric_type_listbox.get_selected_metrics()
         selected_optimizations = self.optimization_type_listbox.get_selected_optimizations()
         iterations = self.iterations_entry_box.get_iterations()
+        timer = self.timer_combobox.get_timer()
+        subtract_overhead = self.subtract_overhead_checkbox.get()
+        counters = self.counters_checkbox.get()
         graph = GraphType[selected_graph_type]
 
+        if self.live_checkbox.get():
+            self.add_live_graph(
+                OperationType[selected_operation_name],
+                [OptimizationLevel[name] for name in selected_optimizations],
+                iterations,
+                self.eviction_combobox.get_eviction(),
+                graph,
+                [MetricType[name] for name in selected_metrics],
+                selected_operation_name,
+                timer,
+                subtract_overhead
+            )
+            return
+
+        if self.adaptive_checkbox.get():
+            threading.Thread(
+                target=self.run_adaptive,
+                args=(
+                    OperationType[selected_operation_name],
+                    selected_optimizations,
+                    [MetricType[name] for name in selected_metrics],
+                    graph,
+                    selected_operation_name,
+                    timer,
+                    subtract_overhead,
+                    counters
+                ),
+                daemon=True
+            ).start()
+            return
+
         def run_operations():
-            data = []
-            for optimization_level in selected_optimizations:
-                operation = OperationType[selected_operation_name]
-                ffi = self.ffi_dict[optimization_level]
-
-                # Run selected operation
-                time_diffs = operation.run(
-                    ffi,
+            operation = OperationType[selected_operation_name]
+            levels = [OptimizationLevel[name] for name in selected_optimizations]
+            eviction = self.eviction_combobox.get_eviction()
+            keys = [
+                cache_key(operation, level, iterations, eviction, timer, subtract_overhead)
+                for level in levels
+            ]
+
+            results = {}
+            if not resample:
+                for key in keys:
+                    entry = self.measurements.get(key, counters)
+                    if entry is not None:
+                        results[key] = entry
+
+            # Every level left runs in its own pinned worker process
+            missing = [
+                (level, key) for level, key in zip(levels, keys)
+                if key not in results
+            ]
+            if missing:
+                collected = self.collector.collect(
+                    [(operation, level) for level, _ in missing],
                     iterations,
-                    self.attack_checkbox.get()
+                    eviction,
+                    timer,
+                    subtract_overhead,
+                    counters
                 )
+                for (_, key), level_samples, level_counts in zip(missing, *collected):
+                    self.measurements.put(key, level_samples, level_counts)
+                    results[key] = (level_samples, level_counts)
+
+            samples = [results[key][0] for key in keys]
+            counts = [results[key][1] for key in keys]
+            self.root.after(
+                0,
+                lambda: self.update_counter_label(
+                    selected_optimizations,
+                    counts,
+                    timer
+                )
+            )
 
-                if self.remove_outliers_checkbox.get():
-                    time_diffs = Analysis.remove_outliers_iqr(time_diffs)
-
-                metrics = []
-                for selected_metric in selected_metrics:
-                    metric = MetricType[selected_metric]
-                    metrics.append({
-                        'name': metric.metric_name,
-                        'func': metric.func(time_diffs)
-                    })
-
-                data.append({
-                    'time_diff': time_diffs,
-                    'metrics': metrics,
-                    'graph': graph,
-                    'optimization_level': OptimizationLevel[optimization_level]
-                })
+            data = self.build_graph_data(
+                samples,
+                selected_optimizations,
+                [MetricType[name] for name in selected_metrics],
+                graph
+            )
 
             self.root.after(0, lambda: self.add_graph(data, selected_operation_name))
 
@@ -403,18 +577,242 @@ class GUI:
         #         'optimization_level': OptimizationLevel[optimization_level]
         #         })
         #
-        # # self.save_graph_to_csv(
+        # # self.save_graph_data(
         # #         data,
-        # #         ''.join((
-        # #             f'''graph-{selected_operation_name}-{selected_graph_type}
-        # #             -{time.time_ns()}.csv''').split())
+        # #         selected_operation_name,
+        # #         f'graph-{selected_graph_type}-{time.time_ns()}'
         # #         )
         # self.add_graph(data, selected_operation_name)
 
-    def add_graph(self, data, selected_operation_name: str):
-        graph_frame = self.canvas.add_graph_frame()
+    def run_adaptive(
+        self,
+        operation,
+        level_names,
+        metric_types,
+        graph,
+        selected_operation_name,
+        timer,
+        subtract_overhead,
+        counters=False
+    ):
+        '''
+        Sample every level until the selected metrics converge, in place
+        of a fixed iteration count. Without selected metrics, min-entropy
+        and the MCV estimate decide.
+        '''
+        scheduler = AdaptiveScheduler(
+            self.collector,
+            metric_types or DEFAULT_METRICS,
+            timer=timer,
+            subtract_overhead=subtract_overhead,
+            counters=counters
+        )
+        cells = scheduler.run(scheduler.cells(
+            [operation],
+            [OptimizationLevel[name] for name in level_names],
+            [self.eviction_combobox.get_eviction()]
+        ))
+
+        results = [cell.result() for cell in cells]
+        counts = [counts for _, counts, _ in results]
+        self.root.after(
+            0,
+            lambda: self.update_counter_label(level_names, counts, timer)
+        )
+
+        data = self.build_graph_data(
+            [samples for samples, _, _ in results],
+            level_names,
+            metric_types,
+            graph,
+            [intervals for _, _, intervals in results]
+        )
+        self.root.after(0, lambda: self.add_graph(data, selected_operation_name))
+
+    def build_graph_data(self, samples, level_names, metric_types, graph, intervals=None):
+        if self.remove_outliers_checkbox.get():
+            samples = [
+                Analysis.remove_outliers_iqr(time_diffs)
+                for time_diffs in samples
+            ]
+
+        # Every selected metric for every level in one pass
+        table = []
+        if samples:
+            table = Analysis.evaluate(samples, metric_types, level_names)
+
+        data = []
+        for index, (time_diffs, row) in enumerate(zip(samples, table)):
+            metrics = []
+            for metric in metric_types:
+                metrics.append({
+                    'name': metric.metric_name,
+                    'func': row[metric.name]
+                })
+                # Adaptive runs, the batch mean and half width of the
+                # metric's interval
+                if intervals is not None and metric.name in intervals[index]:
+                    interval = intervals[index][metric.name]
+                    metrics[-1]['interval'] = interval
+
+            data.append({
+                'time_diff': time_diffs,
+                'metrics': metrics,
+                'graph': graph,
+                'optimization_level': OptimizationLevel[row['label']]
+            })
+
+        return data
+
+    def add_live_graph(
+        self,
+        operation: OperationType,
+        levels: list,
+        iterations: int,
+        eviction: EvictionMode,
+        graph,
+        metric_types: list,
+        selected_operation_name: str,
+        timer=TimerBackend.RDTSC,
+        subtract_overhead=False
+    ):
+        '''
+        Stream samples into a live graph, then replace it with the
+        selected graph once collection finishes or is stopped.
+
+        Chunks are sampled on a background thread in this process, one
+        chunk per level in turn, and drawn by the Tk loop at most every
+        FRAME_INTERVAL_MS.
+        '''
+        import matplotlib.pyplot as plt
+
+        fig, ax = plt.subplots(figsize=(12, 8))
+        self.label_axes(ax, selected_operation_name)
+
+        stop = threading.Event()
+        graph_frame, fig_canvas = self.create_graph_frame(fig, stop.set)
+        stop_button = ttk.Button(graph_frame, text='Stop', command=stop.set)
+        stop_button.pack(pady=5)
+
+        live = LivePlot(
+            ax,
+            levels,
+            iterations,
+            metric_types,
+            legend=not self.remove_legend_checkbox.get()
+        )
+        chunks = queue.Queue()
+        # Outliers leave the live view as they stream in, the final graph
+        # filters the whole run like any other
+        filters = {}
+        if self.remove_outliers_checkbox.get():
+            filters = {level.name: OutlierFilter() for level in levels}
+
+        def collect():
+            collected = {level.name: [] for level in levels}
+            streams = {
+                level.name: operation.stream(
+                    self.ffi_dict[level.name],
+                    live.chunk_size,
+                    iterations,
+                    eviction,
+                    timer,
+                    subtract_overhead
+                )
+                for level in levels
+            }
+
+            while streams and not stop.is_set():
+                for name, stream in list(streams.items()):
+                    chunk = next(stream, None)
+                    if chunk is None:
+                        del streams[name]
+                        continue
+                    collected[name].append(chunk)
+                    if name in filters:
+                        chunk = filters[name].filter(chunk)
+                    chunks.put((name, chunk))
+
+            names = [name for name, parts in collected.items() if parts]
+            samples = [np.concatenate(collected[name]) for name in names]
+            # Sampled without counters, so runs that ask for them take
+            # their own samples rather than these
+            if not stop.is_set():
+                for name, level_samples in zip(names, samples):
+                    self.measurements.put(
+                        cache_key(
+                            operation,
+                            OptimizationLevel.__members__[name],
+                            iterations,
+                            eviction,
+                            timer,
+                            subtract_overhead
+                        ),
+                        level_samples
+                    )
+            data = self.build_graph_data(samples, names, metric_types, graph)
+            chunks.put((None, data))
+
+        def frame():
+            if not graph_frame.winfo_exists():
+                stop.set()
+                return
+
+            pending = []
+            data = None
+            while not chunks.empty():
+                name, chunk = chunks.get_nowait()
+                if name is None:
+                    data = chunk
+                    break
+                pending.append((name, chunk))
+
+            if pending:
+                live.update(pending)
+            if data is None:
+                self.root.after(FRAME_INTERVAL_MS, frame)
+                return
+
+            live.finish()
+            stop_button.destroy()
+            self.draw_data(ax, data, selected_operation_name)
+            fig_canvas.draw_idle()
+            self.add_save_button(graph_frame, data, selected_operation_name)
+
+        threading.Thread(target=collect, daemon=True).start()
+        self.root.after(FRAME_INTERVAL_MS, frame)
 
+    def add_graph(self, data, selected_operation_name: str):
         fig = self.plot_data(data, selected_operation_name)
+        graph_frame, _ = self.create_graph_frame(fig)
+        self.add_save_button(graph_frame, data, selected_operation_name)
+
+    def add_save_button(self, graph_frame, data, selected_operation_name: str):
+        '''Button saving the samples of every level of a graph to a result store.'''
+        def save():
+            if not data:
+                return
+            self.save_graph_data(
+                data,
+                selected_operation_name,
+                f'graph-{data[0]["graph"].graph_name}-{time.time_ns()}'
+            )
+
+        save_button = ttk.Button(
+                graph_frame,
+                text='Save Data',
+                command=save
+                )
+        save_button.pack(pady=5)
+
+    def create_graph_frame(self, fig, on_close=None):
+        # matplotlib is only imported once the first graph is drawn
+        from matplotlib.backends.backend_tkagg import (
+            FigureCanvasTkAgg,
+            NavigationToolbar2Tk
+        )
+
+        graph_frame = self.canvas.add_graph_frame()
 
         fig_canvas = FigureCanvasTkAgg(fig, master=graph_frame)
         fig_canvas.draw()
@@ -424,16 +822,40 @@ class GUI:
         toolbar.update()
         toolbar.pack(fill=tk.X)
 
+        def close():
+            if on_close is not None:
+                on_close()
+            self.remove_graph(graph_frame)
+
         close_button = ttk.Button(
                 graph_frame,
                 text='Close Graph',
-                command=lambda: self.remove_graph(graph_frame)
+                command=close
                 )
         close_button.pack(pady=5)
 
+        return graph_frame, fig_canvas
+
     def plot_data(self, data, selected_operation_name: str):
+        import matplotlib.pyplot as plt
+
         fig, ax = plt.subplots(figsize=(12, 8))
+        self.draw_data(ax, data, selected_operation_name)
+        return fig
+
+    def label_axes(self, ax, selected_operation_name: str):
+        ax.set_xlabel('Data Point')
+        ax.set_ylabel('Difference in CPU ticks')
+        ax.set_title(f'''Timing difference of operation {
+            selected_operation_name
+        }''')
+
+    def draw_data(self, ax, data, selected_operation_name: str):
+        from matplotlib.lines import Line2D
+
         legend_lines = []
+        # Before drawing, so graphs with their own axes can relabel them
+        self.label_axes(ax, selected_operation_name)
 
         while data:
             entry = data.pop(0)
@@ -451,6 +873,12 @@ class GUI:
             for metric in metrics:
                 metric_value = metric['func']
                 metric_name = metric['name']
+                if 'interval' in metric:
+                    interval = metric['interval']
+                    metric_name = (
+                        f'{metric_name} (batches {interval.estimate:.2f}'
+                        f' ± {(interval.high - interval.low) / 2:.2f})'
+                    )
 
                 legend_line = Line2D(
                         [0],
@@ -463,80 +891,41 @@ class GUI:
                         )
                 legend_lines.append(legend_line)
 
-        ax.set_xlabel('Data Point')
-        ax.set_ylabel('Difference in CPU ticks')
-        ax.set_title(f'''Timing difference of operation {
-            selected_operation_name
-        }''')
-
         # Remove legend
         if not self.remove_legend_checkbox.get():
             ax.legend(handles=legend_lines, loc='upper right')
 
-        return fig
-
     def remove_graph(self, graph_frame):
         graph_frame.destroy()
 
     def on_close(self):
+        self.collector.shutdown()
         self.root.quit()
         self.root.destroy()
 
-    def start_cache_monitor_thread(self):
-        def monitor():
-            pid = os.getpid()
-            perf_cmd = [
-                'perf', 'stat',
-                '-I', '100',
-                '-e', 'L1-dcache-loads,L1-dcache-load-misses,L1-icache-loads,L1-icache-load-misses',
-                '-p', str(pid)
-            ]
-
-            try:
-                process = subprocess.Popen(
-                    perf_cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True
+    def update_counter_label(self, level_names, counts, timer):
+        '''
+        Mean counter deltas per sample and timer overhead of every level
+        of the last run.
+        '''
+        lines = []
+        for level_name, table in zip(level_names, counts):
+            summary = counter_summary(table)
+            if summary:
+                lines.append(f'{level_name}: ' + ', '.join(
+                    f'{COUNTER_LABELS[name]} {value:.3g}'
+                    for name, value in summary.items()
+                ))
+
+            overhead = self.collector.overheads.get((level_name, timer))
+            if overhead is not None:
+                lines.append(
+                    f'{level_name} {timer.timer_name} overhead: '
+                    f'min {overhead.minimum} / median {overhead.median:.0f} '
+                    f'{timer.unit}'
                 )
 
-                for line in process.stdout:
-                    if 'cache' in line:
-                        print(f"Perf Output: {line.strip()}")
-                        self.cache_stats_queue.put(line.strip())
-
-            except Exception as e:
-                print(f"Error: {e}")
-                self.cache_stats_queue.put(f"Error: {e}")
-            finally:
-                process.terminate()
-
-        threading.Thread(target=monitor, daemon=True).start()
-
-    def update_cache_label(self):
-        try:
-            l1d_miss_rate = "N/A"
-            l1i_miss_rate = "N/A"
-
-            while not self.cache_stats_queue.empty():
-                line = self.cache_stats_queue.get_nowait()
-
-                if "L1-dcache-load-misses" in line and "%" in line:
-                    match = re.search(r"#\s+([\d.]+)%", line)
-                    if match:
-                        l1d_miss_rate = match.group(1) + "%"
-                elif "L1-icache-load-misses" in line and "%" in line:
-                    match = re.search(r"#\s+([\d.]+)%", line)
-                    if match:
-                        l1i_miss_rate = match.group(1) + "%"
-
-            display = (
-                f"L1 DCache Miss Rate: {l1d_miss_rate}\n"
-                f"L1 ICache Miss Rate: {l1i_miss_rate}"
-            )
-            self.cache_label.config(text=f"Cache Miss Rates:\n{display}")
-
-        except queue.Empty:
-            pass
-
-        self.root.after(100, self.update_cache_label)
+        if not lines:
+            self.cache_label.config(text='Counters: N/A')
+            return
+        self.cache_label.config(text='Per sample:\n' + '\n'.join(lines))
@@ -0,0 +1,116 @@
+import math
+from collections import namedtuple
+import numpy as np
+
+from estimators import Estimators
+from ffi import FFI
+from operation import TimerBackend
+
+# SP 800-90B section 4.4: false positive probability of both tests, and
+# the Adaptive Proportion Test window for non-binary samples
+HEALTH_ALPHA = 2 ** -20
+APT_WINDOW = 512
+# Raw tick deltas come in bursts no estimate over one chunk sees, so the
+# default claim is the estimate divided by this, like jitterentropy's
+# oversampling rate
+SAFETY_FACTOR = 2
+
+HealthCutoffs = namedtuple('HealthCutoffs', ['rct', 'apt'])
+
+
+def claimed_min_entropy(chunks, safety_factor=SAFETY_FACTOR):
+    '''
+    Min-entropy per sample to test against: the lowest of the literal
+    non-IID estimators over any of the chunks, which see the samples
+    themselves rather than their lowest bit, over the safety factor.
+    Estimates of single chunks vary several fold, so pass a few.
+    '''
+    estimates = [
+        estimate(chunk)
+        for chunk in chunks
+        for estimate in (
+            Estimators.calculate_t_tuple,
+            Estimators.calculate_lrs,
+            Estimators.calculate_multi_mcw,
+            Estimators.calculate_lag,
+        )
+    ]
+    return float(np.nanmin(estimates)) / safety_factor
+
+
+def health_cutoffs(min_entropy: float, alpha=HEALTH_ALPHA, window=APT_WINDOW):
+    '''RCT and APT cutoffs for a claimed min-entropy per sample.'''
+    from scipy.stats import binom
+
+    if not math.isfinite(min_entropy):
+        raise ValueError(f'Claimed min-entropy must be finite, not {min_entropy}.')
+    min_entropy = max(min_entropy, 1e-6)
+    rct = 1 + math.ceil(-math.log2(alpha) / min_entropy)
+    # Smallest count whose probability of being reached is at most alpha
+    apt = 1 + int(binom.isf(alpha, window, 2 ** -min_entropy))
+    return HealthCutoffs(rct, min(apt, window))
+
+
+class HealthMonitor:
+    '''
+    Repetition Count and Adaptive Proportion tests, run by
+    get_ticks_diff_health_bulk while sampling.
+
+    The test state lives in a C struct that carries over between calls,
+    so a monitor covers a whole stream. Samples are timed in blocks that
+    stay in L1 and tested after each block, outside the timed window.
+    '''
+    def __init__(self, ffi: FFI, cutoffs: HealthCutoffs, window=APT_WINDOW):
+        self.ffi = ffi
+        self.cutoffs = cutoffs
+        self.state = ffi.ffi.new('struct health_state *')
+        ffi.lib.health_init(self.state, cutoffs.rct, cutoffs.apt, window)
+
+    @property
+    def samples(self):
+        return self.state.samples
+
+    @property
+    def failures(self):
+        return {'rct': self.state.rct_failures, 'apt': self.state.apt_failures}
+
+    @property
+    def last_failure(self):
+        '''Stream index of the sample the last failure was raised on.'''
+        if not any(self.failures.values()):
+            return None
+        return self.state.last_failure
+
+    def sample(
+        self,
+        operation,
+        time_diffs: np.ndarray,
+        timer=TimerBackend.RDTSC,
+        subtract_overhead=False
+    ):
+        '''
+        Fill time_diffs like OperationType.sample, testing every sample.
+
+        Returns time_diffs and the names of the tests that failed while
+        filling them, empty when the source looks healthy.
+        '''
+        ffi_func = getattr(self.ffi.lib, operation.operation_cdef)
+        failed = self.ffi.lib.get_ticks_diff_health_bulk(
+            ffi_func,
+            timer.timer_id,
+            self.state,
+            self.ffi.ffi.from_buffer('uint64_t[]', time_diffs),
+            len(time_diffs)
+        )
+        if failed < 0:
+            raise ValueError(f'Unknown timer: {timer}')
+
+        if subtract_overhead:
+            timer.subtract_overhead(self.ffi, time_diffs)
+
+        tests = []
+        if failed & self.ffi.lib.HEALTH_RCT_FAILURE:
+            tests.append('rct')
+        if failed & self.ffi.lib.HEALTH_APT_FAILURE:
+            tests.append('apt')
+        return time_diffs, tests
@@ -0,0 +1,437 @@
+import argparse
+import bz2
+import json
+import math
+import multiprocessing
+import os
+from collections import namedtuple
+from concurrent import futures
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from collector import available_cpus
+from estimators import Estimators
+
+# SP 800-90B section 5: permutation testing plus the chi-square and LRS
+# tests. Samples are reduced to symbols the same way as for the
+# estimators, see Estimators.symbols.
+PERMUTATIONS = 10000
+LAGS = (1, 2, 8, 16, 32)
+ALPHA = 0.001
+
+# Elements per batch of shuffled rows, bounds worker memory
+BATCH_ELEMENTS = 1 << 22
+# Permutations per task, each task gets its own RNG stream
+CHUNK_SIZE = 50
+
+STATISTICS = [
+    'excursion',
+    'directional_runs',
+    'longest_directional_run',
+    'increases_decreases',
+    'median_runs',
+    'longest_median_run',
+    'average_collision',
+    'maximum_collision',
+] + [
+    f'periodicity_{lag}' for lag in LAGS
+] + [
+    f'covariance_{lag}' for lag in LAGS
+] + [
+    'compression',
+]
+
+PermutationResult = namedtuple(
+    'PermutationResult',
+    ['name', 'statistic', 'greater', 'equal', 'passed']
+)
+ChiSquareResult = namedtuple(
+    'ChiSquareResult',
+    ['statistic', 'degrees_of_freedom', 'p_value', 'passed']
+)
+LRSResult = namedtuple('LRSResult', ['length', 'probability', 'passed'])
+IIDVerdict = namedtuple(
+    'IIDVerdict',
+    [
+        'passed',
+        'permutations',
+        'permutation_tests',
+        'independence',
+        'goodness_of_fit',
+        'lrs',
+    ]
+)
+
+
+def run_statistics(signs: np.ndarray):
+    '''Number of runs and longest run in every row of a sign matrix.'''
+    rows, m = signs.shape
+    change = np.ones((rows, m), dtype=bool)
+    change[:, 1:] = signs[:, 1:] != signs[:, :-1]
+
+    starts = np.flatnonzero(change)
+    lengths = np.diff(np.append(starts, rows * m))
+    runs = np.count_nonzero(change, axis=1)
+    first_run = np.concatenate(([0], np.cumsum(runs)[:-1]))
+    return runs, np.maximum.reduceat(lengths, first_run)
+
+
+def collision_statistics(row: np.ndarray):
+    '''Average and maximum collision length of one sequence.'''
+    n = len(row)
+
+    # Next position holding the same symbol, n if there is none. Symbols
+    # are below 2 ** SYMBOL_BITS, small keys get numpy's radix sort
+    order = np.argsort(row.astype(np.uint16), kind='stable')
+    following = np.full(n, n, dtype=np.int64)
+    same = row[order[1:]] == row[order[:-1]]
+    following[order[:-1][same]] = order[1:][same]
+
+    # Scanning from i, the first collision ends at the smallest
+    # following position of any element from i on
+    ends = np.minimum.accumulate(following[::-1])[::-1].tolist()
+
+    lengths = []
+    i = 0
+    while i < n and ends[i] < n:
+        lengths.append(ends[i] - i + 1)
+        i = ends[i] + 1
+
+    if not lengths:
+        return 0.0, 0
+    return sum(lengths) / len(lengths), max(lengths)
+
+
+# Decimal encodings of every symbol, for the compression statistic
+SYMBOL_TEXT = [str(i).encode() for i in range(1 << Estimators.SYMBOL_BITS)]
+
+
+def compression_statistic(row: np.ndarray):
+    '''Length of the bzip2 compressed, space separated decimal symbols.'''
+    return len(bz2.compress(b' '.join(map(SYMBOL_TEXT.__getitem__, row.tolist()))))
+
+
+def statistics(rows: np.ndarray, median: float):
+    '''
+    The SP 800-90B section 5.1 test statistics of every row.
+
+    rows is a (permutations x samples) symbol matrix. Everything except
+    the collision and compression statistics is computed for all rows at
+    once. Returns a (permutations x len(STATISTICS)) matrix.
+    '''
+    rows = np.atleast_2d(rows).astype(np.int64)
+    n_rows, n = rows.shape
+    result = np.zeros((n_rows, len(STATISTICS)), dtype=np.float64)
+
+    mean = rows[0].mean()
+    excursion = np.cumsum(rows, axis=1) - mean * np.arange(1, n + 1)
+    result[:, 0] = np.max(np.abs(excursion), axis=1)
+    del excursion
+
+    directions = rows[:, 1:] >= rows[:, :-1]
+    runs, longest = run_statistics(directions)
+    result[:, 1] = runs
+    result[:, 2] = longest
+    increases = np.count_nonzero(directions, axis=1)
+    result[:, 3] = np.maximum(increases, (n - 1) - increases)
+    del directions
+
+    runs, longest = run_statistics(rows >= median)
+    result[:, 4] = runs
+    result[:, 5] = longest
+
+    for i, row in enumerate(rows):
+        result[i, 6], result[i, 7] = collision_statistics(row)
+        result[i, -1] = compression_statistic(row)
+
+    for j, lag in enumerate(LAGS):
+        result[:, 8 + j] = np.count_nonzero(
+            rows[:, :-lag] == rows[:, lag:],
+            axis=1
+        )
+        result[:, 8 + len(LAGS) + j] = np.einsum(
+            'ij,ij->i',
+            rows[:, :-lag],
+            rows[:, lag:]
+        )
+
+    return result
+
+
+# Per worker process state, set once by init_worker
+worker_symbols = None
+worker_reference = None
+
+
+def init_worker(symbols, reference):
+    global worker_symbols, worker_reference
+    worker_symbols = symbols
+    worker_reference = reference
+
+
+def permutation_worker(seed: np.random.SeedSequence, count: int):
+    '''Counts of shuffles whose statistics are above / equal to the reference.'''
+    rng = np.random.default_rng(seed)
+    symbols = worker_symbols
+    median = np.median(symbols)
+    batch = max(1, BATCH_ELEMENTS // len(symbols))
+
+    greater = np.zeros(len(STATISTICS), dtype=np.int64)
+    equal = np.zeros(len(STATISTICS), dtype=np.int64)
+    for start in range(0, count, batch):
+        rows = rng.permuted(
+            np.broadcast_to(symbols, (min(batch, count - start), len(symbols))),
+            axis=1
+        )
+        shuffled = statistics(rows, median)
+        greater += np.count_nonzero(shuffled > worker_reference, axis=0)
+        equal += np.count_nonzero(shuffled == worker_reference, axis=0)
+
+    return greater, equal
+
+
+def permutation_test(symbols: np.ndarray, workers=None, seed=None):
+    '''
+    Rank the statistics of symbols among PERMUTATIONS shuffles of it.
+
+    Shuffles run in a pool of spawned processes, CHUNK_SIZE permutations
+    per task, each task with its own SeedSequence child so results do not
+    depend on scheduling. Stops early once every test is decided.
+    '''
+    symbols = np.ascontiguousarray(symbols, dtype=np.int64)
+    median = np.median(symbols)
+    reference = statistics(symbols, median)[0]
+
+    if workers is None:
+        workers = len(available_cpus())
+    chunks = [
+        (seed, min(CHUNK_SIZE, PERMUTATIONS - start))
+        for seed, start in zip(
+            np.random.SeedSequence(seed).spawn(
+                math.ceil(PERMUTATIONS / CHUNK_SIZE)
+            ),
+            range(0, PERMUTATIONS, CHUNK_SIZE)
+        )
+    ]
+
+    greater = np.zeros(len(STATISTICS), dtype=np.int64)
+    equal = np.zeros(len(STATISTICS), dtype=np.int64)
+    done = 0
+
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=init_worker,
+        initargs=(symbols, reference)
+    )
+    try:
+        pending = {}
+        chunks = iter(chunks)
+        for chunk in chunks:
+            pending[executor.submit(permutation_worker, *chunk)] = chunk[1]
+            if len(pending) >= 2 * workers:
+                break
+
+        while pending:
+            finished, _ = futures.wait(
+                pending,
+                return_when=futures.FIRST_COMPLETED
+            )
+            for future in finished:
+                chunk_greater, chunk_equal = future.result()
+                greater += chunk_greater
+                equal += chunk_equal
+                done += pending.pop(future)
+
+            # Passing tests are settled early, failing ones at the end
+            passing = (greater + equal > 5) & (done - greater > 5)
+            if passing.all():
+                break
+
+            for chunk in chunks:
+                pending[executor.submit(permutation_worker, *chunk)] = chunk[1]
+                if len(pending) >= 2 * workers:
+                    break
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+    passed = (greater + equal > 5) & (greater < done - 5)
+    results = [
+        PermutationResult(name, float(value), int(g), int(e), bool(p))
+        for name, value, g, e, p in zip(
+            STATISTICS,
+            reference,
+            greater,
+            equal,
+            passed
+        )
+    ]
+    return results, done
+
+
+def allocate_bins(expected: np.ndarray):
+    '''
+    Bin index for every category, smallest expected counts combined until
+    every bin expects at least 5. Returns (bins, number of bins).
+    '''
+    order = np.argsort(expected, kind='stable')
+    bins = np.zeros(len(expected), dtype=np.int64)
+
+    current, total = 0, 0.0
+    for category in order.tolist():
+        bins[category] = current
+        total += expected[category]
+        if total >= 5:
+            current, total = current + 1, 0.0
+
+    # A short last bin is merged into the one before it
+    if total > 0 and current > 0:
+        bins[bins == current] = current - 1
+    elif total > 0:
+        current += 1
+    return bins, current
+
+
+def chi_square_result(statistic: float, degrees_of_freedom: int):
+    from scipy import stats
+
+    if degrees_of_freedom < 1:
+        return ChiSquareResult(float(statistic), degrees_of_freedom, 1.0, True)
+    p_value = float(stats.chi2.sf(statistic, degrees_of_freedom))
+    return ChiSquareResult(
+        float(statistic),
+        degrees_of_freedom,
+        p_value,
+        p_value >= ALPHA
+    )
+
+
+def chi_square_independence(symbols: np.ndarray, k: int):
+    '''SP 800-90B 5.2.1: consecutive pairs against the product of the marginals.'''
+    n = len(symbols)
+    p = np.bincount(symbols, minlength=k) / n
+    expected = np.outer(p, p).ravel() * (n - 1)
+    observed = np.bincount(symbols[:-1] * k + symbols[1:], minlength=k * k)
+
+    bins, n_bins = allocate_bins(expected)
+    expected = np.bincount(bins, weights=expected, minlength=n_bins)
+    observed = np.bincount(bins, weights=observed, minlength=n_bins)
+    statistic = np.sum((observed - expected) ** 2 / expected)
+
+    return chi_square_result(statistic, n_bins - 1)
+
+
+def chi_square_goodness_of_fit(symbols: np.ndarray, k: int):
+    '''SP 800-90B 5.2.2: symbol counts of 10 equal parts against the whole.'''
+    parts = 10
+    length = len(symbols) // parts
+    counts = np.stack([
+        np.bincount(part, minlength=k)
+        for part in symbols[:length * parts].reshape(parts, length)
+    ])
+
+    expected = counts.sum(axis=0) / parts
+    bins, n_bins = allocate_bins(expected)
+    expected = np.bincount(bins, weights=expected, minlength=n_bins)
+    statistic = 0.0
+    for part in counts:
+        observed = np.bincount(bins, weights=part, minlength=n_bins)
+        statistic += np.sum((observed - expected) ** 2 / expected)
+
+    return chi_square_result(statistic, (parts - 1) * (n_bins - 1))
+
+
+def longest_repeated_substring(symbols: np.ndarray, k: int):
+    '''
+    SP 800-90B 5.2.3: probability of a repeat at least as long as the
+    longest one seen, if the symbols were IID.
+    '''
+    n = len(symbols)
+    _, _, length = Estimators.tuple_statistics(symbols)
+    if length == 0:
+        return LRSResult(0, 1.0, True)
+
+    p_collision = np.sum((np.bincount(symbols, minlength=k) / n) ** 2)
+    tuples = n - length + 1
+    pairs = tuples * (tuples - 1) / 2
+    probability = -math.expm1(pairs * math.log1p(-p_collision ** length))
+    return LRSResult(length, probability, probability >= ALPHA)
+
+
+def iid_test(data, workers=None, seed=None):
+    '''Full SP 800-90B IID verdict for a sample sequence.'''
+    symbols, k = Estimators.symbols(data)
+    permutation_tests, permutations = permutation_test(symbols, workers, seed)
+    independence = chi_square_independence(symbols, k)
+    goodness_of_fit = chi_square_goodness_of_fit(symbols, k)
+    lrs = longest_repeated_substring(symbols, k)
+
+    passed = (
+        all(test.passed for test in permutation_tests)
+        and independence.passed
+        and goodness_of_fit.passed
+        and lrs.passed
+    )
+    return IIDVerdict(
+        passed,
+        permutations,
+        permutation_tests,
+        independence,
+        goodness_of_fit,
+        lrs
+    )
+
+
+def verdict_record(name: str, verdict: IIDVerdict):
+    return {
+        'name': name,
+        'iid': verdict.passed,
+        'permutations': verdict.permutations,
+        'permutation_tests': [test._asdict() for test in verdict.permutation_tests],
+        'independence': verdict.independence._asdict(),
+        'goodness_of_fit': verdict.goodness_of_fit._asdict(),
+        'lrs': verdict.lrs._asdict(),
+    }
+
+
+def main(argv=None):
+    from store import ResultStore
+
+    parser = argparse.ArgumentParser(
+        prog='run.py iid',
+        description='Run the SP 800-90B IID tests on stored batch results.'
+    )
+    parser.add_argument('directory', help='Batch output directory')
+    parser.add_argument(
+        'names',
+        nargs='*',
+        help='Cells to test (default: every cell in the directory)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='Number of permutation processes'
+    )
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    store = ResultStore(args.directory)
+    for name in args.names or store.names():
+        samples, _ = store.load(name)
+        verdict = iid_test(samples, args.workers, args.seed)
+
+        failed = [
+            test.name for test in verdict.permutation_tests if not test.passed
+        ]
+        print(
+            f'{name}: {"IID" if verdict.passed else "not IID"}',
+            f'({verdict.permutations} permutations',
+            f'failed: {", ".join(failed) or "none"})'
+        )
+        with open(os.path.join(args.directory, 'iid.jsonl'), 'a') as file:
+            file.write(json.dumps(verdict_record(name, verdict)) + '\n')
+
+
+if __name__ == '__main__':
+    main()
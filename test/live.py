@@ -0,0 +1,189 @@
+import math
+import numpy as np
+
+from analysis import JitterHistogram, JitterHistogramBatch
+from lod import view_bins
+
+# Redraw at most this often while samples stream in
+FRAME_INTERVAL_MS = 100
+# Samples per chunk a live collection asks for, rounded to whole buckets
+CHUNK_SIZE = 1 << 16
+# When samples leave the y range, it grows by this factor at once so
+# full redraws stay rare
+Y_HEADROOM = 1.5
+
+
+class LiveSeries:
+    '''
+    Streaming min/max envelope and histogram of one level's samples.
+
+    Samples are reduced to buckets of a fixed size as they arrive, so the
+    line holds at most two points per pixel column of the final x range,
+    whatever the number of samples.
+    '''
+    def __init__(self, ax, level, total: int, bucket: int):
+        self.level = level
+        self.bucket = bucket
+        self.count = 0
+        self.histogram = JitterHistogram()
+
+        buckets = math.ceil(total / bucket)
+        self.x = np.empty(2 * buckets, dtype=np.float64)
+        self.y = np.empty(2 * buckets, dtype=np.float64)
+        self.points = 0
+
+        self.line, = ax.plot([], [], color=level.color, animated=True)
+
+    def append(self, chunk: np.ndarray):
+        '''
+        Add a chunk. Buckets start at every chunk, so chunks other than
+        the last should be whole buckets, unless they were filtered.
+        '''
+        if len(chunk) == 0:
+            return
+        starts = np.arange(0, len(chunk), self.bucket)
+        minima = np.minimum.reduceat(chunk, starts)
+        maxima = np.maximum.reduceat(chunk, starts)
+
+        end = self.points + 2 * len(starts)
+        self.x[self.points:end] = np.repeat(self.count + starts, 2)
+        self.y[self.points:end] = np.column_stack((minima, maxima)).ravel()
+        self.points = end
+        self.line.set_data(self.x[:end], self.y[:end])
+
+        self.count += len(chunk)
+        self.histogram.update(chunk)
+
+    def y_range(self):
+        if self.points == 0:
+            return None
+        return self.y[:self.points].min(), self.y[:self.points].max()
+
+
+class LivePlot:
+    '''
+    An axes fed with chunks while collection is still running.
+
+    Lines and legend are animated artists: every frame restores the
+    background saved at the last full draw and blits only them. A full
+    redraw only happens when the data leaves the y range. Legend entries
+    show running values of the metrics that can be computed from a
+    histogram, see MetricType.batch_func.
+    '''
+    def __init__(self, ax, levels, total: int, metrics, legend=True):
+        self.ax = ax
+        self.canvas = ax.figure.canvas
+        self.total = total
+        self.background = None
+
+        width, _ = view_bins(ax)
+        self.bucket = max(1, math.ceil(total / width))
+        self.chunk_size = max(self.bucket, CHUNK_SIZE // self.bucket * self.bucket)
+
+        self.series = {
+            level.name: LiveSeries(ax, level, total, self.bucket)
+            for level in levels
+        }
+        self.metrics = [
+            metric for metric in metrics if metric.batch_func is not None
+        ]
+
+        ax.set_xlim(0, max(total, 1))
+        self.legend = None
+        self.legend_entries = []
+        if legend and self.metrics:
+            from matplotlib.lines import Line2D
+
+            handles = []
+            for series in self.series.values():
+                for metric in self.metrics:
+                    handles.append(Line2D(
+                        [0],
+                        [0],
+                        color=series.level.color,
+                        linestyle='--',
+                        label=self.label(metric, None, series)
+                    ))
+                    self.legend_entries.append((series, metric))
+            self.legend = ax.legend(handles=handles, loc='upper right')
+            self.legend.set_animated(True)
+
+        self.draw_connection = self.canvas.mpl_connect(
+            'draw_event',
+            self.on_draw
+        )
+
+    def label(self, metric, value, series):
+        value = 'n/a' if value is None else f'{value:.2f}'
+        return f'{metric.metric_name}: {value} | {series.level.level}'
+
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.ax.figure.bbox)
+        self.draw_artists()
+
+    def draw_artists(self):
+        for series in self.series.values():
+            self.ax.draw_artist(series.line)
+        if self.legend is not None:
+            self.ax.draw_artist(self.legend)
+
+    def update(self, chunks):
+        '''Append (level name, chunk) pairs and redraw once.'''
+        for name, chunk in chunks:
+            self.series[name].append(chunk)
+
+        if self.legend is not None:
+            self.update_legend()
+
+        if self.rescale() or self.background is None:
+            self.canvas.draw()
+            return
+
+        self.canvas.restore_region(self.background)
+        self.draw_artists()
+        self.canvas.blit(self.ax.figure.bbox)
+
+    def update_legend(self):
+        started = [
+            series for series in self.series.values() if series.histogram.total
+        ]
+        values = {}
+        if started:
+            batch = JitterHistogramBatch.from_histograms(
+                [series.histogram for series in started]
+            )
+            for metric in self.metrics:
+                for series, value in zip(started, metric.batch_func(batch)):
+                    values[series.level.name, metric] = float(value)
+
+        texts = self.legend.get_texts()
+        for text, (series, metric) in zip(texts, self.legend_entries):
+            value = values.get((series.level.name, metric))
+            text.set_text(self.label(metric, value, series))
+
+    def rescale(self):
+        ranges = [
+            series.y_range()
+            for series in self.series.values()
+            if series.points
+        ]
+        if not ranges:
+            return False
+
+        low = min(r[0] for r in ranges)
+        high = max(r[1] for r in ranges)
+        bottom, top = self.ax.get_ylim()
+        if self.background is not None and bottom <= low and high <= top:
+            return False
+
+        span = max(high - low, 1.0)
+        self.ax.set_ylim(
+            max(0.0, low - span * (Y_HEADROOM - 1)),
+            high + span * (Y_HEADROOM - 1)
+        )
+        return True
+
+    def finish(self):
+        '''Stop blitting and clear the axes for the final graph.'''
+        self.canvas.mpl_disconnect(self.draw_connection)
+        self.ax.cla()
@@ -0,0 +1,178 @@
+import numpy as np
+
+# Graphs with more points than this per level are drawn through a level
+# of detail layer instead of one matplotlib artist per sample
+LOD_THRESHOLD = 100000
+# Upper bound on bins per axis, whatever the reported widget size
+MAX_BINS = 4096
+
+
+def view_bins(ax):
+    '''Pixel size of the axes, the resolution layers aggregate to.'''
+    extent = ax.get_window_extent()
+    return (
+        int(np.clip(extent.width, 1, MAX_BINS)),
+        int(np.clip(extent.height, 1, MAX_BINS))
+    )
+
+
+def visible_slice(indices: np.ndarray, low: float, high: float):
+    '''Slice of the sorted indices that lies within [low, high].'''
+    start = np.searchsorted(indices, low, side='left')
+    stop = np.searchsorted(indices, high, side='right')
+    return slice(start, stop)
+
+
+def data_limits(values: np.ndarray):
+    if len(values) == 0:
+        return 0.0, 1.0
+    low, high = float(np.min(values)), float(np.max(values))
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+    return low, high
+
+
+class LODLayer:
+    '''
+    Base of the level of detail layers.
+
+    A layer keeps the full samples and draws an aggregate of the part in
+    view at the resolution of the axes. It re-aggregates whenever the view
+    limits change, so zooming in with the toolbar brings back detail and
+    drawing cost depends on the number of pixels, not samples.
+    '''
+    def __init__(self, ax, indices, values, color):
+        self.ax = ax
+        self.indices = np.asarray(indices)
+        self.values = np.asarray(values)
+        self.color = color
+        self.limits = None
+
+        self.x_limits = data_limits(self.indices)
+        self.y_limits = self.value_limits()
+        self.artist = self.create()
+        # Callback registries only keep weak references to methods
+        self.artist.lod = self
+        self.aggregate(self.x_limits, self.y_limits)
+
+        ax.update_datalim([
+            (self.x_limits[0], self.y_limits[0]),
+            (self.x_limits[1], self.y_limits[1])
+        ])
+        ax.autoscale_view()
+        ax.callbacks.connect('xlim_changed', self.on_limits_changed)
+        ax.callbacks.connect('ylim_changed', self.on_limits_changed)
+
+    def on_limits_changed(self, ax):
+        limits = (ax.get_xlim(), ax.get_ylim())
+        if limits != self.limits:
+            self.aggregate(*limits)
+
+    def value_limits(self):
+        return data_limits(self.values)
+
+    def create(self):
+        raise NotImplementedError
+
+    def aggregate(self, x_limits, y_limits):
+        raise NotImplementedError
+
+
+class DensityLayer(LODLayer):
+    '''Scatter replacement: sample counts per pixel, drawn as one image.'''
+    def create(self):
+        from matplotlib.colors import LinearSegmentedColormap, to_rgb
+
+        rgb = to_rgb(self.color)
+        colormap = LinearSegmentedColormap.from_list(
+            f'lod-{self.color}',
+            [(*rgb, 0.25), (*rgb, 1.0)]
+        )
+        colormap.set_bad(alpha=0.0)
+
+        return self.ax.imshow(
+            np.ma.masked_all((1, 1)),
+            cmap=colormap,
+            origin='lower',
+            aspect='auto',
+            interpolation='nearest',
+            extent=(*self.x_limits, *self.y_limits)
+        )
+
+    def aggregate(self, x_limits, y_limits):
+        x_low, x_high = sorted(x_limits)
+        y_low, y_high = sorted(y_limits)
+        width, height = view_bins(self.ax)
+
+        visible = visible_slice(self.indices, x_low, x_high)
+        counts, _, _ = np.histogram2d(
+            self.indices[visible],
+            self.values[visible],
+            bins=(width, height),
+            range=((x_low, x_high), (y_low, y_high))
+        )
+
+        # Log scale, so single outliers stay visible next to dense bands
+        density = np.ma.masked_equal(np.log1p(counts.T), 0)
+        self.artist.set_data(density)
+        self.artist.set_clim(0, max(float(density.max() or 0), 1e-9))
+        self.limits = (x_limits, y_limits)
+        self.artist.set_extent((x_low, x_high, y_low, y_high))
+
+
+class EnvelopeLayer(LODLayer):
+    '''
+    Line replacement: the min/max envelope of every pixel column, drawn
+    as one polyline zigzagging between them. With a baseline, columns run
+    from the baseline to their max instead, which stands in for bars.
+    '''
+    def __init__(self, ax, indices, values, color, label=None, baseline=None):
+        self.label = label
+        self.baseline = baseline
+        super().__init__(ax, indices, values, color)
+
+    def value_limits(self):
+        low, high = data_limits(self.values)
+        if self.baseline is None:
+            return low, high
+        return min(low, self.baseline), max(high, self.baseline)
+
+    def create(self):
+        line, = self.ax.plot([], [], color=self.color, label=self.label)
+        return line
+
+    def aggregate(self, x_limits, y_limits):
+        x_low, x_high = sorted(x_limits)
+        width, _ = view_bins(self.ax)
+
+        # Keep one sample past each edge, so the line leaves the view
+        visible = visible_slice(self.indices, x_low, x_high)
+        visible = slice(max(visible.start - 1, 0), visible.stop + 1)
+        indices = self.indices[visible]
+        values = self.values[visible]
+        self.limits = (x_limits, y_limits)
+
+        if len(values) <= 2 * width:
+            if self.baseline is not None:
+                x = np.repeat(indices, 3)
+                y = np.column_stack((
+                    np.full(len(values), self.baseline),
+                    values,
+                    np.full(len(values), self.baseline)
+                )).ravel()
+                self.artist.set_data(x, y)
+            else:
+                self.artist.set_data(indices, values)
+            return
+
+        edges = np.linspace(indices[0], indices[-1], width + 1)
+        starts = np.unique(np.searchsorted(indices, edges[:-1], side='left'))
+        maxima = np.maximum.reduceat(values, starts)
+        if self.baseline is not None:
+            minima = np.full(len(maxima), self.baseline, dtype=maxima.dtype)
+        else:
+            minima = np.minimum.reduceat(values, starts)
+
+        x = np.repeat(indices[starts], 2)
+        y = np.column_stack((minima, maxima)).ravel()
+        self.artist.set_data(x, y)
@@ -1,19 +1,163 @@
+import numpy as np
+from collections import namedtuple
 from ffi import FFI
+from variants import load_variants
 from enum import Enum, EnumMeta, unique
 
+# Empty op samples per calibration pass
+CALIBRATION_ITERATIONS = 100000
 
-class OptimizationLevel(Enum):
-    O0 = ('-O0', 'blue')
-    O1 = ('-O1', 'red')
-    O2 = ('-O2', 'green')
-    O3 = ('-O3', 'purple')
-    OFAST = ('-Ofast', 'orange')
-    OG = ('-Og', 'black')
-    OS = ('-Os', 'pink')
+Calibration = namedtuple(
+    'Calibration',
+    ['minimum', 'median', 'mean', 'p99']
+)
 
-    def __init__(self, optimization_level: str, color: str):
+
+class BuildLevel(Enum):
+    def __init__(self, optimization_level: str, color: str, flags: tuple):
         self.level = optimization_level
         self.color = color
+        self.flags = flags
+        self.lib_name = f'jitter2infinitylib{optimization_level}'
+
+
+# O0, O1, O2, O3, OFAST, OG and OS, plus any variants registered in
+# noise-sources/variants.json
+OptimizationLevel = BuildLevel(
+    'OptimizationLevel',
+    [
+        (variant.name, (variant.level, variant.color, variant.flags))
+        for variant in load_variants()
+    ],
+    module=__name__
+)
+
+
+class TimerBackendMeta(EnumMeta):
+    def __getitem__(self, timer_name: str):
+        for member in self:
+            if member.timer_name == timer_name:
+                return member
+        raise KeyError(f"TimerBackend with name '{timer_name}' not found.")
+
+
+@unique
+class TimerBackend(Enum, metaclass=TimerBackendMeta):
+    # Values match the TIMER_* constants in lib.h
+    RDTSC = (0, 'rdtsc', 'ticks')
+    RDTSC_LFENCE = (1, 'lfence + rdtsc', 'ticks')
+    RDTSC_MFENCE = (2, 'mfence + rdtsc', 'ticks')
+    RDTSCP = (3, 'rdtscp', 'ticks')
+    MONOTONIC_RAW = (4, 'CLOCK_MONOTONIC_RAW', 'ns')
+
+    def __init__(self, timer_id: int, timer_name: str, unit: str):
+        self.timer_id = timer_id
+        self.timer_name = timer_name
+        self.unit = unit
+
+    def calibrate(self, ffi: FFI, iterations=CALIBRATION_ITERATIONS):
+        '''
+        Distribution of this timer's own cost, measured around empty_op.
+
+        Runs once per library and is cached on the FFI wrapper after.
+        '''
+        if self not in ffi.calibrations:
+            overhead = np.empty(iterations, dtype=np.uint64)
+            if ffi.lib.get_ticks_diff_timed_bulk(
+                ffi.lib.empty_op,
+                self.timer_id,
+                ffi.ffi.from_buffer('uint64_t[]', overhead),
+                iterations
+            ) < 0:
+                raise ValueError(f'Unknown timer: {self}')
+            ffi.calibrations[self] = Calibration(
+                int(overhead.min()),
+                float(np.median(overhead)),
+                float(overhead.mean()),
+                float(np.percentile(overhead, 99))
+            )
+
+        return ffi.calibrations[self]
+
+    def subtract_overhead(self, ffi: FFI, time_diffs: np.ndarray):
+        '''Subtract the fixed timer cost, the calibration minimum, in place.'''
+        baseline = np.uint64(self.calibrate(ffi).minimum)
+        np.maximum(time_diffs, baseline, out=time_diffs)
+        time_diffs -= baseline
+        return time_diffs
+
+
+class EvictionModeMeta(EnumMeta):
+    def __getitem__(self, eviction_name: str):
+        for member in self:
+            if member.eviction_name == eviction_name:
+                return member
+        raise KeyError(f"EvictionMode with name '{eviction_name}' not found.")
+
+
+@unique
+class EvictionMode(Enum, metaclass=EvictionModeMeta):
+    # Values match the EVICTION_* constants in lib.h
+    NONE = (0, 'Warm cache')
+    CLFLUSH = (1, 'clflush operation code')
+    BUFFER = (2, 'Evict by buffer walk')
+    PRIME_PROBE = (3, 'Prime + probe')
+
+    def __init__(self, eviction_id: int, eviction_name: str):
+        self.eviction_id = eviction_id
+        self.eviction_name = eviction_name
+
+    def state(self, ffi: FFI, operation):
+        '''
+        Eviction state of operation in this library, NULL when warm.
+
+        States are made once per library and operation, and freed with
+        the library's FFI wrapper. Prime + probe buffers belong to their
+        state, the buffer walk of every operation shares one buffer.
+        '''
+        if self is EvictionMode.NONE:
+            return ffi.ffi.NULL
+
+        key = (self, operation)
+        if key not in ffi.evictions:
+            state = ffi.ffi.new('struct eviction_state *')
+            result = ffi.lib.eviction_init(
+                state,
+                self.eviction_id,
+                getattr(ffi.lib, operation.operation_cdef),
+                0
+            )
+            if result == -2:
+                raise MemoryError(f'No memory for the {self.eviction_name} buffer.')
+            if result == -3:
+                raise ValueError(f'{self.name} eviction is not supported on this platform.')
+            if result != 0:
+                raise ValueError(f'Unknown eviction mode {self.name}.')
+            ffi.evictions[key] = ffi.ffi.gc(state, ffi.lib.eviction_free)
+
+        return ffi.evictions[key]
+
+    def probe_ticks(self, ffi: FFI, operation):
+        '''Mean ticks to reload the primed sets after a sample, or None.'''
+        state = ffi.evictions.get((self, operation))
+        if self is not EvictionMode.PRIME_PROBE or state is None or not state.probes:
+            return None
+        return state.probe_ticks / state.probes
+
+
+@unique
+class Workload(Enum):
+    # Values match the WORKLOAD_* constants in lib.h, with the size the
+    # operation ran at before it took one
+    TSP = (0, 6, 'vertices')
+    TSP_DP = (1, 4, 'cities')
+    GRAPH_COLOR = (2, 6, 'vertices')
+    LONG_LOOP = (3, 100000, 'iterations')
+
+    def __init__(self, workload_id: int, default_size: int, unit: str):
+        self.workload_id = workload_id
+        self.default_size = default_size
+        self.unit = unit
 
 
 class OperationTypeMeta(EnumMeta):
@@ -59,22 +203,26 @@ class OperationType(Enum, metaclass=OperationTypeMeta):
     TSP_OP = (
         'tsp_op',
         'get_ticks_diff',
-        'Traveling Salesman Approximation'
+        'Traveling Salesman Approximation',
+        Workload.TSP
     )
     TSP_DP_OP = (
         'tsp_dp_op',
         'get_ticks_diff',
-        'DP Traveling Salesman Approximation'
+        'DP Traveling Salesman Approximation',
+        Workload.TSP_DP
     )
     GRAPH_COLOR_OP = (
         'graph_color_op',
         'get_ticks_diff',
-        'Graph Coloring'
+        'Graph Coloring',
+        Workload.GRAPH_COLOR
     )
     LONG_LOOP_OP = (
         'long_loop_op',
         'get_ticks_diff',
-        'Long Loop'
+        'Long Loop',
+        Workload.LONG_LOOP
     )
     RDTSC_OP = (
         'rdtsc_op',
@@ -91,21 +239,98 @@ class OperationType(Enum, metaclass=OperationTypeMeta):
         self,
         operation_cdef: str,
         measure_cdef: str,
-        operation_name: str
+        operation_name: str,
+        workload: Workload = None
     ):
         self.operation_cdef = operation_cdef
         self.measure_cdef = measure_cdef
         self.operation_name = operation_name
+        self.workload = workload
+
+    def configure(self, ffi: FFI, size=None):
+        '''
+        Set how much work every call does, None for the default size.
+
+        The input of a size is generated on first use and kept by the
+        library, so switching back to a size costs nothing. Applies to
+        every later sample of this operation from the same library.
+        '''
+        if self.workload is None:
+            raise ValueError(f'{self.operation_name} takes no size.')
+        if size is None:
+            size = self.workload.default_size
+
+        result = ffi.lib.workload_configure(self.workload.workload_id, size)
+        if result == -2:
+            raise MemoryError(f'No memory for {self.operation_name} of size {size}.')
+        if result != 0:
+            raise ValueError(f'Invalid size {size} for {self.operation_name}.')
 
-    def run(self, ffi: FFI, iterations=100, flush=False):
-        time_diffs = []
-        for i in range(0, iterations):
-            ffi_func = getattr(ffi.lib, self.operation_cdef)
+    def sample(
+        self,
+        ffi: FFI,
+        time_diffs: np.ndarray,
+        eviction=EvictionMode.NONE,
+        timer=TimerBackend.RDTSC,
+        subtract_overhead=False
+    ):
+        '''
+        Fill a uint64 array in place with one measurement per element,
+        taken with the given timer. With subtract_overhead, the timer's
+        calibrated fixed cost is taken off every sample.
+
+        Every sample starts from the cache state of eviction, set up in C
+        between samples and outside the timed window.
+        '''
+        ffi_func = getattr(ffi.lib, self.operation_cdef)
 
-            diff = ffi.lib.get_ticks_diff(ffi_func)
-            time_diffs.append(diff)
-            if flush:
-                print("flushing...")
-                ffi.lib.flush_cache(ffi_func)
+        # Samples are written straight into the array, no copy back
+        if ffi.lib.get_ticks_diff_evicted_bulk(
+            ffi_func,
+            timer.timer_id,
+            eviction.state(ffi, self),
+            ffi.ffi.from_buffer('uint64_t[]', time_diffs),
+            len(time_diffs)
+        ) < 0:
+            raise ValueError(f'Unknown timer: {timer}')
+
+        if subtract_overhead:
+            timer.subtract_overhead(ffi, time_diffs)
 
         return time_diffs
+
+    def run(
+        self,
+        ffi: FFI,
+        iterations=100,
+        eviction=EvictionMode.NONE,
+        timer=TimerBackend.RDTSC,
+        subtract_overhead=False
+    ):
+        time_diffs = np.empty(iterations, dtype=np.uint64)
+        return self.sample(ffi, time_diffs, eviction, timer, subtract_overhead)
+
+    def stream(
+        self,
+        ffi: FFI,
+        chunk_size: int,
+        total=None,
+        eviction=EvictionMode.NONE,
+        timer=TimerBackend.RDTSC,
+        subtract_overhead=False
+    ):
+        '''
+        Yield uint64 chunks of chunk_size samples as they are collected.
+
+        Runs until total samples have been yielded, or forever when total
+        is None. The last chunk is shorter if total is not a multiple of
+        chunk_size. Every chunk is a new array, so consumers may keep it.
+        '''
+        collected = 0
+        while total is None or collected < total:
+            size = chunk_size
+            if total is not None:
+                size = min(chunk_size, total - collected)
+
+            yield self.run(ffi, size, eviction, timer, subtract_overhead)
+            collected += size
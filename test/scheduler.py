@@ -0,0 +1,257 @@
+import math
+import tempfile
+import time
+from collections import namedtuple
+import numpy as np
+
+from analysis import JitterHistogramBatch, MetricType
+from operation import EvictionMode, TimerBackend
+
+# Samples of one batch, every batch gives one estimate of every metric
+BATCH_SIZE = 1 << 16
+# Batches of a cell's first round, before its spread is known
+MIN_BATCHES = 8
+# Most samples one cell may take, it stops there unconverged
+MAX_SAMPLES = 1 << 26
+# Full width of the 95% interval a metric has to reach, in its own unit
+TARGET_WIDTH = 0.05
+TIME_BUDGET = 60.0
+Z_95 = 1.96
+DEFAULT_METRICS = (MetricType.Min_Entropy, MetricType.MostCommonValue)
+
+Interval = namedtuple('Interval', ['estimate', 'low', 'high', 'batches'])
+
+
+class Cell:
+    '''
+    Samples and per-batch metric estimates of one (operation, level).
+
+    Intervals are batch means: every metric is evaluated on each batch of
+    batch_size samples, and the standard error of the full run is the
+    spread of those estimates over the square root of their number.
+    Batches much longer than the correlation of the jitter keep this
+    honest for non-IID samples.
+
+    Intervals are centred on the mean of the batch estimates, so they
+    bound the metric of batch_size samples. Estimators that grow or shrink
+    with the sample count, such as T_Tuple, differ from their value over
+    the whole run, which batch.save_cell records next to the interval.
+    Samples are spooled to temporary files rather than held in memory.
+    '''
+    def __init__(
+        self,
+        operation,
+        level,
+        metrics,
+        eviction=EvictionMode.NONE,
+        batch_size=BATCH_SIZE
+    ):
+        self.operation = operation
+        self.level = level
+        self.eviction = eviction
+        self.metrics = metrics
+        self.batch_size = batch_size
+        self.spool = tempfile.TemporaryFile()
+        self.counts_spool = None
+        self.counts_dtype = None
+        self.estimates = {metric.name: [] for metric in metrics}
+        self.samples = 0
+        # Seconds per sample, from the rounds so far
+        self.cost = None
+        self.status = 'running'
+
+    def add(self, samples: np.ndarray, counts=None):
+        whole = len(samples) // self.batch_size * self.batch_size
+        batches = np.reshape(samples[:whole], (-1, self.batch_size))
+        if len(batches):
+            batch = JitterHistogramBatch(batches)
+            for metric in self.metrics:
+                if metric.batch_func is not None:
+                    values = metric.batch_func(batch)
+                else:
+                    values = [metric.func(row) for row in batches]
+                self.estimates[metric.name].extend(values)
+
+        self.spool.write(np.ascontiguousarray(samples, dtype=np.uint64).data)
+        if counts is not None:
+            if self.counts_spool is None:
+                self.counts_spool = tempfile.TemporaryFile()
+                self.counts_dtype = counts.dtype
+            self.counts_spool.write(np.ascontiguousarray(counts).data)
+        self.samples += len(samples)
+
+    def half_width(self, metric):
+        values = np.asarray(self.estimates[metric.name])
+        if len(values) < 2 or not np.all(np.isfinite(values)):
+            return math.inf
+        return Z_95 * float(np.std(values, ddof=1)) / math.sqrt(len(values))
+
+    def widths(self):
+        return {
+            metric.name: 2 * self.half_width(metric)
+            for metric in self.metrics
+        }
+
+    def batches_needed(self, target_width):
+        '''Further batches until every interval narrows to target_width.'''
+        needed = 0
+        for metric in self.metrics:
+            half = self.half_width(metric)
+            if math.isinf(half):
+                return len(self.estimates[metric.name]) or MIN_BATCHES
+            batches = len(self.estimates[metric.name])
+            # The half width shrinks with the square root of the batches
+            total = math.ceil(batches * (2 * half / target_width) ** 2)
+            needed = max(needed, total - batches)
+        return needed
+
+    def result(self):
+        '''
+        All samples and their counts, memory-mapped from the spool, and
+        the interval of every metric.
+        '''
+        samples = np.empty(0, dtype=np.uint64)
+        counts = None
+        if self.samples:
+            self.spool.flush()
+            samples = np.memmap(self.spool, dtype=np.uint64, mode='r', shape=(self.samples,))
+        if self.counts_spool is not None:
+            self.counts_spool.flush()
+            counts = np.memmap(
+                self.counts_spool,
+                dtype=self.counts_dtype,
+                mode='r',
+                shape=(self.samples,)
+            )
+        intervals = {}
+        for metric in self.metrics:
+            values = self.estimates[metric.name]
+            if not values:
+                continue
+            estimate = float(np.mean(values))
+            half = self.half_width(metric)
+            intervals[metric.name] = Interval(
+                estimate,
+                estimate - half,
+                estimate + half,
+                len(values)
+            )
+        return samples, counts, intervals
+
+
+class AdaptiveScheduler:
+    '''
+    Samples cells in rounds until their metric intervals converge.
+
+    A round gives every cell that has not converged the batches its
+    spread says it still needs, at most doubling what it has, so noisy
+    cells get more samples than quiet ones. When the rest of the time
+    budget cannot fit a round, cells are served widest interval first,
+    by their measured cost per sample, and the others wait.
+    '''
+    def __init__(
+        self,
+        collector,
+        metrics=DEFAULT_METRICS,
+        target_width=TARGET_WIDTH,
+        time_budget=TIME_BUDGET,
+        batch_size=BATCH_SIZE,
+        max_samples=MAX_SAMPLES,
+        timer=TimerBackend.RDTSC,
+        subtract_overhead=False,
+        counters=None
+    ):
+        self.collector = collector
+        self.metrics = list(metrics)
+        self.target_width = target_width
+        self.time_budget = time_budget
+        self.batch_size = batch_size
+        self.max_samples = max_samples
+        self.timer = timer
+        self.subtract_overhead = subtract_overhead
+        self.counters = counters
+
+    def plan(self, cells, remaining: float):
+        '''Samples to collect per cell this round, within remaining seconds.'''
+        wanted = []
+        for cell in cells:
+            if cell.status != 'running':
+                continue
+            if not cell.samples:
+                batches = MIN_BATCHES
+            else:
+                batches = cell.batches_needed(self.target_width)
+                if batches <= 0:
+                    cell.status = 'converged'
+                    continue
+                batches = min(batches, cell.samples // self.batch_size)
+            size = min(batches * self.batch_size, self.max_samples - cell.samples)
+            if size <= 0:
+                cell.status = 'max_samples'
+                continue
+            wanted.append((cell, size))
+
+        # Cells run side by side, one per worker
+        seconds = remaining * len(self.collector.cpus)
+        widest = sorted(
+            wanted,
+            key=lambda item: -max(item[0].widths().values(), default=math.inf)
+        )
+        tasks = []
+        for cell, size in widest:
+            if cell.cost is None:
+                tasks.append((cell, size))
+                continue
+            # Whole batches only, so every batch mean has the same length
+            fits = int(seconds / cell.cost) // self.batch_size * self.batch_size
+            size = min(size, fits)
+            if size > 0:
+                tasks.append((cell, size))
+                seconds -= size * cell.cost
+        return tasks
+
+    def cells(self, operations, levels, evictions=(EvictionMode.NONE,)):
+        return [
+            Cell(operation, level, self.metrics, eviction, self.batch_size)
+            for operation in operations
+            for level in levels
+            for eviction in evictions
+        ]
+
+    def run(self, cells, on_round=None):
+        '''
+        Sample cells until every one converged, reached max_samples, or
+        the time budget ran out. on_round(cells) is called after every
+        round. Cells still running at the end are marked 'budget'.
+        '''
+        start = time.perf_counter()
+        while True:
+            remaining = self.time_budget - (time.perf_counter() - start)
+            tasks = self.plan(cells, remaining) if remaining > 0 else []
+            if not tasks:
+                break
+
+            by_task = {
+                (cell.operation, cell.level, size, cell.eviction): cell
+                for cell, size in tasks
+            }
+            round_start = time.perf_counter()
+            for task, samples, counts in self.collector.as_completed(
+                list(by_task),
+                self.timer,
+                self.subtract_overhead,
+                self.counters
+            ):
+                cell = by_task[task]
+                # Queued tasks look slower than they are, so costs err long
+                cost = (time.perf_counter() - round_start) / len(samples)
+                cell.cost = cost if cell.cost is None else min(cell.cost, cost)
+                cell.add(samples, counts)
+
+            if on_round is not None:
+                on_round(cells)
+
+        for cell in cells:
+            if cell.status == 'running':
+                cell.status = 'budget'
+        return cells
@@ -0,0 +1,210 @@
+import argparse
+import json
+import os
+from collections import namedtuple
+import numpy as np
+
+# Lags the autocorrelation goes out to by default
+MAX_LAG = 1 << 14
+# Samples read from a run at once, memory-mapped runs included
+CHUNK_SIZE = 1 << 20
+# Welch segment length and overlap
+SEGMENT = 4096
+OVERLAP = 0.5
+# A period is reported when its spectral peak stands this far above the
+# median power and its autocorrelation this many standard errors outside
+# white noise, well beyond the 95% band since many lags are looked at
+PEAK_RATIO = 10.0
+Z_95 = 1.96
+Z_SIGNIFICANT = 4.0
+
+Spectrum = namedtuple('Spectrum', ['frequencies', 'power', 'segments'])
+Periodicity = namedtuple(
+    'Periodicity',
+    [
+        'period',
+        'frequency',
+        'power_ratio',
+        'autocorrelation',
+        'significant',
+    ]
+)
+
+
+def chunk_mean(data, chunk_size=CHUNK_SIZE):
+    total = 0.0
+    for start in range(0, len(data), chunk_size):
+        total += float(np.sum(data[start:start + chunk_size], dtype=np.float64))
+    return total / max(len(data), 1)
+
+
+def fft_size(n: int):
+    return 1 << max(0, int(n - 1).bit_length())
+
+
+def autocorrelation(data, max_lag=MAX_LAG, chunk_size=CHUNK_SIZE):
+    '''
+    Normalized autocorrelation of data at lags 0..max_lag, in O(n log n).
+
+    The run is read in blocks. Every block is correlated with itself plus
+    the max_lag samples after it through one FFT, so products that cross
+    block boundaries are counted once, and only a block and its tail are
+    in memory at a time. Same biased estimator as statsmodels' acf.
+    Empty for fewer than 2 samples.
+    '''
+    n = len(data)
+    max_lag = min(max_lag, n - 1)
+    if n < 2 or max_lag < 0:
+        return np.empty(0)
+
+    mean = chunk_mean(data, chunk_size)
+    block = max(chunk_size, 4 * max_lag)
+    size = fft_size(block + max_lag)
+    sums = np.zeros(max_lag + 1)
+
+    for start in range(0, n, block):
+        head = np.asarray(data[start:start + block], dtype=np.float64) - mean
+        tail = np.asarray(data[start:start + len(head) + max_lag], dtype=np.float64) - mean
+        spectrum = np.conj(np.fft.rfft(head, size)) * np.fft.rfft(tail, size)
+        sums += np.fft.irfft(spectrum, size)[:max_lag + 1]
+
+    if sums[0] == 0:
+        return np.zeros(max_lag + 1)
+    return sums / sums[0]
+
+
+def welch(data, segment=SEGMENT, overlap=OVERLAP, chunk_size=CHUNK_SIZE):
+    '''
+    Welch power spectral density, one-sided, frequencies in cycles per
+    sample. Segments are Hann windowed and have their own mean removed.
+    Segments are taken chunk by chunk, so memory stays at one chunk.
+    Empty for fewer than 3 samples, the Hann window of 2 is all zeros.
+    '''
+    segment = min(segment, len(data))
+    if segment < 3:
+        return Spectrum(np.empty(0), np.empty(0), 0)
+    step = max(1, int(segment * (1 - overlap)))
+    window = np.hanning(segment)
+    scale = 1.0 / np.sum(window ** 2)
+
+    power = np.zeros(segment // 2 + 1)
+    count = 0
+    per_chunk = max(1, chunk_size // step)
+    starts = range(0, len(data) - segment + 1, step)
+
+    for first in range(0, len(starts), per_chunk):
+        batch = starts[first:first + per_chunk]
+        part = np.asarray(
+            data[batch[0]:batch[-1] + segment],
+            dtype=np.float64
+        )
+        segments = np.lib.stride_tricks.sliding_window_view(part, segment)[::step]
+        segments = segments - segments.mean(axis=1, keepdims=True)
+        power += np.sum(np.abs(np.fft.rfft(segments * window, axis=1)) ** 2, axis=0)
+        count += len(segments)
+
+    power *= scale / max(count, 1)
+    # One-sided: fold the negative frequencies, except DC and Nyquist
+    power[1:-1 if segment % 2 == 0 else None] *= 2
+    return Spectrum(np.fft.rfftfreq(segment), power, count)
+
+
+def dominant_period(data, spectrum: Spectrum = None, acf=None, max_lag=MAX_LAG):
+    '''
+    Strongest periodic component. The Welch peak above DC gives the
+    frequency. A spike train puts equal power in every harmonic, so the
+    period is the first multiple of the peak period at which the
+    autocorrelation stands out of white noise. Significant when there is
+    one and the peak is PEAK_RATIO above the median power.
+    '''
+    if spectrum is None:
+        spectrum = welch(data)
+    power = spectrum.power[1:]
+    if len(power) == 0 or not np.any(power > 0):
+        return Periodicity(None, None, 0.0, 0.0, False)
+
+    peak = int(np.argmax(power)) + 1
+    frequency = float(spectrum.frequencies[peak])
+    ratio = float(spectrum.power[peak] / max(np.median(power), 1e-300))
+    if acf is None:
+        acf = autocorrelation(data, max_lag)
+
+    bound = Z_SIGNIFICANT / np.sqrt(max(len(data), 1))
+    width = spectrum.frequencies[1] / 2
+    period = 1.0 / frequency
+    correlation = 0.0
+    for multiple in range(1, int((len(acf) - 1) * frequency) + 1):
+        # Lags the peak bin allows for this multiple. Long periods are
+        # placed by the autocorrelation, short ones are finer than a lag
+        low = max(1, int(np.floor(multiple / (frequency + width))))
+        high = min(len(acf) - 1, int(np.ceil(multiple / max(frequency - width, 1e-12))))
+        lags = np.arange(low, high + 1)
+        if len(lags) == 0:
+            break
+        best = lags[np.argmax(acf[lags])]
+        if acf[best] > bound:
+            period = float(best) if len(lags) >= 3 else multiple / frequency
+            correlation = float(acf[best])
+            break
+
+    significant = ratio >= PEAK_RATIO and correlation > bound
+    return Periodicity(
+        period,
+        1.0 / period,
+        ratio,
+        correlation,
+        bool(significant)
+    )
+
+
+def spectral_record(name: str, data, max_lag=MAX_LAG):
+    acf = autocorrelation(data, max_lag)
+    spectrum = welch(data)
+    periodicity = dominant_period(data, spectrum, acf)
+    bound = Z_95 / np.sqrt(max(len(data), 1))
+    return {
+        'name': name,
+        'samples': len(data),
+        'periodicity': periodicity._asdict(),
+        'significant_lags': int(np.count_nonzero(np.abs(acf[1:]) > bound)),
+        'max_lag': max(len(acf) - 1, 0),
+        'acf_1': float(acf[1]) if len(acf) > 1 else None,
+    }
+
+
+def main(argv=None):
+    from store import ResultStore
+
+    parser = argparse.ArgumentParser(
+        prog='run.py spectral',
+        description='Autocorrelation and periodicity of stored batch results.'
+    )
+    parser.add_argument('directory', help='Batch output directory')
+    parser.add_argument(
+        'names',
+        nargs='*',
+        help='Cells to analyse (default: every cell in the directory)'
+    )
+    parser.add_argument('--max-lag', type=int, default=MAX_LAG)
+    args = parser.parse_args(argv)
+
+    store = ResultStore(args.directory)
+    for name in args.names or store.names():
+        samples, _ = store.load(name)
+        record = spectral_record(name, samples, args.max_lag)
+
+        periodicity = record['periodicity']
+        if periodicity['significant']:
+            found = f'period {periodicity["period"]:.1f} samples'
+        else:
+            found = 'no significant period'
+        print(
+            f'{name}: {found},',
+            f'{record["significant_lags"]}/{record["max_lag"]} lags outside the noise band'
+        )
+        with open(os.path.join(args.directory, 'spectral.jsonl'), 'a') as file:
+            file.write(json.dumps(record) + '\n')
+
+
+if __name__ == '__main__':
+    main()
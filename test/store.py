@@ -0,0 +1,127 @@
+import json
+import os
+import platform
+import time
+import numpy as np
+
+# File layout: a fixed size header holding the magic line and a JSON
+# metadata object padded with spaces, followed by raw little-endian
+# uint64 samples. The sample count follows from the file size, so a
+# column stays readable even if its writer never closed it.
+MAGIC = b'JITTER2INFINITY 1\n'
+HEADER_SIZE = 4096
+DTYPE = np.dtype('<u8')
+EXTENSION = '.j2i'
+
+
+def encode_header(metadata: dict):
+    header = MAGIC + json.dumps(metadata).encode()
+    if len(header) >= HEADER_SIZE:
+        raise ValueError(f'Metadata does not fit in {HEADER_SIZE} bytes.')
+    return header.ljust(HEADER_SIZE - 1) + b'\n'
+
+
+def decode_header(header: bytes):
+    if not header.startswith(MAGIC):
+        raise ValueError('Not a jitter2infinity result file.')
+    return json.loads(header[len(MAGIC):])
+
+
+class ResultWriter:
+    '''Append-only writer for one column of uint64 samples.'''
+    def __init__(self, path: str, metadata: dict):
+        self.path = path
+        self.metadata = dict(metadata)
+        self.metadata.setdefault('host', platform.node())
+        self.metadata['started'] = time.time()
+        self.metadata['finished'] = None
+        self.count = 0
+
+        self.file = open(path, 'wb')
+        self.file.write(encode_header(self.metadata))
+
+    def write(self, chunk):
+        chunk = np.ascontiguousarray(chunk, dtype=DTYPE)
+        self.file.write(chunk.data)
+        self.count += len(chunk)
+
+    def close(self):
+        if self.file.closed:
+            return
+
+        self.metadata['finished'] = time.time()
+        self.metadata['count'] = self.count
+        self.file.seek(0)
+        self.file.write(encode_header(self.metadata))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ResultStore:
+    '''
+    A directory of result columns, one file per (operation, level) run.
+
+    Columns are written in chunks and loaded back with np.memmap, so even
+    100M-sample runs reopen without reading or parsing the samples.
+    '''
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name: str):
+        return os.path.join(self.directory, name + EXTENSION)
+
+    def writer(self, name: str, operation, level, **metadata):
+        metadata.update({
+            'operation': operation.name,
+            'level': level.name,
+            'flags': level.level,
+        })
+        return ResultWriter(self.path(name), metadata)
+
+    def save(
+        self,
+        name: str,
+        samples,
+        operation,
+        level,
+        chunk_size=1 << 20,
+        **metadata
+    ):
+        with self.writer(name, operation, level, **metadata) as writer:
+            for start in range(0, len(samples), chunk_size):
+                writer.write(samples[start:start + chunk_size])
+
+    def names(self):
+        return sorted(
+            entry[:-len(EXTENSION)]
+            for entry in os.listdir(self.directory)
+            if entry.endswith(EXTENSION)
+        )
+
+    def metadata(self, name: str):
+        with open(self.path(name), 'rb') as file:
+            return decode_header(file.read(HEADER_SIZE))
+
+    def load(self, name: str):
+        '''Return (samples, metadata), samples memory-mapped read-only.'''
+        path = self.path(name)
+        metadata = self.metadata(name)
+
+        count = (os.path.getsize(path) - HEADER_SIZE) // DTYPE.itemsize
+        if count == 0:
+            return np.empty(0, dtype=DTYPE), metadata
+
+        samples = np.memmap(
+            path,
+            dtype=DTYPE,
+            mode='r',
+            offset=HEADER_SIZE,
+            shape=(count,)
+        )
+        return samples, metadata
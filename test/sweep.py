@@ -0,0 +1,201 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+
+from analysis import Analysis, MetricType
+from batch import parse_members
+from ffi import FFIRegistry
+from operation import OptimizationLevel, OperationType, TimerBackend, Workload
+
+# Sizes swept per workload unless given, the defaults included
+SIZES = {
+    Workload.TSP: (6, 12, 24, 48, 96, 192, 384),
+    Workload.TSP_DP: (4, 6, 8, 10, 12),
+    Workload.GRAPH_COLOR: (6, 12, 24, 48, 96, 192, 384),
+    Workload.LONG_LOOP: (100, 1000, 10000, 100000, 1000000),
+}
+ITERATIONS = 100000
+# CPU seconds one point may take, slow sizes get fewer samples
+POINT_SECONDS = 2.0
+FIRST_CHUNK = 64
+
+
+def collect(operation, ffi, iterations, seconds, timer):
+    '''
+    Samples of the configured size, at most iterations or as many as
+    fit in seconds of CPU time, and the CPU time they took.
+    '''
+    time_diffs = np.empty(iterations, dtype=np.uint64)
+    collected = 0
+    chunk = FIRST_CHUNK
+    cpu = 0.0
+    while collected < iterations and cpu < seconds:
+        size = min(chunk, iterations - collected)
+        start = time.process_time()
+        operation.sample(ffi, time_diffs[collected:collected + size], timer=timer)
+        cpu += time.process_time() - start
+        collected += size
+        chunk *= 2
+    return time_diffs[:collected], cpu
+
+
+def sweep_point(operation, level, ffi, size, metric, iterations, seconds, timer):
+    operation.configure(ffi, size)
+    samples, cpu = collect(operation, ffi, iterations, seconds, timer)
+    entropy = float(Analysis.evaluate([samples], [metric])[0][metric.name])
+    return {
+        'operation': operation.name,
+        'level': level.name,
+        'size': size,
+        'unit': operation.workload.unit,
+        'samples': len(samples),
+        'cpu_seconds': cpu,
+        'samples_per_second': len(samples) / cpu if cpu else None,
+        'metric': metric.name,
+        'entropy_per_sample': entropy,
+        'entropy_per_second': entropy * len(samples) / cpu if cpu else None,
+    }
+
+
+def best(records):
+    '''Record with the most entropy per CPU-second of every operation.'''
+    results = {}
+    for record in records:
+        current = results.get(record['operation'])
+        rate = record['entropy_per_second'] or 0.0
+        if current is None or rate > (current['entropy_per_second'] or 0.0):
+            results[record['operation']] = record
+    return results
+
+
+def plot(records, metric, path: str):
+    '''Entropy per CPU-second over size, one panel per operation.'''
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    operations = list(dict.fromkeys(record['operation'] for record in records))
+    fig = Figure(figsize=(6 * len(operations), 5))
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(1, len(operations), squeeze=False)[0]
+    winners = best(records)
+
+    for ax, operation_name in zip(axes, operations):
+        operation = OperationType.__members__[operation_name]
+        rows = [record for record in records if record['operation'] == operation_name]
+        for level_name in dict.fromkeys(record['level'] for record in rows):
+            level = OptimizationLevel.__members__[level_name]
+            points = [record for record in rows if record['level'] == level_name]
+            ax.plot(
+                [record['size'] for record in points],
+                [record['entropy_per_second'] for record in points],
+                marker='o',
+                color=level.color,
+                label=level.level
+            )
+        winner = winners[operation_name]
+        ax.annotate(
+            f'{winner["size"]} {winner["unit"]}, {winner["level"]}',
+            (winner['size'], winner['entropy_per_second']),
+            textcoords='offset points',
+            xytext=(0, 8),
+            ha='center'
+        )
+        ax.set_xscale('log')
+        ax.set_yscale('log')
+        ax.set_xlabel(f'Size ({operation.workload.unit})')
+        ax.set_ylabel(f'{metric.metric_name} bits per CPU-second')
+        ax.set_title(operation.operation_name)
+        ax.legend()
+
+    fig.tight_layout()
+    fig.savefig(path)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='run.py sweep',
+        description='Entropy per CPU-second of the parametric workloads across sizes.'
+    )
+    parser.add_argument(
+        '--operations',
+        nargs='+',
+        default=['all'],
+        help='OperationType members with a size (default: all of them)'
+    )
+    parser.add_argument('--levels', nargs='+', default=['all'])
+    parser.add_argument(
+        '--sizes',
+        nargs='+',
+        type=int,
+        help='Sizes for every operation (default: per workload)'
+    )
+    parser.add_argument('--iterations', type=int, default=ITERATIONS)
+    parser.add_argument(
+        '--seconds',
+        type=float,
+        default=POINT_SECONDS,
+        help='CPU seconds per point, before iterations are reached'
+    )
+    parser.add_argument('--metric', default='Min_Entropy', choices=list(MetricType.__members__))
+    parser.add_argument('--timer', default='RDTSC', choices=list(TimerBackend.__members__))
+    parser.add_argument(
+        '--output',
+        default=f'sweep-{time.strftime("%Y%m%d-%H%M%S")}',
+        help='Directory sweep.jsonl and sweep.png are written to'
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.operations == ['all']:
+        operations = [operation for operation in OperationType if operation.workload]
+    else:
+        operations = parse_members(OperationType, args.operations)
+    levels = parse_members(OptimizationLevel, args.levels)
+    metric = MetricType.__members__[args.metric]
+    timer = TimerBackend.__members__[args.timer]
+    registry = FFIRegistry(OptimizationLevel)
+
+    os.makedirs(args.output, exist_ok=True)
+    records = []
+    for operation in operations:
+        if operation.workload is None:
+            raise ValueError(f'{operation.operation_name} takes no size.')
+        for level in levels:
+            ffi = registry[level.name]
+            for size in args.sizes or SIZES[operation.workload]:
+                record = sweep_point(
+                    operation,
+                    level,
+                    ffi,
+                    size,
+                    metric,
+                    args.iterations,
+                    args.seconds,
+                    timer
+                )
+                records.append(record)
+                print(
+                    f'{operation.name} {level.name} {size}:',
+                    f'{record["samples"]} samples,',
+                    f'{record["entropy_per_sample"]:.3f} bits/sample,',
+                    f'{record["entropy_per_second"]:.4g} bits/s'
+                )
+                with open(os.path.join(args.output, 'sweep.jsonl'), 'a') as file:
+                    file.write(json.dumps(record) + '\n')
+            operation.configure(ffi)
+
+    for operation_name, record in best(records).items():
+        print(
+            f'Best {operation_name}: size {record["size"]} at {record["level"]},',
+            f'{record["entropy_per_second"]:.4g} bits per CPU-second'
+        )
+    plot(records, metric, os.path.join(args.output, 'sweep.png'))
+
+
+if __name__ == '__main__':
+    main()
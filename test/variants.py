@@ -0,0 +1,41 @@
+import json
+from collections import namedtuple
+from os import path
+
+# Extra build variants can be registered here without touching the code,
+# as a JSON list of {"name", "level", "flags", "color"} objects, e.g.
+# [{"name": "NATIVE", "level": "-O2-native",
+#   "flags": ["-O2", "-march=native"], "color": "brown"}]
+VARIANTS_FILE = './noise-sources/variants.json'
+
+# name: OptimizationLevel member name
+# level: label and library suffix, jitter2infinitylib{level}
+# flags: compiler flags the library is built with
+BuildVariant = namedtuple('BuildVariant', ['name', 'level', 'flags', 'color'])
+
+DEFAULT_VARIANTS = [
+    BuildVariant('O0', '-O0', ('-O0',), 'blue'),
+    BuildVariant('O1', '-O1', ('-O1',), 'red'),
+    BuildVariant('O2', '-O2', ('-O2',), 'green'),
+    BuildVariant('O3', '-O3', ('-O3',), 'purple'),
+    BuildVariant('OFAST', '-Ofast', ('-Ofast',), 'orange'),
+    BuildVariant('OG', '-Og', ('-Og',), 'black'),
+    BuildVariant('OS', '-Os', ('-Os',), 'pink'),
+]
+
+
+def load_variants(variants_file: str = VARIANTS_FILE):
+    '''Built-in optimization levels followed by any registered variants.'''
+    variants = list(DEFAULT_VARIANTS)
+
+    if path.isfile(variants_file):
+        with open(variants_file) as file:
+            for entry in json.load(file):
+                variants.append(BuildVariant(
+                    name=entry['name'],
+                    level=entry['level'],
+                    flags=tuple(entry['flags']),
+                    color=entry.get('color', 'gray')
+                ))
+
+    return variants
@@ -0,0 +1,93 @@
+import numpy as np
+
+from cache import CacheKey, MeasurementCache
+from counters import counts_table
+from operation import EvictionMode, OperationType, OptimizationLevel, TimerBackend
+
+
+def make_key(iterations):
+    return CacheKey(
+        list(OperationType)[0].name,
+        list(OptimizationLevel)[0].name,
+        'hash',
+        iterations,
+        EvictionMode.NONE.name,
+        TimerBackend.RDTSC.name,
+        False
+    )
+
+
+def make_counts(n):
+    return counts_table(
+        np.arange(n * 7, dtype=np.uint64).reshape(n, 7),
+        ['page_faults', 'context_switches']
+    )
+
+
+def test_runs_without_counts_miss_when_counts_are_asked_for(tmp_path):
+    cache = MeasurementCache(directory=str(tmp_path))
+    key = make_key(100)
+    cache.put(key, np.arange(100, dtype=np.uint64))
+
+    assert cache.get(key) is not None
+    assert cache.get(key, counters=True) is None
+
+    reopened = MeasurementCache(directory=str(tmp_path))
+    assert reopened.get(key, counters=True) is None
+    samples, counts = reopened.get(key)
+    assert samples.tolist() == list(range(100))
+    assert counts is None
+
+
+def test_counts_come_back_from_disk(tmp_path):
+    key = make_key(50)
+    MeasurementCache(directory=str(tmp_path)).put(
+        key,
+        np.arange(50, dtype=np.uint64),
+        make_counts(50)
+    )
+
+    samples, counts = MeasurementCache(directory=str(tmp_path)).get(key, counters=True)
+    assert counts.dtype.names == ('page_faults', 'context_switches')
+    assert np.array_equal(counts, make_counts(50))
+
+
+def test_trim_disk_drops_least_recently_used(tmp_path):
+    # Every entry is a 4096 byte header plus 800 bytes of samples
+    cache = MeasurementCache(directory=str(tmp_path), disk_budget=3 * 4896)
+    keys = [make_key(100 + i) for i in range(3)]
+    for key in keys:
+        cache.put(key, np.arange(100, dtype=np.uint64))
+    assert cache.disk_size == 3 * 4896
+
+    # Reading the first makes the second the least recently used
+    cache.entries.clear()
+    assert cache.get(keys[0]) is not None
+    cache.put(make_key(200), np.arange(100, dtype=np.uint64))
+
+    assert cache.disk_size == 3 * 4896
+    names = set(cache.store.names())
+    assert cache.name(keys[0]) in names
+    assert cache.name(keys[1]) not in names
+    assert cache.name(keys[2]) in names
+
+
+def test_disk_index_survives_sessions(tmp_path):
+    cache = MeasurementCache(directory=str(tmp_path))
+    cache.put(make_key(10), np.arange(10, dtype=np.uint64), make_counts(10))
+    cache.put(make_key(20), np.arange(20, dtype=np.uint64))
+
+    reopened = MeasurementCache(directory=str(tmp_path))
+    assert reopened.disk_size == cache.disk_size
+    assert {
+        name: (size, sorted(paths))
+        for name, (size, paths) in reopened.disk_entries.items()
+    } == {
+        name: (size, sorted(paths))
+        for name, (size, paths) in cache.disk_entries.items()
+    }
+
+    # Rewritten without counts, the old counter columns go
+    reopened.put(make_key(10), np.arange(10, dtype=np.uint64))
+    assert reopened.counter_store.names() == []
+    assert reopened.disk_size == 2 * 4096 + 30 * 8
@@ -0,0 +1,448 @@
+import math
+import numpy as np
+import pytest
+from scipy import optimize, special
+
+from analysis import Analysis
+from estimators import Estimators, scoreboard
+
+
+def scoreboard_reference(correct):
+    '''SP 800-90B section 6.3.7 scoreboard, one prediction at a time.'''
+    n_predictors, n = correct.shape
+    scores = [0] * n_predictors
+    winner = 0
+    result = []
+    for t in range(n):
+        result.append(bool(correct[winner, t]))
+        for j in range(n_predictors):
+            if correct[j, t]:
+                scores[j] += 1
+                if scores[j] >= scores[winner]:
+                    winner = j
+    return np.array(result, dtype=bool)
+
+
+def test_scoreboard_keeps_first_winner_until_tied():
+    # All scores are 0 at the second prediction, subpredictor 0 keeps it
+    correct = np.array([
+        [False, True, False],
+        [False, False, False],
+        [False, False, False],
+        [False, False, True],
+    ])
+    assert scoreboard(correct).tolist() == [False, True, False]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1 << 16])
+def test_scoreboard_matches_reference(chunk_size):
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        correct = rng.random((4, 50)) < rng.random()
+        assert np.array_equal(
+            scoreboard(correct, chunk_size),
+            scoreboard_reference(correct)
+        )
+
+
+# Reference implementations, written as the loops of SP 800-90B section 6.3
+
+def prediction_entropy_reference(correct, k):
+    n = len(correct)
+    hits = sum(correct)
+    if hits == 0:
+        p_global = 1 - 0.01 ** (1 / n)
+    else:
+        p = hits / n
+        p_global = min(1.0, p + 2.576 * math.sqrt(p * (1 - p) / (n - 1)))
+
+    r = 1
+    run = 0
+    for hit in correct:
+        run = run + 1 if hit else 0
+        r = max(r, run + 1)
+
+    def no_run_probability(p):
+        q = 1 - p
+        x = 1.0
+        for _ in range(10):
+            x = 1 + q * p ** r * x ** (r + 1)
+        return (1 - p * x) / ((r + 1 - r * x) * q) / x ** (n + 1) - 0.99
+
+    p_local = optimize.brentq(no_run_probability, 1e-9, 1 - 1e-6, xtol=1e-14)
+    return -math.log2(max(p_global, p_local, 1 / k))
+
+
+def ensemble_reference(subpredictions, values):
+    '''Run subpredictors through the scoreboard, None never matches.'''
+    scores = [0] * len(subpredictions[0])
+    winner = 0
+    correct = []
+    for guesses, value in zip(subpredictions, values):
+        correct.append(guesses[winner] == value)
+        for j, guess in enumerate(guesses):
+            if guess == value:
+                scores[j] += 1
+                if scores[j] >= scores[winner]:
+                    winner = j
+    return correct
+
+
+def symbol_samples(n, seed, sticky=0.0):
+    '''Jitter-like samples whose low byte walks a 4 symbol Markov chain.'''
+    rng = np.random.default_rng(seed)
+    symbols = [0]
+    for _ in range(n - 1):
+        if rng.random() < sticky:
+            symbols.append(symbols[-1])
+        else:
+            symbols.append(int(rng.integers(4)))
+    table = np.array([3, 17, 130, 255])
+    return table[symbols] + 256 * rng.integers(0, 50, n)
+
+
+def bit_samples(n, seed, p_one=0.5, p_repeat=None):
+    rng = np.random.default_rng(seed)
+    bits = [int(rng.random() < p_one)]
+    for _ in range(n - 1):
+        if p_repeat is not None and rng.random() < p_repeat:
+            bits.append(bits[-1])
+        else:
+            bits.append(int(rng.random() < p_one))
+    return 2 * rng.integers(0, 1000, n) + np.array(bits)
+
+
+def low_bytes(data):
+    return [int(x) & 0xFF for x in data]
+
+
+def test_prediction_entropy_alternating_hits():
+    # p_global = 0.5 dominates, longest run of hits is 1
+    correct = np.arange(1000) % 2 == 0
+    assert Estimators.prediction_entropy(correct, 4) == pytest.approx(
+        -math.log2(0.5 + 2.576 * math.sqrt(0.25 / 999))
+    )
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_prediction_entropy_matches_reference(seed):
+    rng = np.random.default_rng(seed)
+    correct = rng.random(2000) < rng.random()
+    correct[500:500 + 10 * seed] = True
+    assert Estimators.prediction_entropy(correct, 256) == pytest.approx(
+        prediction_entropy_reference(correct.tolist(), 256),
+        rel=1e-6
+    )
+
+
+def test_most_common_value():
+    data = np.concatenate((np.zeros(40), np.arange(1, 61)))
+    assert Analysis.calculate_most_common_value(data) == pytest.approx(
+        0.9245810849146348
+    )
+
+
+def test_markov_alternating_bits():
+    # p01 = p10 = 1, the most likely sequence has probability 1/2
+    assert Estimators.calculate_markov(np.arange(1000)) == pytest.approx(1 / 128)
+
+
+@pytest.mark.parametrize('p_one, p_repeat', [
+    (0.5, None), (0.7, None), (0.5, 0.8), (0.3, 0.2), (0.9, 0.5)
+])
+def test_markov_matches_viterbi(p_one, p_repeat):
+    data = bit_samples(5000, 1, p_one, p_repeat)
+    bits = [int(x) & 1 for x in data]
+
+    counts = np.zeros((2, 2))
+    for a, b in zip(bits, bits[1:]):
+        counts[a, b] += 1
+    with np.errstate(divide='ignore'):
+        start = np.log2([1 - np.mean(bits), np.mean(bits)])
+        step = np.log2(counts / counts.sum(axis=1, keepdims=True))
+
+    # Most likely 128-bit sequence over all of them, not just the 6 shapes
+    best = start
+    for _ in range(127):
+        best = np.max(best[:, None] + step, axis=0)
+
+    assert Estimators.calculate_markov(data) == pytest.approx(
+        min(-np.max(best) / 128, 1.0)
+    )
+
+
+def test_collision_alternating_bits():
+    # Every collision takes 3 samples, above the expected time at p = 0.5
+    assert Estimators.calculate_collision(np.arange(1000)) == 1.0
+
+
+@pytest.mark.parametrize('p_one, p_repeat', [
+    (0.5, 0.3), (0.6, None), (0.5, 0.5), (0.75, None)
+])
+def test_collision_matches_reference(p_one, p_repeat):
+    data = bit_samples(20000, 2, p_one, p_repeat)
+    bits = [int(x) & 1 for x in data]
+
+    times = []
+    start = 0
+    seen = set()
+    for j, bit in enumerate(bits):
+        if bit in seen:
+            times.append(j - start + 1)
+            start = j + 1
+            seen = set()
+        else:
+            seen.add(bit)
+
+    v = len(times)
+    mean = np.mean(times)
+    sigma = np.std(times, ddof=1)
+    mean_lower = mean - 2.576 * sigma / math.sqrt(v)
+
+    def expected_time(p):
+        q = 1 - p
+        # F(1/z) = Gamma(3, z) z^-3 e^z
+        z = 1 / q
+        f = 2 * special.gammaincc(3, z) * z ** -3 * math.exp(z)
+        return (
+            p / q ** 2 * (1 + (1 / p - 1 / q) / 2) * f
+            - p / q * (1 / p - 1 / q) / 2
+            - mean_lower
+        )
+
+    if expected_time(0.5) <= 0:
+        p = 0.5
+    else:
+        p = optimize.brentq(expected_time, 0.5, 0.99, xtol=1e-14)
+
+    assert Estimators.calculate_collision(data) == pytest.approx(
+        -math.log2(p),
+        rel=1e-6
+    )
+
+
+@pytest.mark.parametrize('p_one, p_repeat', [(0.5, None), (0.8, None), (0.5, 0.6)])
+def test_compression_matches_reference(p_one, p_repeat):
+    b, d = 6, 1000
+    data = bit_samples(6 * 1300, 3, p_one, p_repeat)
+    bits = [int(x) & 1 for x in data]
+    blocks = len(bits) // b
+    words = [tuple(bits[i * b:(i + 1) * b]) for i in range(blocks)]
+
+    dictionary = {}
+    for i in range(d):
+        dictionary[words[i]] = i + 1
+    distances = []
+    for i in range(d, blocks):
+        distances.append(i + 1 - dictionary.get(words[i], 0))
+        dictionary[words[i]] = i + 1
+
+    v = blocks - d
+    logs = np.log2(distances)
+    mean = logs.mean()
+    sigma = 0.5907 * math.sqrt(np.sum(logs ** 2) / (v - 1) - mean ** 2)
+    mean_lower = mean - 2.576 * sigma / math.sqrt(v)
+
+    def g(z):
+        # sum over t = d + 1..L of sum over u = 1..t of log2(u) F(z, t, u)
+        u = np.arange(1, blocks + 1)
+        terms = np.log2(u) * (1 - z) ** (u - 1)
+        below = np.concatenate(([0.0], np.cumsum(terms)[:-1]))
+        t = np.arange(d + 1, blocks + 1)
+        return np.sum(z * z * below[t - 1] + z * terms[t - 1]) / v
+
+    def expected_value(p):
+        q = (1 - p) / (2 ** b - 1)
+        return g(p) + (2 ** b - 1) * g(q) - mean_lower
+
+    if expected_value(2.0 ** -b) <= 0:
+        p = 2.0 ** -b
+    else:
+        p = optimize.brentq(expected_value, 2.0 ** -b, 1 - 1e-9, xtol=1e-14)
+
+    assert Estimators.calculate_compression(data) == pytest.approx(
+        min(-math.log2(p) / b, 1.0),
+        rel=1e-6
+    )
+
+
+def tuple_counts(values):
+    '''Counts of every i-tuple, for i up to the longest repeated one.'''
+    counts = [None]
+    i = 1
+    while True:
+        tuples = {}
+        for start in range(len(values) - i + 1):
+            key = tuple(values[start:start + i])
+            tuples[key] = tuples.get(key, 0) + 1
+        if max(tuples.values()) < 2:
+            return counts
+        counts.append(list(tuples.values()))
+        i += 1
+
+
+@pytest.mark.parametrize('seed, sticky', [(4, 0.0), (5, 0.5), (6, 0.8)])
+def test_t_tuple_matches_reference(seed, sticky):
+    data = symbol_samples(3000, seed, sticky)
+    values = low_bytes(data)
+    n = len(values)
+    counts = tuple_counts(values)
+
+    t = max(i for i in range(1, len(counts)) if max(counts[i]) >= 35)
+    p_max = max(
+        (max(counts[i]) / (n - i + 1)) ** (1 / i)
+        for i in range(1, t + 1)
+    )
+    p_upper = min(1.0, p_max + 2.576 * math.sqrt(p_max * (1 - p_max) / (n - 1)))
+
+    assert Estimators.calculate_t_tuple(data) == pytest.approx(-math.log2(p_upper))
+
+
+@pytest.mark.parametrize('seed, sticky', [(4, 0.0), (5, 0.5), (6, 0.8)])
+def test_lrs_matches_reference(seed, sticky):
+    data = symbol_samples(3000, seed, sticky)
+    values = low_bytes(data)
+    n = len(values)
+    counts = tuple_counts(values)
+
+    u = min(i for i in range(1, len(counts)) if max(counts[i]) < 35)
+    v = len(counts) - 1
+    p_max = 0.0
+    for w in range(u, v + 1):
+        pairs = sum(c * (c - 1) // 2 for c in counts[w])
+        tuples = n - w + 1
+        p_max = max(p_max, (pairs / (tuples * (tuples - 1) // 2)) ** (1 / w))
+    p_upper = min(1.0, p_max + 2.576 * math.sqrt(p_max * (1 - p_max) / (n - 1)))
+
+    assert Estimators.calculate_lrs(data) == pytest.approx(-math.log2(p_upper))
+
+
+@pytest.mark.parametrize('seed, sticky', [(7, 0.0), (8, 0.6)])
+def test_multi_mcw_matches_reference(seed, sticky):
+    windows = (63, 255, 1023, 4095)
+    data = symbol_samples(5000, seed, sticky)
+    values = low_bytes(data)
+
+    counts = [{} for _ in windows]
+    last = {}
+    subpredictions = []
+    for i in range(len(values)):
+        if i >= windows[0]:
+            guesses = []
+            for j, w in enumerate(windows):
+                if i < w:
+                    guesses.append(None)
+                    continue
+                window = counts[j]
+                # Ties go to the value seen most recently
+                guesses.append(max(
+                    (x for x in window if window[x]),
+                    key=lambda x: (window[x], last[x])
+                ))
+            subpredictions.append(guesses)
+
+        # Slide every window over values[i]
+        last[values[i]] = i
+        for j, w in enumerate(windows):
+            counts[j][values[i]] = counts[j].get(values[i], 0) + 1
+            if i >= w:
+                counts[j][values[i - w]] -= 1
+    correct = ensemble_reference(subpredictions, values[windows[0]:])
+
+    assert Estimators.calculate_multi_mcw(data) == pytest.approx(
+        prediction_entropy_reference(correct, len(set(values))),
+        rel=1e-6
+    )
+
+
+@pytest.mark.parametrize('seed, sticky', [(9, 0.0), (10, 0.6)])
+def test_lag_matches_reference(seed, sticky):
+    lags = 128
+    data = symbol_samples(1500, seed, sticky)
+    values = low_bytes(data)
+
+    subpredictions = [
+        [values[i - d] if d <= i else None for d in range(1, lags + 1)]
+        for i in range(1, len(values))
+    ]
+    correct = ensemble_reference(subpredictions, values[1:])
+
+    assert Estimators.calculate_lag(data) == pytest.approx(
+        prediction_entropy_reference(correct, len(set(values))),
+        rel=1e-6
+    )
+
+
+@pytest.mark.parametrize('seed, sticky', [(11, 0.0), (12, 0.6)])
+def test_multi_mmc_matches_reference(seed, sticky):
+    orders = 16
+    data = symbol_samples(1500, seed, sticky)
+    values = low_bytes(data)
+
+    models = [{} for _ in range(orders)]
+    subpredictions = []
+    for i in range(2, len(values)):
+        for d in range(1, orders + 1):
+            if d < i:
+                model = models[d - 1].setdefault(tuple(values[i - d - 1:i - 1]), {})
+                model[values[i - 1]] = model.get(values[i - 1], 0) + 1
+        guesses = []
+        for d in range(1, orders + 1):
+            model = models[d - 1].get(tuple(values[i - d:i])) if d <= i else None
+            if model:
+                # Ties go to the largest symbol
+                guesses.append(max(model, key=lambda y: (model[y], y)))
+            else:
+                guesses.append(None)
+        subpredictions.append(guesses)
+    correct = ensemble_reference(subpredictions, values[2:])
+
+    assert Estimators.calculate_multi_mmc(data) == pytest.approx(
+        prediction_entropy_reference(correct, len(set(values))),
+        rel=1e-6
+    )
+
+
+def full_dictionary_samples():
+    '''Random bytes that fill the LZ78Y dictionary, then a short cycle.'''
+    rng = np.random.default_rng(15)
+    cycle = np.tile([250, 251, 252], 500)
+    return np.concatenate((rng.integers(0, 200, 4500), cycle))
+
+
+@pytest.mark.parametrize('data', [
+    symbol_samples(7000, 13),
+    symbol_samples(7000, 14, 0.3),
+    full_dictionary_samples(),
+])
+def test_lz78y_matches_reference(data):
+    depth = 16
+    max_dictionary = 65536
+    values = low_bytes(data)
+
+    dictionary = {}
+    correct = []
+    for i in range(depth + 1, len(values)):
+        for j in range(depth, 0, -1):
+            context = tuple(values[i - j - 1:i - 1])
+            if context not in dictionary and len(dictionary) < max_dictionary:
+                dictionary[context] = {}
+            if context in dictionary:
+                model = dictionary[context]
+                model[values[i - 1]] = model.get(values[i - 1], 0) + 1
+
+        prediction = None
+        max_count = 0
+        for j in range(depth, 0, -1):
+            model = dictionary.get(tuple(values[i - j:i]))
+            if model:
+                y = max(model, key=lambda y: (model[y], y))
+                if model[y] > max_count:
+                    prediction = y
+                    max_count = model[y]
+        correct.append(prediction == values[i])
+
+    assert Estimators.calculate_lz78y(data) == pytest.approx(
+        prediction_entropy_reference(correct, len(set(values))),
+        rel=1e-6
+    )
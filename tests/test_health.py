@@ -0,0 +1,51 @@
+import asyncio
+import math
+import pytest
+
+from daemon import EntropyPool, PoolCollector
+from extractor import Extractor
+from health import HEALTH_ALPHA, health_cutoffs
+
+
+# SP 800-90B section 4.4.1 and Table 2, alpha = 2^-20 and W = 512
+@pytest.mark.parametrize('min_entropy, rct, apt', [
+    (0.5, 41, 410),
+    (1, 21, 311),
+    (2, 11, 177),
+    (4, 6, 62),
+    (8, 4, 13),
+])
+def test_health_cutoffs_match_spec_table(min_entropy, rct, apt):
+    assert health_cutoffs(min_entropy) == (rct, apt)
+
+
+@pytest.mark.parametrize('min_entropy', [0.3, 1.7, 5.5])
+def test_apt_cutoff_matches_critbinom(min_entropy):
+    window = 512
+    p = 2 ** -min_entropy
+
+    # 1 + CRITBINOM(W, p, 1 - alpha), summing the binomial terms in order
+    cumulative = 0.0
+    for count in range(window + 1):
+        cumulative += math.comb(window, count) * p ** count * (1 - p) ** (window - count)
+        if cumulative >= 1 - HEALTH_ALPHA:
+            break
+
+    assert health_cutoffs(min_entropy).apt == min(1 + count, window)
+
+
+def test_health_cutoffs_reject_non_finite_claims():
+    with pytest.raises(ValueError):
+        health_cutoffs(math.nan)
+
+
+@pytest.mark.parametrize('min_entropy', [math.nan, 0.0])
+def test_pool_collector_fails_without_a_claim(min_entropy):
+    loop = asyncio.new_event_loop()
+    try:
+        pool = EntropyPool(loop)
+        collector = PoolCollector(pool, None, None, Extractor(), min_entropy)
+        collector.run()
+        assert pool.error.startswith('no usable min-entropy claim')
+    finally:
+        loop.close()
@@ -0,0 +1,41 @@
+import numpy as np
+
+from analysis import JitterHistogram, JitterHistogramBatch
+
+
+def counts_of(data):
+    values, counts = np.unique(data, return_counts=True)
+    return values.tolist(), counts.tolist()
+
+
+def test_merge_matches_one_histogram():
+    rng = np.random.default_rng(0)
+    parts = [rng.integers(low, low + 50, 200) for low in (20, 0, 40, 100)]
+
+    merged = JitterHistogram()
+    for part in parts:
+        merged.merge(JitterHistogram(part))
+    merged.merge(JitterHistogram())
+
+    values, counts = counts_of(np.concatenate(parts))
+    assert merged.values.tolist() == values
+    assert merged.counts.tolist() == counts
+    assert merged.total == 800
+
+
+def test_add_counts_of_repeated_values():
+    histogram = JitterHistogram([5, 1, 5])
+    histogram.add_counts(np.array([7, 1, 7, 0]), np.array([1, 2, 3, 4]))
+    assert histogram.values.tolist() == [0, 1, 5, 7]
+    assert histogram.counts.tolist() == [4, 3, 2, 4]
+    assert histogram.total == 13
+
+
+def test_batch_rows_do_not_share_counts():
+    batch = JitterHistogramBatch(np.array([[3, 1, 3], [2, 2, 9]]))
+    row = batch.row(0)
+    row.merge(JitterHistogram([1, 3, 4]))
+
+    assert row.values.tolist() == [1, 3, 4]
+    assert row.counts.tolist() == [2, 3, 1]
+    assert batch.row(0).counts.tolist() == [1, 2]
@@ -0,0 +1,203 @@
+import bz2
+import math
+import numpy as np
+import pytest
+from scipy import stats
+
+import iid
+from iid import (
+    LAGS,
+    STATISTICS,
+    allocate_bins,
+    chi_square_goodness_of_fit,
+    chi_square_independence,
+    longest_repeated_substring,
+    permutation_test,
+    statistics,
+)
+
+
+def statistics_reference(s, median):
+    '''SP 800-90B section 5.1 statistics of one sequence, as written there.'''
+    n = len(s)
+    mean = sum(s) / n
+    result = {}
+
+    total = 0
+    excursion = 0.0
+    for i, x in enumerate(s, start=1):
+        total += x
+        excursion = max(excursion, abs(total - i * mean))
+    result['excursion'] = excursion
+
+    def runs(signs):
+        count, longest, current = 1, 1, 1
+        for a, b in zip(signs, signs[1:]):
+            if a == b:
+                current += 1
+            else:
+                count, current = count + 1, 1
+            longest = max(longest, current)
+        return count, longest
+
+    directions = [1 if b >= a else -1 for a, b in zip(s, s[1:])]
+    result['directional_runs'], result['longest_directional_run'] = runs(directions)
+    increases = directions.count(1)
+    result['increases_decreases'] = max(increases, len(directions) - increases)
+
+    signs = [1 if x >= median else -1 for x in s]
+    result['median_runs'], result['longest_median_run'] = runs(signs)
+
+    lengths = []
+    i = 0
+    while i < n:
+        seen = set()
+        j = i
+        while j < n and s[j] not in seen:
+            seen.add(s[j])
+            j += 1
+        if j == n:
+            break
+        lengths.append(j - i + 1)
+        i = j + 1
+    result['average_collision'] = sum(lengths) / len(lengths)
+    result['maximum_collision'] = max(lengths)
+
+    for lag in LAGS:
+        result[f'periodicity_{lag}'] = sum(
+            s[i] == s[i + lag] for i in range(n - lag)
+        )
+        result[f'covariance_{lag}'] = sum(
+            s[i] * s[i + lag] for i in range(n - lag)
+        )
+
+    text = ' '.join(str(x) for x in s).encode()
+    result['compression'] = len(bz2.compress(text))
+    return [result[name] for name in STATISTICS]
+
+
+@pytest.mark.parametrize('k', [2, 5, 256])
+def test_statistics_match_reference(k):
+    rng = np.random.default_rng(k)
+    symbols = rng.integers(0, k, 400)
+    median = np.median(symbols)
+    rows = np.stack([symbols, rng.permutation(symbols), np.sort(symbols)])
+
+    result = statistics(rows, median)
+    for row, values in zip(rows, result):
+        assert values == pytest.approx(statistics_reference(row.tolist(), median))
+
+
+def test_allocate_bins():
+    # Smallest expected counts are combined until they reach 5
+    bins, n_bins = allocate_bins(np.array([1.0, 2.0, 3.0, 10.0, 4.0]))
+    assert bins.tolist() == [0, 0, 0, 1, 1]
+    assert n_bins == 2
+
+    # A short last bin joins the one before it
+    bins, n_bins = allocate_bins(np.array([3.0, 3.0, 3.0]))
+    assert bins.tolist() == [0, 0, 0]
+    assert n_bins == 1
+
+
+def test_chi_square_independence_matches_reference():
+    rng = np.random.default_rng(1)
+    symbols = rng.integers(0, 3, 2000)
+    n = len(symbols)
+
+    # Every pair expects well over 5, so there is no binning
+    statistic = 0.0
+    for a in range(3):
+        for b in range(3):
+            expected = (
+                np.count_nonzero(symbols == a) / n
+                * np.count_nonzero(symbols == b) / n
+                * (n - 1)
+            )
+            observed = sum(
+                1 for x, y in zip(symbols[:-1], symbols[1:])
+                if x == a and y == b
+            )
+            statistic += (observed - expected) ** 2 / expected
+
+    result = chi_square_independence(symbols, 3)
+    assert result.statistic == pytest.approx(statistic)
+    assert result.degrees_of_freedom == 8
+    assert result.p_value == pytest.approx(stats.chi2.sf(statistic, 8))
+
+
+def test_chi_square_independence_rejects_alternation():
+    symbols = np.arange(2000) % 2
+    assert not chi_square_independence(symbols, 2).passed
+
+
+def test_chi_square_goodness_of_fit_matches_reference():
+    rng = np.random.default_rng(2)
+    symbols = rng.integers(0, 4, 2005)
+    parts = np.array_split(symbols[:2000], 10)
+
+    statistic = 0.0
+    for symbol in range(4):
+        expected = np.count_nonzero(symbols[:2000] == symbol) / 10
+        for part in parts:
+            statistic += (np.count_nonzero(part == symbol) - expected) ** 2 / expected
+
+    result = chi_square_goodness_of_fit(symbols, 4)
+    assert result.statistic == pytest.approx(statistic)
+    assert result.degrees_of_freedom == 27
+
+
+def test_chi_square_goodness_of_fit_rejects_drift():
+    symbols = np.repeat(np.arange(10), 200)
+    assert not chi_square_goodness_of_fit(symbols, 10).passed
+
+
+@pytest.mark.parametrize('seed, k', [(3, 2), (4, 4), (5, 16)])
+def test_longest_repeated_substring_matches_reference(seed, k):
+    rng = np.random.default_rng(seed)
+    symbols = rng.integers(0, k, 300)
+    values = symbols.tolist()
+    n = len(values)
+
+    length = 0
+    while True:
+        seen = set()
+        for i in range(n - length):
+            seen.add(tuple(values[i:i + length + 1]))
+        if len(seen) == n - length:
+            break
+        length += 1
+
+    p_collision = sum((values.count(x) / n) ** 2 for x in set(values))
+    pairs = math.comb(n - length + 1, 2)
+    probability = 1 - (1 - p_collision ** length) ** pairs
+
+    result = longest_repeated_substring(symbols, k)
+    assert result.length == length
+    assert result.probability == pytest.approx(probability)
+
+
+def test_longest_repeated_substring_rejects_repeats():
+    rng = np.random.default_rng(6)
+    block = rng.integers(0, 256, 200)
+    result = longest_repeated_substring(np.concatenate((block, block)), 256)
+    assert result.length == 200
+    assert not result.passed
+
+
+def test_permutation_test(monkeypatch):
+    monkeypatch.setattr(iid, 'PERMUTATIONS', 1000)
+    rng = np.random.default_rng(7)
+
+    random, done = permutation_test(rng.integers(0, 8, 500), workers=1, seed=0)
+    # Passing tests settle before all permutations are done
+    assert done < 1000
+    assert all(test.passed for test in random)
+    assert all(test.greater + test.equal <= done for test in random)
+
+    # A trend shows up in the excursion and directional statistics
+    trend = np.sort(rng.integers(0, 8, 500))
+    results, done = permutation_test(trend, workers=1, seed=0)
+    assert done == 1000
+    failed = {test.name for test in results if not test.passed}
+    assert {'excursion', 'directional_runs', 'median_runs'} <= failed
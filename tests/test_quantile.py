@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from analysis import Analysis, QuantileSketch
+
+
+def nearest_rank(data, q):
+    return np.sort(data)[np.rint(np.asarray(q) * (len(data) - 1)).astype(np.int64)]
+
+
+def test_buckets_by_hand():
+    # Exact below 2^10, then 512 buckets per power of two
+    assert QuantileSketch.buckets([0, 1023, 1024, 2047, 2048]).tolist() == [
+        0, 1023, 1024, 1535, 1536
+    ]
+    # 2048..2051 share a bucket 4 wide
+    assert QuantileSketch.buckets([2051, 2052]).tolist() == [1536, 1537]
+    assert QuantileSketch.bucket_values([1023, 1536]).tolist() == [1023.0, 2050.0]
+
+
+def test_buckets_bound_the_relative_error():
+    rng = np.random.default_rng(0)
+    values = np.concatenate((
+        rng.integers(0, 1 << 63, 10000, dtype=np.uint64) >> rng.integers(0, 63, 10000).astype(np.uint64),
+        np.array([2 ** 53 - 1, 2 ** 53, 2 ** 53 + 1, 2 ** 64 - 1], dtype=np.uint64),
+    ))
+    values.sort()
+
+    index = QuantileSketch.buckets(values)
+    assert np.all(np.diff(index) >= 0)
+    assert index.max() < len(QuantileSketch().counts)
+
+    approximate = QuantileSketch.bucket_values(index)
+    exact = values.astype(np.float64)
+    assert np.all(np.abs(approximate - exact) <= exact * 2.0 ** -10)
+
+
+def test_small_values_are_exact():
+    rng = np.random.default_rng(1)
+    data = rng.integers(0, 1000, 5001)
+    q = np.linspace(0, 1, 101)
+    assert QuantileSketch(data).quantile(q).tolist() == nearest_rank(data, q).tolist()
+
+
+def test_large_values_within_resolution():
+    rng = np.random.default_rng(2)
+    data = rng.lognormal(12, 2, 20001).astype(np.uint64)
+    q = np.linspace(0, 1, 101)
+
+    exact = nearest_rank(data, q).astype(np.float64)
+    assert QuantileSketch(data).quantile(q) == pytest.approx(exact, rel=2.0 ** -10)
+
+
+def test_merge_matches_one_sketch():
+    rng = np.random.default_rng(3)
+    parts = [rng.integers(0, 1 << 40, 1000, dtype=np.uint64) for _ in range(3)]
+
+    merged = QuantileSketch()
+    for part in parts:
+        merged.merge(QuantileSketch(part))
+    merged.merge(QuantileSketch())
+
+    whole = QuantileSketch(np.concatenate(parts))
+    assert np.array_equal(merged.counts, whole.counts)
+    assert (merged.total, merged.minimum, merged.maximum) == (
+        whole.total, whole.minimum, whole.maximum
+    )
+
+
+def test_remove_outliers_iqr():
+    data = np.concatenate((np.arange(100, 200), [0, 1000]))
+    kept = Analysis.remove_outliers_iqr(data)
+
+    q1, q3 = nearest_rank(data, [0.25, 0.75])
+    iqr = q3 - q1
+    expected = data[(data >= q1 - 1.5 * iqr) & (data <= q3 + 1.5 * iqr)]
+    assert kept.tolist() == expected.tolist()
+    assert 1000 not in kept.tolist()
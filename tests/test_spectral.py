@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from scipy import signal
+
+from spectral import autocorrelation, dominant_period, welch
+
+
+def autocorrelation_reference(x, max_lag):
+    x = np.asarray(x, dtype=np.float64) - np.mean(x)
+    n = len(x)
+    sums = [np.sum(x[:n - lag] * x[lag:]) for lag in range(max_lag + 1)]
+    return np.array(sums) / sums[0]
+
+
+@pytest.mark.parametrize('chunk_size', [7, 64, 1 << 20])
+def test_autocorrelation_matches_direct_sums(chunk_size):
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 100, 500).astype(np.uint64)
+    data[::10] += 300
+
+    assert autocorrelation(data, 40, chunk_size) == pytest.approx(
+        autocorrelation_reference(data, 40)
+    )
+
+
+def test_autocorrelation_short_and_constant():
+    assert len(autocorrelation(np.array([5]))) == 0
+    assert autocorrelation(np.full(10, 3), 4).tolist() == [0.0] * 5
+    assert autocorrelation(np.array([1, 2, 3]), 10).tolist() == pytest.approx(
+        [1.0, 0.0, -0.5]
+    )
+
+
+@pytest.mark.parametrize('chunk_size', [40, 1 << 20])
+def test_welch_matches_scipy(chunk_size):
+    rng = np.random.default_rng(1)
+    data = rng.normal(size=1000) + np.sin(np.arange(1000) * 0.7)
+
+    spectrum = welch(data, segment=64, overlap=0.5, chunk_size=chunk_size)
+    frequencies, power = signal.welch(
+        data,
+        window=np.hanning(64),
+        nperseg=64,
+        noverlap=32,
+        detrend='constant'
+    )
+    assert spectrum.segments == (1000 - 64) // 32 + 1
+    assert spectrum.frequencies == pytest.approx(frequencies)
+    assert spectrum.power == pytest.approx(power)
+
+
+def test_welch_needs_three_samples():
+    assert welch(np.array([1, 2])).segments == 0
+    assert welch(np.array([1, 2, 3])).segments == 1
+
+
+def test_dominant_period_of_spike_train():
+    # Spikes every 25 samples put power in every harmonic of 1/25
+    rng = np.random.default_rng(2)
+    data = rng.integers(0, 10, 20000).astype(np.float64)
+    data[::25] += 100
+
+    periodicity = dominant_period(data)
+    assert periodicity.period == pytest.approx(25)
+    assert periodicity.significant
+
+    assert not dominant_period(rng.normal(size=20000)).significant